@@ -0,0 +1,84 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message
+
+logger = logging.getLogger(__name__)
+
+# Больше 10 элементов Telegram в один альбом не принимает (и не присылает)
+MEDIA_GROUP_LIMIT = 10
+
+
+def album_photos(message: Message, album: list[Message] | None) -> list[str]:
+    # """file_id фото сообщения или всего альбома по порядку (самый большой размер)."""
+    messages = album or [message]
+    return [m.photo[-1].file_id for m in messages if m.photo]
+
+
+def album_caption(message: Message, album: list[Message] | None) -> str | None:
+    # """Текст сообщения; у альбома подпись бывает только у одной части — ищем её."""
+    for m in album or [message]:
+        if m.text or m.caption:
+            return m.text or m.caption
+    return None
+
+
+class MediaGroupMiddleware(BaseMiddleware):
+    # """
+    # Outer-middleware на dp.message: собирает альбом в одно событие.
+
+    # Telegram присылает альбом отдельными апдейтами с общим media_group_id.
+    # Первая часть ждёт, пока window секунд не придёт новых, и идёт в хэндлеры
+    # уже с data["album"] — всеми частями по порядку; остальные части
+    # дальше не идут. В хэндлер попадает часть с подписью (на ней команда
+    # /add или текст хотелки), иначе первая.
+    # """
+
+    def __init__(self, window: float = 0.6):
+        self.window = window
+        self._groups: dict[tuple[int, str], list[Message]] = {}
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, dict[str, Any]], Awaitable[Any]],
+        event: Message,
+        data: dict[str, Any],
+    ) -> Any:
+        if not event.media_group_id:
+            return await handler(event, data)
+
+        # метрика времени апдейта (metrics.py) не должна считать ожидание альбома
+        timing = data.get("update_timing")
+        key = (event.chat.id, event.media_group_id)
+        parts = self._groups.get(key)
+        if parts is not None:
+            parts.append(event)
+            if timing is not None:
+                timing["handler"] = "album_part"
+            return None
+
+        parts = self._groups[key] = [event]
+        started = time.perf_counter()
+        try:
+            # ждём, пока части перестанут приходить
+            seen = 0
+            while seen != len(parts):
+                seen = len(parts)
+                await asyncio.sleep(self.window)
+        finally:
+            del self._groups[key]
+            if timing is not None:
+                timing["waited"] = time.perf_counter() - started
+
+        album = sorted(parts, key=lambda m: m.message_id)[:MEDIA_GROUP_LIMIT]
+        lead = next((m for m in album if m.caption), album[0])
+        if len(parts) > MEDIA_GROUP_LIMIT:
+            logger.warning(
+                "Альбом больше лимита, лишние части отброшены",
+                extra={"chat_id": event.chat.id, "parts": len(parts)},
+            )
+        data["album"] = album
+        return await handler(lead, data)
@@ -0,0 +1,160 @@
+import asyncio
+import hashlib
+import logging
+import os
+import secrets
+from pathlib import Path
+
+import aiofiles
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import FSInputFile, Message
+
+from db import (
+    list_photos_to_archive,
+    mark_photo_archived,
+    mark_photo_archive_failed,
+    get_photo_hashes,
+    replace_photo_file_id,
+)
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+
+def is_file_id_error(error: Exception) -> bool:
+    # """Telegram не принял file_id (устарел, другой токен бота и т.п.)."""
+    return isinstance(error, TelegramBadRequest) and "file" in error.message.lower()
+
+
+class MediaArchive:
+    # """
+    # Локальный архив фото напоминаний и хотелок, адресованный по содержимому.
+
+    # Очередь — строки photo_archive без sha256 (их ставят триггеры на каждое
+    # новое фото). Воркер раз в idle_interval забирает пачку и скачивает фото
+    # через bot.download — aiogram пишет его на диск потоком через aiofiles,
+    # не держа файл в памяти; не больше workers загрузок одновременно.
+    # Файл кладётся в directory/ab/cd/<sha256>: одинаковые картинки под
+    # разными file_id хранятся один раз. Если Telegram перестал принимать
+    # file_id, outbox загружает фото заново из архива (input_files()).
+    # """
+
+    def __init__(
+        self,
+        bot: Bot,
+        directory: str,
+        workers: int = 4,
+        batch_size: int = 50,
+        max_attempts: int = 5,
+        retry_delay: float = 600,
+        idle_interval: float = 60,
+    ):
+        self.bot = bot
+        self.directory = Path(directory)
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.idle_interval = idle_interval
+        self._semaphore = asyncio.Semaphore(workers)
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run(), name="media-archive")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    def wake(self) -> None:
+        self._wakeup.set()
+
+    def path_for(self, sha256: str) -> Path:
+        return self.directory / sha256[:2] / sha256[2:4] / sha256
+
+    async def input_files(self, file_ids: list[str]) -> dict[str, FSInputFile]:
+        # """Архивные копии для этих file_id — чтобы отправить фото заново файлом."""
+        hashes = await get_photo_hashes(file_ids)
+        files = {}
+        for file_id, sha256 in hashes.items():
+            path = self.path_for(sha256)
+            if path.exists():
+                files[file_id] = FSInputFile(path, filename=f"{sha256[:16]}.jpg")
+        return files
+
+    async def remember_upload(self, old_file_id: str, message: Message) -> None:
+        # """После повторной загрузки у фото новый file_id — сохраняем его вместо старого."""
+        if message.photo:
+            await replace_photo_file_id(old_file_id, message.photo[-1].file_id)
+
+    async def archive_once(self) -> int:
+        # """Скачивает одну пачку фото. Возвращает её размер."""
+        batch = await list_photos_to_archive(self.batch_size)
+        if batch:
+            await asyncio.gather(*(self._archive(*row) for row in batch))
+        return len(batch)
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                processed = await self.archive_once()
+            except Exception:
+                logger.exception("Ошибка при архивировании фото")
+                processed = 0
+
+            if processed:
+                continue
+            timer = asyncio.get_running_loop().call_later(self.idle_interval, self._wakeup.set)
+            try:
+                await self._wakeup.wait()
+            finally:
+                timer.cancel()
+
+    async def _archive(self, file_id: str, attempts: int) -> None:
+        async with self._semaphore:
+            tmp_dir = self.directory / "tmp"
+            tmp_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = tmp_dir / f"{secrets.token_hex(8)}.part"
+            try:
+                await self.bot.download(file_id, destination=tmp_path, chunk_size=CHUNK_SIZE)
+                sha256, size = await self._hash(tmp_path)
+                path = self.path_for(sha256)
+                duplicate = path.exists()
+                if not duplicate:
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    os.replace(tmp_path, path)
+                await mark_photo_archived(file_id, sha256, size)
+            except Exception as e:
+                # file_id, который Telegram не знает, — повтор не поможет
+                give_up = is_file_id_error(e) or attempts + 1 >= self.max_attempts
+                retry_in = None if give_up else self.retry_delay * 2 ** attempts
+                metrics.inc("bot_media_archived_total", result="failed")
+                logger.warning(
+                    "Не удалось скачать фото в архив",
+                    extra={"file_id": file_id, "attempts": attempts + 1,
+                           "retry_in": retry_in, "error": str(e)},
+                )
+                await mark_photo_archive_failed(file_id, str(e), retry_in)
+                return
+            finally:
+                tmp_path.unlink(missing_ok=True)
+
+        metrics.inc("bot_media_archived_total", result="duplicate" if duplicate else "new")
+        if not duplicate:
+            metrics.inc("bot_media_archive_bytes_total", size)
+
+    async def _hash(self, path: Path) -> tuple[str, int]:
+        digest = hashlib.sha256()
+        size = 0
+        async with aiofiles.open(path, "rb") as f:
+            while chunk := await f.read(CHUNK_SIZE):
+                digest.update(chunk)
+                size += len(chunk)
+        return digest.hexdigest(), size
@@ -0,0 +1,174 @@
+import asyncio
+import gzip
+import logging
+import shutil
+import sqlite3
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import NamedTuple
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Имя снимка: bot-20261018-110000-123.db.gz — сортировка по имени = по времени
+_PREFIX = "bot-"
+_SUFFIX = ".db.gz"
+
+
+class Snapshot(NamedTuple):
+    path: Path
+    size: int
+    pages: int
+    duration: float
+
+
+def _make_snapshot(src_path: str, tmp_path: Path, step_pages: int, step_sleep: float) -> int:
+    # """
+    # Копия БД через SQLite online backup API (выполняется в отдельном потоке).
+
+    # Своё соединение держит открытую читающую транзакцию — в WAL это
+    # фиксирует снимок, поэтому записи бота идут своим чередом и не заставляют
+    # копирование начинаться заново. Копируем по step_pages страниц с паузой
+    # step_sleep между шагами, чтобы не забирать весь диск.
+    # Возвращает число скопированных страниц.
+    # """
+    pages = 0
+
+    def progress(status: int, remaining: int, total: int) -> None:
+        nonlocal pages
+        pages = total
+        # sleep= у backup() спит только при BUSY/LOCKED, паузу между шагами делаем сами
+        if remaining and step_sleep > 0:
+            time.sleep(step_sleep)
+
+    src = sqlite3.connect(src_path)
+    dst = sqlite3.connect(tmp_path)
+    try:
+        src.execute("BEGIN")
+        src.execute("SELECT 1 FROM sqlite_master LIMIT 1")
+        src.backup(dst, pages=step_pages, progress=progress, sleep=step_sleep)
+        src.rollback()
+
+        result = dst.execute("PRAGMA integrity_check").fetchone()[0]
+        if result != "ok":
+            raise RuntimeError(f"снимок не прошёл integrity_check: {result}")
+    finally:
+        dst.close()
+        src.close()
+    return pages
+
+
+def _compress(src: Path, dst: Path) -> None:
+    with open(src, "rb") as fin, gzip.open(dst, "wb", compresslevel=6) as fout:
+        shutil.copyfileobj(fin, fout, 1024 * 1024)
+
+
+class BackupWorker:
+    # """
+    # Резервные копии bot.db без остановки бота.
+
+    # Раз в interval снимает копию (online backup API, по шагам, в потоке —
+    # цикл событий не блокируется), проверяет её integrity_check, сжимает gzip
+    # и оставляет keep последних снимков. Первый запуск после старта — когда
+    # с последнего снимка прошёл interval (если снимков нет — почти сразу).
+    # """
+
+    def __init__(
+        self,
+        db_path: str,
+        directory: str,
+        interval: float,
+        keep: int = 7,
+        step_pages: int = 256,
+        step_sleep: float = 0.005,
+    ):
+        self.db_path = db_path
+        self.directory = Path(directory)
+        self.interval = interval
+        self.keep = keep
+        self.step_pages = step_pages
+        self.step_sleep = step_sleep
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self.interval > 0:
+            self._task = asyncio.create_task(self._run(), name="backup")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    def snapshots(self) -> list[Path]:
+        # """Снимки от старых к новым."""
+        if not self.directory.is_dir():
+            return []
+        return sorted(
+            p for p in self.directory.iterdir()
+            if p.name.startswith(_PREFIX) and p.name.endswith(_SUFFIX)
+        )
+
+    def latest(self) -> Path | None:
+        snapshots = self.snapshots()
+        return snapshots[-1] if snapshots else None
+
+    def age(self) -> float:
+        # """Возраст последнего снимка в секундах (для gauge), -1 — снимков нет."""
+        latest = self.latest()
+        return time.time() - latest.stat().st_mtime if latest else -1.0
+
+    async def backup(self) -> Snapshot:
+        # """Снимает, проверяет, сжимает и ротирует один снимок. Параллельно — только один."""
+        async with self._lock:
+            started = time.perf_counter()
+            self.directory.mkdir(parents=True, exist_ok=True)
+            now = datetime.now()
+            name = f"{_PREFIX}{now:%Y%m%d-%H%M%S}-{now.microsecond // 1000:03d}"
+            tmp_path = self.directory / f".{name}.db"
+            path = self.directory / f"{name}{_SUFFIX}"
+            try:
+                pages = await asyncio.to_thread(
+                    _make_snapshot, self.db_path, tmp_path, self.step_pages, self.step_sleep
+                )
+                await asyncio.to_thread(_compress, tmp_path, path)
+            except BaseException:
+                path.unlink(missing_ok=True)
+                raise
+            finally:
+                tmp_path.unlink(missing_ok=True)
+
+            removed = self._rotate()
+            snapshot = Snapshot(path, path.stat().st_size, pages, time.perf_counter() - started)
+
+        metrics.observe("bot_job_duration_seconds", snapshot.duration, job="backup")
+        logger.info(
+            "Резервная копия готова",
+            extra={"path": str(path), "size": snapshot.size, "pages": pages,
+                   "removed": removed, "duration_ms": round(snapshot.duration * 1000, 1)},
+        )
+        return snapshot
+
+    def _rotate(self) -> int:
+        old = self.snapshots()[:-self.keep] if self.keep > 0 else []
+        for path in old:
+            path.unlink(missing_ok=True)
+        return len(old)
+
+    async def _run(self) -> None:
+        while True:
+            latest = self.latest()
+            age = time.time() - latest.stat().st_mtime if latest else self.interval
+            # без снимков — не сразу на старте, а через минуту, чтобы не мешать запуску
+            delay = max(self.interval - age, 0 if latest else 60)
+            await asyncio.sleep(delay)
+            try:
+                await self.backup()
+            except Exception:
+                logger.exception("Не удалось сделать резервную копию")
+                # следующая попытка — через час, а не через полный интервал
+                await asyncio.sleep(min(self.interval, 3600))
@@ -0,0 +1,241 @@
+# """
+# Бенчмарк хэндлеров: гоняет синтетические апдейты через настоящий Dispatcher.
+#
+# Бот работает с заглушкой сессии — запросы к Bot API не уходят в сеть,
+# а просто записываются. БД — временный файл, схема создаётся init_db().
+#
+# Запуск из корня репозитория:
+#     python bench/bench_dispatcher.py --rounds 2000
+# """
+import argparse
+import asyncio
+import itertools
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+ADMIN_ID = 1
+GIRL_ID = 1001
+STRANGER_ID = 5005
+
+# config.py читает окружение при импорте — задаём до импорта хэндлеров
+os.environ.setdefault("BOT_TOKEN", "42:BENCHMARK")
+os.environ["ADMIN_ID"] = str(ADMIN_ID)
+
+from aiogram import Bot, Dispatcher  # noqa: E402
+from aiogram.client.session.base import BaseSession  # noqa: E402
+from aiogram.methods import GetMe, SendMediaGroup, TelegramMethod  # noqa: E402
+from aiogram.types import Message, Update, User  # noqa: E402
+
+import db  # noqa: E402
+from digest import WishDigest  # noqa: E402
+from fsm_storage import create_storage  # noqa: E402
+from handlers import register_handlers  # noqa: E402
+from keyboards import GIRL_BTN_WANT  # noqa: E402
+from metrics import ApiMetricsMiddleware, setup_update_metrics  # noqa: E402
+from outbox import OutboxWorker  # noqa: E402
+from sender import SendQueue  # noqa: E402
+
+
+class RecordingSession(BaseSession):
+    # """Сессия-заглушка: записывает вызовы Bot API и отвечает правдоподобными объектами."""
+
+    def __init__(self):
+        super().__init__()
+        self.calls: list[TelegramMethod] = []
+        self._message_ids = itertools.count(1)
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls.append(method)
+        if isinstance(method, GetMe):
+            return User(id=42, is_bot=True, first_name="bench", username="bench_bot")
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            return True
+        if isinstance(method, SendMediaGroup):
+            return [self._message(bot, chat_id) for _ in method.media]
+        if type(method).__name__.startswith("Send"):
+            return self._message(bot, chat_id)
+        return True
+
+    def _message(self, bot, chat_id):
+        return Message.model_validate(
+            {
+                "message_id": next(self._message_ids),
+                "date": 0,
+                "chat": {"id": chat_id, "type": "private"},
+            },
+            context={"bot": bot},
+        )
+
+    async def close(self):
+        pass
+
+    async def stream_content(self, *args, **kwargs):
+        yield b""
+
+
+class UpdateFactory:
+    # """Собирает синтетические апдейты (сообщения от админа, девушки, посторонних)."""
+
+    def __init__(self):
+        self._ids = itertools.count(1)
+
+    def message(self, user_id: int, text: str | None = None, photo: str | None = None) -> Update:
+        data = {
+            "message_id": next(self._ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "bench"},
+        }
+        if photo:
+            data["photo"] = [
+                {"file_id": photo, "file_unique_id": photo, "width": 1280, "height": 720}
+            ]
+            if text:
+                data["caption"] = text
+        elif text is not None:
+            data["text"] = text
+            if text.startswith("/"):
+                command = text.split()[0]
+                data["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+        return Update.model_validate({"update_id": next(self._ids), "message": data})
+
+
+def scenarios(factory: UpdateFactory):
+    # """Набор сценариев одного раунда: (имя, апдейт)."""
+    return [
+        ("admin /add", factory.message(ADMIN_ID, "/add ты самая лучшая на свете 💖")),
+        ("admin /list", factory.message(ADMIN_ID, "/list")),
+        ("admin /wishes", factory.message(ADMIN_ID, "/wishes")),
+        ("girl 'Хочу'", factory.message(GIRL_ID, GIRL_BTN_WANT)),
+        ("girl wish+photo", factory.message(GIRL_ID, "вот это хочу", photo="AgACAgIAAxkBAAIB")),
+        ("girl chatter", factory.message(GIRL_ID, "просто сообщение")),
+        ("stranger", factory.message(STRANGER_ID, "привет")),
+    ]
+
+
+def percentile(values: list[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+async def run(rounds: int, db_path: str, storage_kind: str, digest_window: float) -> None:
+    await db.init_db(db_path)
+    await db.open_db(db_path)
+    await db.load_app_state()
+    await db.load_pairs()
+    await db.migrate_legacy_pair(ADMIN_ID)
+    pair = await db.get_or_create_pair(ADMIN_ID)
+    await db.set_recipient(pair, GIRL_ID)
+
+    session = RecordingSession()
+    bot = Bot(token=os.environ["BOT_TOKEN"], session=session)
+    dp = Dispatcher(storage=await create_storage(storage_kind))
+
+    # лимиты не мешают замеру: хэндлеры не ждут отправки
+    send_queue = SendQueue(bot, global_rate=1e9, per_chat_rate=1e9)
+    send_queue.start()
+    dp["send_queue"] = send_queue
+    wish_digest = WishDigest(send_queue, window=digest_window)
+    dp["wish_digest"] = wish_digest
+    outbox = OutboxWorker(send_queue)
+    dp["outbox"] = outbox
+    register_handlers(dp)
+    # замеряем с той же инструментацией, что и в проде
+    setup_update_metrics(dp)
+    bot.session.middleware(ApiMetricsMiddleware())
+
+    # считаем SQL-выражения верхнего уровня — вызовы execute* из db.py
+    # (executemany — одно выражение), без служебных BEGIN/COMMIT.
+    # set_trace_callback тут не годится: он показывает и шаги триггеров
+    # и FTS5 (повторяя текст исходного INSERT), и число выходит завышенным.
+    queries = 0
+    conn = db._db()
+
+    def counted(method):
+        def wrapper(sql, *args, **kwargs):
+            nonlocal queries
+            if not sql.lstrip().upper().startswith(("BEGIN", "COMMIT", "ROLLBACK")):
+                queries += 1
+            return method(sql, *args, **kwargs)
+        return wrapper
+
+    for name in ("execute", "executemany", "execute_fetchall", "execute_insert"):
+        setattr(conn, name, counted(getattr(conn, name)))
+
+    factory = UpdateFactory()
+    latencies: dict[str, list[float]] = defaultdict(list)
+    query_counts: dict[str, int] = defaultdict(int)
+    api_counts: dict[str, int] = defaultdict(int)
+
+    # прогрев
+    for _, update in scenarios(factory):
+        await dp.feed_update(bot, update)
+
+    total_started = time.perf_counter()
+    for _ in range(rounds):
+        for name, update in scenarios(factory):
+            queries_before = queries
+            calls_before = len(session.calls)
+            started = time.perf_counter()
+            await dp.feed_update(bot, update)
+            latencies[name].append(time.perf_counter() - started)
+            query_counts[name] += queries - queries_before
+            # сюда же попадают отправки из очереди, успевшие уйти за время апдейта
+            api_counts[name] += len(session.calls) - calls_before
+    total_elapsed = time.perf_counter() - total_started
+
+    wish_digest.stop()
+    await send_queue.stop(timeout=1)
+    await db.close_db()
+
+    all_latencies = [x for values in latencies.values() for x in values]
+    total_updates = len(all_latencies)
+
+    print(f"Апдейтов: {total_updates}, время: {total_elapsed:.2f} с, "
+          f"{total_updates / total_elapsed:.0f} апдейтов/с")
+    print(f"Задержка, мс: p50={percentile(all_latencies, 0.50) * 1000:.3f} "
+          f"p95={percentile(all_latencies, 0.95) * 1000:.3f} "
+          f"p99={percentile(all_latencies, 0.99) * 1000:.3f}")
+    print(f"SQL-запросов на апдейт: {sum(query_counts.values()) / total_updates:.2f}")
+    print()
+    print("SQL/апд — выражения, которые выполнил код бота (без BEGIN/COMMIT и шагов триггеров),")
+    print("API/апд — запросы к Bot API")
+    print(f"{'сценарий':<18}{'p50 мс':>9}{'p95 мс':>9}{'p99 мс':>9}{'SQL/апд':>9}{'API/апд':>9}")
+    for name, values in latencies.items():
+        print(
+            f"{name:<18}"
+            f"{percentile(values, 0.50) * 1000:>9.3f}"
+            f"{percentile(values, 0.95) * 1000:>9.3f}"
+            f"{percentile(values, 0.99) * 1000:>9.3f}"
+            f"{query_counts[name] / len(values):>9.2f}"
+            f"{api_counts[name] / len(values):>9.2f}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк хэндлеров бота")
+    parser.add_argument("--rounds", type=int, default=1000,
+                        help="сколько раз прогнать набор сценариев")
+    parser.add_argument("--db", default=None,
+                        help="файл БД (по умолчанию — временный)")
+    parser.add_argument("--storage", choices=("sqlite", "memory"), default="sqlite",
+                        help="хранилище состояний FSM")
+    parser.add_argument("--digest-window", type=float, default=0,
+                        help="окно сводки хотелок, с (0 — каждая сразу)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = args.db or os.path.join(tmp, "bench.db")
+        asyncio.run(run(args.rounds, db_path, args.storage, args.digest_window))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+# """
+# Бенчмарк холодного старта: время от запуска процесса до первого обработанного апдейта.
+#
+# Родительский процесс готовит временную БД (пары с получателями, которым ещё
+# не отправляли уведомление о хотелках) и запускает дочерний процесс, который
+# выполняет настоящий main.main() с сессией-заглушкой: каждый запрос к Bot API
+# "идёт" --rtt секунд, а первый getUpdates отдаёт /whoami. Как только бот
+# ответил на него, дочерний процесс печатает замеры и выходит.
+#
+# Запуск из корня репозитория:
+#     python bench/bench_startup.py --runs 5 --recipients 200 --rtt 0.05
+# """
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+ADMIN_ID = 1
+USER_ID = 999
+
+
+async def seed(recipients: int) -> None:
+    # пары с получателями — им при старте уйдёт уведомление о новой функции
+    sys.path.insert(0, str(ROOT))
+    import db
+
+    await db.init_db()
+    await db.load_app_state()
+    await db.load_pairs()
+    await db.migrate_legacy_pair(ADMIN_ID)
+    for i in range(recipients):
+        pair = await db.get_or_create_pair(1_000_000 + i)
+        await db.set_recipient(pair, 2_000_000 + i)
+    await db.close_db()
+
+
+def child(rtt: float) -> None:
+    # """Выполняется в дочернем процессе: настоящий main() до первого ответа."""
+    sys.path.insert(0, str(ROOT))
+    import main  # noqa: E402 — сам отмечает начало замера до тяжёлых импортов
+
+    from aiogram.client.session.base import BaseSession
+    from aiogram.methods import GetMe, GetUpdates, SendMessage
+    from aiogram.types import Message, Update, User
+
+    from metrics import metrics
+
+    answered = asyncio.Event()
+
+    class SlowSession(BaseSession):
+        # """Заглушка Bot API: каждый запрос занимает rtt, первый getUpdates — /whoami."""
+
+        def __init__(self):
+            super().__init__()
+            self._updates_sent = False
+
+        async def make_request(self, bot, method, timeout=None):
+            await asyncio.sleep(rtt)
+            if isinstance(method, GetMe):
+                return User(id=42, is_bot=True, first_name="bench", username="bench_bot")
+            if isinstance(method, GetUpdates):
+                if self._updates_sent:
+                    await asyncio.Event().wait()
+                self._updates_sent = True
+                return [Update.model_validate({
+                    "update_id": 1,
+                    "message": {
+                        "message_id": 1,
+                        "date": int(time.time()),
+                        "chat": {"id": USER_ID, "type": "private"},
+                        "from": {"id": USER_ID, "is_bot": False, "first_name": "bench"},
+                        "text": "/whoami",
+                        "entities": [{"type": "bot_command", "offset": 0, "length": 7}],
+                    },
+                })]
+            if isinstance(method, SendMessage) and method.chat_id == USER_ID:
+                answered.set()
+            if type(method).__name__.startswith("Send"):
+                return Message.model_validate(
+                    {"message_id": 1, "date": 0, "chat": {"id": method.chat_id, "type": "private"}},
+                    context={"bot": bot},
+                )
+            return True
+
+        async def close(self):
+            pass
+
+        async def stream_content(self, *args, **kwargs):
+            yield b""
+
+    async def run() -> None:
+        bot_task = asyncio.create_task(main.main(session=SlowSession()))
+        await answered.wait()
+        first_reply = time.perf_counter() - main._STARTED
+        # даём FirstUpdateMiddleware дописать свою фазу
+        await asyncio.sleep(0.05)
+        phases = {
+            labels[0][1]: round(h.sum * 1000, 1)
+            for labels, h in metrics.histograms.get("bot_startup_phase_seconds", {}).items()
+        }
+        print(json.dumps({"first_reply_ms": round(first_reply * 1000, 1), "phases_ms": phases}))
+        sys.stdout.flush()
+        bot_task.cancel()
+        os._exit(0)
+
+    asyncio.run(run())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк времени до первого апдейта")
+    parser.add_argument("--runs", type=int, default=5, help="сколько раз запустить бота")
+    parser.add_argument("--recipients", type=int, default=200,
+                        help="пар, которым при старте уходит уведомление")
+    parser.add_argument("--rtt", type=float, default=0.05,
+                        help="задержка одного запроса к Bot API, с")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return child(args.rtt)
+
+    env = {**os.environ, "BOT_TOKEN": "42:BENCHMARK", "ADMIN_ID": str(ADMIN_ID),
+           "LOG_LEVEL": "WARNING", "BOT_MODE": "polling", "METRICS_PORT": "0"}
+    os.environ.update(env)
+
+    results = []
+    for _ in range(args.runs):
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            asyncio.run(seed(args.recipients))
+            started = time.perf_counter()
+            out = subprocess.run(
+                [sys.executable, str(Path(__file__).resolve()), "--child", "--rtt", str(args.rtt)],
+                cwd=tmp, env=env, capture_output=True, text=True, timeout=120,
+            )
+            wall = time.perf_counter() - started
+            os.chdir(ROOT)
+        if out.returncode != 0 or not out.stdout.strip():
+            print(out.stderr, file=sys.stderr)
+            raise SystemExit("дочерний процесс упал")
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        result["wall_ms"] = round(wall * 1000, 1)
+        results.append(result)
+        print(json.dumps(result, ensure_ascii=False))
+
+    def median(key: str) -> float:
+        values = sorted(r[key] for r in results)
+        return values[len(values) // 2]
+
+    print()
+    print(f"Запусков: {len(results)}, получателей: {args.recipients}, rtt: {args.rtt * 1000:.0f} мс")
+    print(f"До ответа на первый апдейт (от начала main.py): медиана {median('first_reply_ms'):.1f} мс")
+    print(f"Вместе с запуском интерпретатора: медиана {median('wall_ms'):.1f} мс")
+
+
+if __name__ == "__main__":
+    main()
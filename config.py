@@ -1,5 +1,6 @@
 from dotenv import load_dotenv
 import os
+import socket
 
 # Загружаем переменные окружения из файла .env
 load_dotenv()
@@ -8,4 +9,99 @@ load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 
 # ID администратора , тоже берем из .env
-ADMIN_ID = int(os.getenv("ADMIN_ID", "0"))
\ No newline at end of file
+ADMIN_ID = int(os.getenv("ADMIN_ID", "0"))
+
+# Все админы (ADMIN_ID + ADMIN_IDS через запятую) — у каждого своя пара
+ADMIN_IDS = {ADMIN_ID} | {
+    int(x) for x in os.getenv("ADMIN_IDS", "").split(",") if x.strip()
+}
+ADMIN_IDS.discard(0)
+
+# Сколько доставок из outbox отправляется параллельно (размер пачки воркера)
+FANOUT_CONCURRENCY = int(os.getenv("FANOUT_CONCURRENCY", "50"))
+
+# Сколько пар ставится в outbox одной транзакцией при ежедневной рассылке
+FANOUT_BATCH_SIZE = int(os.getenv("FANOUT_BATCH_SIZE", "500"))
+
+# Режим получения апдейтов: "polling" (по умолчанию) или "webhook"
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+
+# Публичный адрес для вебхука (https://bot.example.com). Если пусто —
+# сервер всё равно поднимется, но setWebhook не вызывается (удобно для локальных тестов)
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")
+
+# Путь, на который Telegram шлёт апдейты
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+
+# Секрет, который Telegram кладёт в заголовок X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or None
+
+# Где слушает встроенный aiohttp-сервер
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+WEBAPP_PORT = int(os.getenv("WEBAPP_PORT", "8080"))
+
+# Порт для GET /metrics в режиме polling (0 — не поднимать).
+# В режиме webhook /metrics отдаёт тот же сервер, что принимает апдейты
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# Расписание по умолчанию для новой пары: каждый день в DAILY_REMINDER_HOUR:00
+# по SCHEDULE_TZ (дальше админ меняет его командами /schedule_*)
+DAILY_REMINDER_HOUR = int(os.getenv("DAILY_REMINDER_HOUR", "11"))
+SCHEDULE_TZ = os.getenv("SCHEDULE_TZ", "Europe/Helsinki")
+
+# Если бот был выключен в момент рассылки, после старта он догонит её,
+# но только если с плановой минуты прошло не больше этого (мин)
+CATCHUP_GRACE_MINUTES = int(os.getenv("CATCHUP_GRACE_MINUTES", "360"))
+
+# Очередь исходящих сообщений: лимиты Telegram (~30 сообщений/с на бота,
+# ~1 сообщение/с в один чат) и число параллельных отправок
+SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", "30"))
+SEND_PER_CHAT_RATE = float(os.getenv("SEND_PER_CHAT_RATE", "1"))
+SEND_WORKERS = int(os.getenv("SEND_WORKERS", "10"))
+
+# Где хранить состояния FSM (например, "ждём хотелку"): sqlite — в bot.db,
+# переживают рестарт; memory — только в памяти процесса
+FSM_STORAGE = os.getenv("FSM_STORAGE", "sqlite").lower()
+
+# Резервные копии bot.db: каталог, как часто (ч, 0 — не делать по расписанию),
+# сколько последних снимков хранить и сколько страниц копировать за шаг
+BACKUP_DIR = os.getenv("BACKUP_DIR", "backups")
+BACKUP_INTERVAL_HOURS = float(os.getenv("BACKUP_INTERVAL_HOURS", "24"))
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "7"))
+BACKUP_STEP_PAGES = int(os.getenv("BACKUP_STEP_PAGES", "256"))
+
+# Несколько процессов бота на одной bot.db (реплики за вебхуком): кэши пар,
+# app_state и FSM выключаются — каждый процесс читает актуальное из БД,
+# а расписание перечитывается из БД раз в минуту
+MULTI_INSTANCE = os.getenv("MULTI_INSTANCE", "0") == "1"
+
+# Плановые задачи (расписания, /add_at, outbox, резервные копии) выполняет
+# только ведущий процесс — тот, кто держит аренду в bot.db. Аренда живёт
+# LEADER_LEASE_SECONDS и продлевается каждую треть срока; INSTANCE_ID —
+# имя процесса в /leader (по умолчанию хост и pid)
+LEADER_LEASE_SECONDS = float(os.getenv("LEADER_LEASE_SECONDS", "15"))
+INSTANCE_ID = os.getenv("INSTANCE_ID") or f"{socket.gethostname()}-{os.getpid()}"
+
+# Уведомления админу о новых хотелках: всё, что пришло за WISH_DIGEST_SECONDS
+# после первой, уходит одной сводкой (0 — каждая сразу). Админ может выбрать
+# своё окно командой /wish_digest. Больше WISH_DIGEST_MAX — сводка уходит раньше
+WISH_DIGEST_SECONDS = float(os.getenv("WISH_DIGEST_SECONDS", "60"))
+# не больше 80: иначе строки сводки не уместятся в одно сообщение (4096 символов)
+WISH_DIGEST_MAX = min(max(int(os.getenv("WISH_DIGEST_MAX", "20")), 1), 80)
+
+# Альбом приходит несколькими апдейтами: ждём столько секунд после
+# последней части, прежде чем обработать его целиком
+MEDIA_GROUP_WAIT = float(os.getenv("MEDIA_GROUP_WAIT", "0.6"))
+
+# Локальный архив фото (по SHA-256 содержимого): каталог (пусто — не вести)
+# и сколько фото скачивается одновременно
+MEDIA_ARCHIVE_DIR = os.getenv("MEDIA_ARCHIVE_DIR", "media")
+MEDIA_ARCHIVE_WORKERS = int(os.getenv("MEDIA_ARCHIVE_WORKERS", "4"))
+
+# Логи: уровень, файл с ротацией по размеру (пусто — только stderr)
+# и доля DEBUG-записей, которые реально пишутся (0.01 = каждая сотая)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FILE = os.getenv("LOG_FILE") or None
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0.01"))
@@ -1,243 +1,1371 @@
+import asyncio
+import json
+import logging
+import secrets
+import sys
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import AsyncIterator, NamedTuple
+
 import aiosqlite
-from datetime import datetime
+
+from metrics import metrics
+from migrations import run_migrations
+
+logger = logging.getLogger(__name__)
 
 # Путь к файлу базы данных
 DB_PATH = "bot.db"
 
+# Сколько подготовленных выражений sqlite3 держит в кэше на соединение
+STATEMENT_CACHE_SIZE = 256
 
-async def init_db():
-    async with aiosqlite.connect(DB_PATH) as db:
-        # напоминания
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS reminders (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                text TEXT,
-                photo_file_id TEXT,
-                is_active INTEGER NOT NULL DEFAULT 1
-            )
-        """)
+# Сколько ждать (мс), если база занята другим писателем
+BUSY_TIMEOUT_MS = 5000
+
+# Запросы дольше этого (мс) пишутся в лог как WARNING
+SLOW_QUERY_MS = 100
+
+# Общее долгоживущее соединение, открывается в main() через open_db()
+_conn: aiosqlite.Connection | None = None
+
+# Одно соединение = одна транзакция за раз, поэтому записи идут по очереди
+_write_lock = asyncio.Lock()
+
+
+class Pair(NamedTuple):
+    # """
+    # Пара "админ — получатель(ница)".
+    # recipient_chat_id = None, пока получатель не пришёл по приглашению.
+    # """
+    id: int
+    admin_id: int
+    recipient_chat_id: int | None
+    invite_code: str | None
+    wishes_feature_notified: bool
+
+
+class Schedule(NamedTuple):
+    # """
+    # Расписание рассылки пары: время HH:MM, дни недели (битовая маска, пн = 1)
+    # и таймзона. next_fire_at — следующий запуск в UTC (ISO, без таймзоны).
+    # """
+    id: int
+    pair_id: int
+    time_of_day: str
+    days: int
+    tz: str
+    next_fire_at: str
+
+
+_PAIR_COLUMNS = (
+    "id, admin_id, recipient_chat_id, invite_code, wishes_feature_notified"
+)
+
+
+def _row_to_pair(row) -> Pair:
+    return Pair(
+        id=row[0],
+        admin_id=row[1],
+        recipient_chat_id=row[2],
+        invite_code=row[3],
+        wishes_feature_notified=bool(row[4]),
+    )
+
+
+async def open_db(path: str = DB_PATH) -> None:
+    # """
+    # Открывает общее соединение с БД и настраивает прагмы.
+    # WAL — чтения не блокируют запись, synchronous=NORMAL — быстрее коммиты
+    # (в WAL это безопасно), busy_timeout — не падаем сразу на занятой базе.
+    # """
+    global _conn
+    if _conn is not None:
+        return
+
+    conn = await aiosqlite.connect(path, cached_statements=STATEMENT_CACHE_SIZE)
+    # одним скриптом — один переход в поток aiosqlite вместо четырёх
+    await conn.executescript(f"""
+        PRAGMA journal_mode = WAL;
+        PRAGMA synchronous = NORMAL;
+        PRAGMA busy_timeout = {BUSY_TIMEOUT_MS};
+        PRAGMA temp_store = MEMORY;
+    """)
+    _conn = conn
+
+
+async def close_db() -> None:
+    # """Закрывает общее соединение (вызывается при остановке бота)."""
+    global _conn, _app_state, _pairs
+    if _conn is None:
+        return
+    conn, _conn = _conn, None
+    _app_state = None
+    _pairs = None
+    _pair_by_admin.clear()
+    _pair_by_recipient.clear()
+    await conn.close()
+
+
+def _db() -> aiosqlite.Connection:
+    # """Возвращает общее соединение или падает, если open_db() не вызывали."""
+    if _conn is None:
+        raise RuntimeError("Соединение с БД не открыто — сначала вызови open_db()")
+    return _conn
+
+
+def _query_name() -> str:
+    # """
+    # Имя публичной функции db.py, из которой пришёл запрос, — метка для метрик.
+    # Служебные _функции и transaction() пропускаем, идём вверх по стеку.
+    # """
+    frame = sys._getframe(2)
+    for _ in range(8):
+        if frame is None:
+            break
+        name = frame.f_code.co_name
+        if frame.f_globals is globals() and not name.startswith("_") and name != "transaction":
+            return name
+        frame = frame.f_back
+    return "other"
+
+
+def _observe_query(name: str, kind: str, started: float, rows: int) -> None:
+    duration = time.perf_counter() - started
+    metrics.observe("bot_db_query_duration_seconds", duration, query=name, kind=kind)
+    if rows:
+        metrics.inc("bot_db_rows_total", rows, query=name, kind=kind)
+
+    fields = {"query": name, "kind": kind, "rows": rows, "duration_ms": round(duration * 1000, 3)}
+    if duration * 1000 >= SLOW_QUERY_MS:
+        logger.warning("Медленный запрос к БД", extra=fields)
+    elif logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Запрос к БД", extra=fields)
+
+
+@asynccontextmanager
+async def transaction():
+    # """
+    # Транзакция на общем соединении.
+    # Коммитит при выходе, откатывает при исключении.
+    # Лок нужен, чтобы чужой commit не зацепил нашу недописанную транзакцию.
+    # Время считается вместе с ожиданием лока и коммитом; строки — по total_changes.
+    # """
+    name = _query_name()
+    started = time.perf_counter()
+    async with _write_lock:
+        db = _db()
+        changes_before = db.total_changes
+        try:
+            yield db
+        except BaseException:
+            await db.rollback()
+            metrics.inc("bot_db_errors_total", query=name)
+            logger.warning("Транзакция откачена", extra={"query": name}, exc_info=True)
+            raise
+        else:
+            await db.commit()
+        finally:
+            _observe_query(name, "write", started, db.total_changes - changes_before)
+
+
+# Кэш app_state: все ключи грузятся один раз в load_app_state(),
+# дальше чтения идут из памяти, а записи — сразу и в БД, и в кэш
+_app_state: dict[str, str] | None = None
+
+# Счётчики обращений к кэшу (miss = пришлось идти в БД)
+app_state_stats: dict[str, int] = {"hits": 0, "misses": 0}
+
+
+async def load_app_state() -> None:
+    # """Загружает все ключи app_state в память (вызывается после open_db)."""
+    global _app_state
+    rows = await _fetchall("SELECT key, value FROM app_state")
+    _app_state = {key: value for key, value in rows}
+
+
+def get_app_state_stats() -> dict[str, int]:
+    # """Возвращает копию счётчиков попаданий/промахов кэша app_state."""
+    return dict(app_state_stats)
+
+
+async def _get_state(key: str) -> str | None:
+    # """Читает значение из кэша; если кэш ещё не загружен — из БД."""
+    if _app_state is not None:
+        app_state_stats["hits"] += 1
+        return _app_state.get(key)
+
+    app_state_stats["misses"] += 1
+    row = await _fetchone("SELECT value FROM app_state WHERE key = ?", (key,))
+    return row[0] if row else None
+
+
+async def _set_state(key: str, value: str) -> None:
+    # """Пишет значение в app_state и, после коммита, в кэш."""
+    async with transaction() as db:
+        await db.execute(
+            "INSERT OR REPLACE INTO app_state (key, value) VALUES (?, ?)",
+            (key, value)
+        )
+    if _app_state is not None:
+        _app_state[key] = value
+
+
+# Кэш пар: так же, как app_state, грузится в load_pairs() и обновляется
+# после каждой записи. Индексы по админу и по чату получателя.
+_pairs: dict[int, Pair] | None = None
+_pair_by_admin: dict[int, int] = {}
+_pair_by_recipient: dict[int, int] = {}
+
+pair_cache_stats: dict[str, int] = {"hits": 0, "misses": 0}
+
+
+async def load_pairs() -> None:
+    # """Загружает все пары в память (вызывается после open_db)."""
+    global _pairs
+    rows = await _fetchall(f"SELECT {_PAIR_COLUMNS} FROM pairs")
+    _pairs = {}
+    _pair_by_admin.clear()
+    _pair_by_recipient.clear()
+    for row in rows:
+        _cache_pair(_row_to_pair(row))
+
+
+def get_pair_cache_stats() -> dict[str, int]:
+    # """Возвращает копию счётчиков попаданий/промахов кэша пар."""
+    return dict(pair_cache_stats)
+
+
+def _cache_pair(pair: Pair) -> None:
+    if _pairs is None:
+        return
+    old = _pairs.get(pair.id)
+    if old is not None and old.recipient_chat_id is not None:
+        _pair_by_recipient.pop(old.recipient_chat_id, None)
+    _pairs[pair.id] = pair
+    _pair_by_admin[pair.admin_id] = pair.id
+    if pair.recipient_chat_id is not None:
+        _pair_by_recipient[pair.recipient_chat_id] = pair.id
+
+
+async def _fetchall(query: str, params: tuple = ()) -> list:
+    name = _query_name()
+    started = time.perf_counter()
+    rows = list(await _db().execute_fetchall(query, params))
+    _observe_query(name, "read", started, len(rows))
+    return rows
+
+
+async def _fetchone(query: str, params: tuple = ()):
+    name = _query_name()
+    started = time.perf_counter()
+    rows = await _db().execute_fetchall(query, params)
+    _observe_query(name, "read", started, len(rows))
+    return rows[0] if rows else None
+
+
+async def _keyset_page(
+    base_query: str,
+    params: tuple,
+    before_id: int | None,
+    after_id: int | None,
+    limit: int,
+) -> tuple[list, bool, bool]:
+    # """
+    # Keyset-пагинация "новые сверху": WHERE id < ? ORDER BY id DESC LIMIT ?.
+    # Стоимость страницы не зависит от размера таблицы (поиск по индексу).
+    # before_id — листаем к старым, after_id — обратно к новым.
+    # Берём на одну строку больше, чтобы понять, есть ли что-то дальше.
+    # """
+    if after_id is not None:
+        rows = await _fetchall(
+            base_query + " AND id > ? ORDER BY id ASC LIMIT ?",
+            params + (after_id, limit + 1)
+        )
+        has_newer = len(rows) > limit
+        return rows[:limit][::-1], has_newer, True
+
+    if before_id is not None:
+        rows = await _fetchall(
+            base_query + " AND id < ? ORDER BY id DESC LIMIT ?",
+            params + (before_id, limit + 1)
+        )
+    else:
+        rows = await _fetchall(
+            base_query + " ORDER BY id DESC LIMIT ?",
+            params + (limit + 1,)
+        )
+    has_older = len(rows) > limit
+    return rows[:limit], before_id is not None, has_older
+
+
+async def init_db(path: str = DB_PATH):
+    # """
+    # Открывает общее соединение (если ещё не открыто) и применяет
+    # недостающие миграции схемы (migrations.py) на нём же.
+    # """
+    await open_db(path)
+    async with _write_lock:
+        await run_migrations(_db())
+
+
+async def migrate_legacy_pair(admin_id: int) -> None:
+    # """
+    # Переносит старую "одну пару" (ADMIN_ID + girlfriend_chat_id из app_state)
+    # в таблицу pairs и привязывает к ней напоминания/хотелки без pair_id.
+    # Безопасно вызывать при каждом старте.
+    # """
+    if not admin_id:
+        return
+
+    pair = await get_pair_by_admin(admin_id)
+    if pair is None:
+        recipient = await _get_state("girlfriend_chat_id")
+        pair = await _insert_pair(
+            admin_id,
+            recipient_chat_id=int(recipient) if recipient else None,
+            wishes_feature_notified=await _get_state("wishes_feature_notified") == "1",
+        )
 
-        # служебные значения (chat_id девушки, флаги и т.п.)
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS app_state (
-                key TEXT PRIMARY KEY,
-                value TEXT NOT NULL
+    async with transaction() as db:
+        for table in ("reminders", "reminder_deck", "wishes"):
+            await db.execute(
+                f"UPDATE {table} SET pair_id = ? WHERE pair_id IS NULL",
+                (pair.id,)
             )
-        """)
-
-        # НОВОЕ: таблица хотелок
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS wishes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                text TEXT,
-                photo_file_id TEXT,
-                status TEXT NOT NULL DEFAULT 'new', -- new / done / etc
-                created_at TEXT NOT NULL
+
+
+# --- пары ---
+
+
+async def _insert_pair(
+    admin_id: int,
+    recipient_chat_id: int | None = None,
+    wishes_feature_notified: bool = False,
+) -> Pair:
+    created_at = datetime.utcnow().isoformat()
+    async with transaction() as db:
+        cursor = await db.execute(
+            """
+            INSERT INTO pairs (
+                admin_id, recipient_chat_id, wishes_feature_notified, created_at
             )
-        """)
+            VALUES (?, ?, ?, ?)
+            """,
+            (admin_id, recipient_chat_id, int(wishes_feature_notified), created_at)
+        )
+        pair_id = cursor.lastrowid
+
+    pair = Pair(
+        id=pair_id,
+        admin_id=admin_id,
+        recipient_chat_id=recipient_chat_id,
+        invite_code=None,
+        wishes_feature_notified=wishes_feature_notified,
+    )
+    _cache_pair(pair)
+    return pair
+
+
+async def _update_pair(pair: Pair, **changes) -> Pair:
+    # """
+    # Обновляет только переданные поля пары в БД и, после коммита, в кэше.
+    # Остальные поля берём из кэша, чтобы не затереть чужие изменения.
+    # """
+    assignments = ", ".join(f"{column} = ?" for column in changes)
+    values = tuple(int(v) if isinstance(v, bool) else v for v in changes.values())
+    async with transaction() as db:
+        await db.execute(
+            f"UPDATE pairs SET {assignments} WHERE id = ?",
+            values + (pair.id,)
+        )
+
+    current = _pairs.get(pair.id, pair) if _pairs is not None else pair
+    new_pair = current._replace(**changes)
+    _cache_pair(new_pair)
+    return new_pair
+
+
+async def _get_pair(db, pair_id: int) -> Pair | None:
+    # пара по id — из кэша, а без кэша запросом на переданном соединении
+    if _pairs is not None:
+        pair_cache_stats["hits"] += 1
+        return _pairs.get(pair_id)
+
+    pair_cache_stats["misses"] += 1
+    rows = await db.execute_fetchall(
+        f"SELECT {_PAIR_COLUMNS} FROM pairs WHERE id = ?", (pair_id,)
+    )
+    return _row_to_pair(rows[0]) if rows else None
+
+
+async def get_pair_by_admin(admin_id: int) -> Pair | None:
+    # """Возвращает пару админа или None."""
+    if _pairs is not None:
+        pair_cache_stats["hits"] += 1
+        pair_id = _pair_by_admin.get(admin_id)
+        return _pairs[pair_id] if pair_id is not None else None
+
+    pair_cache_stats["misses"] += 1
+    row = await _fetchone(
+        f"SELECT {_PAIR_COLUMNS} FROM pairs WHERE admin_id = ?", (admin_id,)
+    )
+    return _row_to_pair(row) if row else None
+
+
+async def get_pair_by_recipient(chat_id: int) -> Pair | None:
+    # """Возвращает пару, в которой этот чат — получатель, или None."""
+    if _pairs is not None:
+        pair_cache_stats["hits"] += 1
+        pair_id = _pair_by_recipient.get(chat_id)
+        return _pairs[pair_id] if pair_id is not None else None
+
+    pair_cache_stats["misses"] += 1
+    row = await _fetchone(
+        f"SELECT {_PAIR_COLUMNS} FROM pairs WHERE recipient_chat_id = ?", (chat_id,)
+    )
+    return _row_to_pair(row) if row else None
+
+
+async def get_or_create_pair(admin_id: int) -> Pair:
+    # """Возвращает пару админа, создавая пустую (без получателя) при необходимости."""
+    pair = await get_pair_by_admin(admin_id)
+    if pair is None:
+        pair = await _insert_pair(admin_id)
+    return pair
+
+
+async def list_recipient_pairs() -> list[Pair]:
+    # """Все пары, у которых уже есть получатель (для рассылки)."""
+    if _pairs is not None:
+        pair_cache_stats["hits"] += 1
+        return [p for p in _pairs.values() if p.recipient_chat_id is not None]
+
+    pair_cache_stats["misses"] += 1
+    rows = await _fetchall(
+        f"SELECT {_PAIR_COLUMNS} FROM pairs WHERE recipient_chat_id IS NOT NULL ORDER BY id"
+    )
+    return [_row_to_pair(row) for row in rows]
+
+
+async def create_invite(admin_id: int) -> str:
+    # """
+    # Создаёт (или перевыпускает) код приглашения для пары админа.
+    # Получатель приходит по ссылке t.me/<бот>?start=<код>.
+    # """
+    pair = await get_or_create_pair(admin_id)
+    code = secrets.token_urlsafe(12)
+    await _update_pair(pair, invite_code=code)
+    return code
+
+
+async def accept_invite(code: str, chat_id: int) -> Pair | None:
+    # """
+    # Привязывает чат получателя к паре по коду приглашения.
+    # Вернёт пару или None, если код неверный или чат уже в другой паре.
+    # """
+    existing = await get_pair_by_recipient(chat_id)
+    if existing is not None:
+        return existing if existing.invite_code == code else None
+
+    row = await _fetchone(
+        f"SELECT {_PAIR_COLUMNS} FROM pairs WHERE invite_code = ?", (code,)
+    )
+    if row is None:
+        return None
+    return await _update_pair(
+        _row_to_pair(row), recipient_chat_id=chat_id, invite_code=None
+    )
+
 
-        await db.commit()
+async def set_recipient(pair: Pair, chat_id: int) -> Pair:
+    # """Сохраняет chat_id получателя пары."""
+    return await _update_pair(pair, recipient_chat_id=chat_id)
 
 
-async def add_reminder(text: str | None, photo_file_id: str | None) -> int:
+async def set_wishes_feature_notified(pair: Pair) -> Pair:
+    # """Помечает, что уведомление о новой функции этой паре уже отправлено."""
+    return await _update_pair(pair, wishes_feature_notified=True)
+
+
+async def take_legacy_waiting_wish_chats() -> list[int]:
+    # """
+    # Чаты получателей, у которых остался старый флаг pairs.waiting_wish
+    # (до перехода на FSM). Флаг сразу сбрасывается — переносится один раз.
     # """
-    # Добавляет новое напоминание в таблицу.
+    async with transaction() as db:
+        rows = await db.execute_fetchall(
+            """
+            UPDATE pairs SET waiting_wish = 0
+            WHERE waiting_wish = 1 AND recipient_chat_id IS NOT NULL
+            RETURNING recipient_chat_id
+            """
+        )
+    return [row[0] for row in rows]
+
+
+# --- состояния FSM ---
+
+
+async def load_fsm_states() -> list[tuple[str, str | None, dict]]:
+    # """Все сохранённые состояния FSM: (key, state, data)."""
+    rows = await _fetchall("SELECT key, state, data FROM fsm_states")
+    return [(key, state, json.loads(data)) for key, state, data in rows]
+
+
+async def get_fsm_state(key: str) -> tuple[str | None, dict]:
+    # """Состояние и данные FSM по ключу — для хранилища без кэша."""
+    row = await _fetchone("SELECT state, data FROM fsm_states WHERE key = ?", (key,))
+    return (row[0], json.loads(row[1])) if row else (None, {})
+
+
+async def save_fsm_state(key: str, state: str | None, data: dict) -> None:
+    # """Сохраняет состояние и данные FSM; пустая запись удаляется."""
+    async with transaction() as db:
+        if state is None and not data:
+            await db.execute("DELETE FROM fsm_states WHERE key = ?", (key,))
+            return
+        await db.execute(
+            """
+            INSERT INTO fsm_states (key, state, data) VALUES (?, ?, ?)
+            ON CONFLICT (key) DO UPDATE SET state = excluded.state, data = excluded.data
+            """,
+            (key, state, json.dumps(data, ensure_ascii=False))
+        )
+
+
+# --- напоминания ---
+
+
+async def _insert_media(db, owner: str, owner_id: int, media: list[str] | None) -> None:
+    # все фото альбома — в той же транзакции, что и сама запись
+    if media and len(media) > 1:
+        await db.executemany(
+            "INSERT INTO media (owner, owner_id, position, file_id) VALUES (?, ?, ?, ?)",
+            [(owner, owner_id, position, file_id) for position, file_id in enumerate(media)]
+        )
+
+
+async def get_media(owner: str, owner_id: int) -> list[str]:
+    # """file_id фото альбома записи по порядку; [] — это не альбом."""
+    rows = await _fetchall(
+        "SELECT file_id FROM media WHERE owner = ? AND owner_id = ? ORDER BY position",
+        (owner, owner_id)
+    )
+    return [row[0] for row in rows]
+
+
+async def add_reminder(
+    pair_id: int,
+    text: str | None,
+    photo_file_id: str | None,
+    send_at: str | None = None,
+    media: list[str] | None = None,
+) -> int:
+    # """
+    # Добавляет новое напоминание пары в таблицу.
     # text — текст напоминания (может быть None),
-    # photo_file_id — file_id фотки (может быть None).
+    # photo_file_id — file_id фотки (может быть None),
+    # send_at — время разовой отправки в UTC (ISO); None — обычное, в колоду,
+    # media — все file_id, если фото пришли альбомом (первое = photo_file_id).
     # Возвращает ID добавленной записи.
     # """
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with transaction() as db:
         cursor = await db.execute(
             """
-            INSERT INTO reminders (text, photo_file_id, is_active)
-            VALUES (?, ?, 1)
+            INSERT INTO reminders (pair_id, text, photo_file_id, is_active, send_at)
+            VALUES (?, ?, ?, 1, ?)
             """,
-            (text, photo_file_id)
+            (pair_id, text, photo_file_id, send_at)
+        )
+        await _insert_media(db, "reminder", cursor.lastrowid, media)
+        if send_at is not None:
+            return cursor.lastrowid
+
+        # кладём в колоду на случайное место
+        await db.execute(
+            """
+            INSERT INTO reminder_deck (reminder_id, pair_id, sort_key)
+            VALUES (?, ?, RANDOM())
+            """,
+            (cursor.lastrowid, pair_id)
         )
-        await db.commit()
         return cursor.lastrowid
 
 
-async def list_reminders():
+async def list_reminders_page(
+    pair_id: int,
+    before_id: int | None = None,
+    after_id: int | None = None,
+    limit: int = 20,
+):
     # """
-    # Возвращает список всех напоминаний.
-    # Каждый элемент — кортеж (id, text, photo_file_id, is_active).
+    # Страница напоминаний пары, новые сверху (keyset-пагинация по id).
+    # Каждый элемент — кортеж (id, text, photo_file_id, is_active, send_at).
+    # Возвращает (rows, has_newer, has_older).
     # """
-    async with aiosqlite.connect(DB_PATH) as db:
-        cursor = await db.execute(
-            "SELECT id, text, photo_file_id, is_active FROM reminders ORDER BY id"
-        )
-        rows = await cursor.fetchall()
-        return rows
+    return await _keyset_page(
+        "SELECT id, text, photo_file_id, is_active, send_at FROM reminders WHERE pair_id = ?",
+        (pair_id,), before_id, after_id, limit
+    )
 
 
-async def deactivate_reminder(reminder_id: int) -> bool:
+async def deactivate_reminder(pair_id: int, reminder_id: int) -> bool:
     # """
-    # Помечает напоминание как неактивное по его ID.
+    # Помечает напоминание пары как неактивное по его ID.
     # Возвращает True, если хотя бы одна запись была изменена.
     # """
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with transaction() as db:
         cursor = await db.execute(
-            "UPDATE reminders SET is_active = 0 WHERE id = ?",
-            (reminder_id,)
+            "UPDATE reminders SET is_active = 0 WHERE id = ? AND pair_id = ?",
+            (reminder_id, pair_id)
+        )
+        await db.execute(
+            "DELETE FROM reminder_deck WHERE reminder_id = ? AND pair_id = ?",
+            (reminder_id, pair_id)
         )
-        await db.commit()
         return cursor.rowcount > 0
 
 
-async def set_girlfriend_chat_id(chat_id: int) -> None:
+async def activate_all_reminders(pair_id: int) -> int:
     # """
-    # Сохраняет chat_id твоей девушки в таблицу app_state.
-    # Если значение уже есть — перезаписывает.
+    # Делает все напоминания пары активными и заново тасует её колоду.
+    # Обновляются только использованные напоминания, остальное — перестройка колоды.
+    # Разовые (/add_at) не трогаем: отправленное не должно уйти второй раз.
+    # Возвращает количество напоминаний в колоде.
     # """
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with transaction() as db:
         await db.execute(
             """
-            INSERT OR REPLACE INTO app_state (key, value)
-            VALUES ('girlfriend_chat_id', ?)
+            UPDATE reminders SET is_active = 1
+            WHERE pair_id = ? AND is_active = 0 AND send_at IS NULL
             """,
-            (str(chat_id),)
+            (pair_id,)
         )
-        await db.commit()
+        await db.execute("DELETE FROM reminder_deck WHERE pair_id = ?", (pair_id,))
+        cursor = await db.execute(
+            """
+            INSERT INTO reminder_deck (reminder_id, pair_id, sort_key)
+            SELECT id, pair_id, RANDOM() FROM reminders
+            WHERE pair_id = ? AND send_at IS NULL
+            """,
+            (pair_id,)
+        )
+        return cursor.rowcount
 
 
-async def get_girlfriend_chat_id() -> int | None:
-    # """
-    # Возвращает chat_id твоей девушки, если он сохранён.
-    # Если ещё не сохранён — возвращает None.
-    # """
-    async with aiosqlite.connect(DB_PATH) as db:
+# --- outbox доставок ---
+
+
+# верхняя карта колоды пары (один поиск по индексу (pair_id, sort_key))
+_NEXT_REMINDER_QUERY = """
+    SELECT r.id, r.text, r.photo_file_id
+    FROM reminder_deck d
+    JOIN reminders r ON r.id = d.reminder_id
+    WHERE d.pair_id = ?
+    ORDER BY d.sort_key
+    LIMIT 1
+"""
+
+
+async def _enqueue_next_reminder(
+    db, pair: Pair, now: str, run: tuple[str, str] | None = None
+) -> int | None:
+    # снимаем верхнюю карту колоды и кладём её в outbox — внутри чужой транзакции.
+    # run = (run_date, scheduled_at) — плановая рассылка: сначала занимаем строку
+    # delivery_log, и если она уже есть (рестарт, повторный запуск) — пару пропускаем
+    if run is not None:
         cursor = await db.execute(
-            "SELECT value FROM app_state WHERE key = 'girlfriend_chat_id'"
+            """
+            INSERT OR IGNORE INTO delivery_log (pair_id, run_date, scheduled_at, enqueued_at)
+            VALUES (?, ?, ?, ?)
+            """,
+            (pair.id, run[0], run[1], now)
         )
-        row = await cursor.fetchone()
-        if row is None:
-            return None
-        try:
-            return int(row[0])
-        except ValueError:
+        if not cursor.rowcount:
             return None
+        log_id = cursor.lastrowid
+
+    rows = await db.execute_fetchall(_NEXT_REMINDER_QUERY, (pair.id,))
+    if not rows:
+        return None
+    r_id, text, photo_file_id = rows[0]
+
+    await db.execute("DELETE FROM reminder_deck WHERE reminder_id = ?", (r_id,))
+    await db.execute("UPDATE reminders SET is_active = 0 WHERE id = ?", (r_id,))
+    cursor = await db.execute(
+        """
+        INSERT INTO outbox (
+            pair_id, chat_id, reminder_id, text, photo_file_id,
+            available_at, created_at, scheduled_at
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (pair.id, pair.recipient_chat_id, r_id, text, photo_file_id, now, now,
+         run[1] if run is not None else None)
+    )
+    if run is not None:
+        await db.execute(
+            "UPDATE delivery_log SET outbox_id = ?, reminder_id = ? WHERE id = ?",
+            (cursor.lastrowid, r_id, log_id)
+        )
+    return r_id
+
+
+async def enqueue_next_reminder(pair: Pair) -> int | None:
+    # """
+    # Атомарно выбирает следующее напоминание пары, помечает его использованным
+    # и ставит доставку в outbox. Возвращает ID напоминания или None, если колода пуста.
+    # """
+    now = datetime.utcnow().isoformat()
+    async with transaction() as db:
+        return await _enqueue_next_reminder(db, pair, now)
+
+
+async def fire_schedules(
+    items: list[tuple["Schedule", str, tuple[str, str] | None]]
+) -> int:
+    # """
+    # Обрабатывает пачку сработавших расписаний одной транзакцией.
+    # Элемент: (schedule, новый next_fire_at, run или None), run = (run_date, scheduled_at)
+    # слота, который выполняем. run задан — ставим напоминание паре в outbox (не больше
+    # одного на слот, см. delivery_log); None — слот пропущен (слишком поздно),
+    # только сдвигаем расписание.
+    # Расписание, которое успели удалить (/schedule), пропускается.
+    # Возвращает количество поставленных доставок.
+    # """
+    now = datetime.utcnow().isoformat()
+    queued = 0
+    async with transaction() as db:
+        for schedule, next_fire_at, run in items:
+            cursor = await db.execute(
+                "UPDATE schedules SET next_fire_at = ? WHERE id = ?",
+                (next_fire_at, schedule.id)
+            )
+            if cursor.rowcount == 0:
+                continue  # строки уже нет — расписание удалили
+            pair = await _get_pair(db, schedule.pair_id)
+            if run is not None and pair is not None and pair.recipient_chat_id is not None:
+                if await _enqueue_next_reminder(db, pair, now, run) is not None:
+                    queued += 1
+    return queued
+
+
+async def claim_outbox_batch(limit: int):
+    # """
+    # Забирает до limit готовых доставок: pending -> sending, attempts + 1.
+    # Каждый элемент: (id, chat_id, text, photo_file_id, attempts, media),
+    # media — file_id альбома напоминания (пустой кортеж, если это не альбом).
+    # """
+    now = datetime.utcnow().isoformat()
+    async with transaction() as db:
+        rows = await db.execute_fetchall(
+            """
+            UPDATE outbox
+            SET status = 'sending', attempts = attempts + 1
+            WHERE id IN (
+                SELECT id FROM outbox
+                WHERE status = 'pending' AND available_at <= ?
+                ORDER BY available_at
+                LIMIT ?
+            )
+            RETURNING id, chat_id, text, photo_file_id, attempts, reminder_id
+            """,
+            (now, limit)
+        )
+        # альбомы всей пачки — одним запросом
+        albums: dict[int, list[str]] = {}
+        reminder_ids = sorted({row[5] for row in rows if row[3] and row[5] is not None})
+        if reminder_ids:
+            placeholders = ", ".join("?" * len(reminder_ids))
+            media_rows = await db.execute_fetchall(
+                f"""
+                SELECT owner_id, file_id FROM media
+                WHERE owner = 'reminder' AND owner_id IN ({placeholders})
+                ORDER BY owner_id, position
+                """,
+                reminder_ids
+            )
+            for owner_id, file_id in media_rows:
+                albums.setdefault(owner_id, []).append(file_id)
+    return [(*row[:5], tuple(albums.get(row[5], ()))) for row in rows]
+
+
+async def mark_outbox_sent(outbox_id: int, message_id: int) -> float | None:
+    # """
+    # Сохраняет квитанцию доставки. Повторный вызов ничего не меняет.
+    # Для доставки с плановым временем (расписание, /add_at) возвращает
+    # задержку относительно него (с), иначе None.
+    # """
+    now = datetime.utcnow().isoformat()
+    async with transaction() as db:
+        rows = await db.execute_fetchall(
+            """
+            UPDATE outbox
+            SET status = 'sent', sent_at = ?, message_id = ?, last_error = NULL
+            WHERE id = ? AND status != 'sent'
+            RETURNING (julianday(sent_at) - julianday(scheduled_at)) * 86400
+            """,
+            (now, message_id, outbox_id)
+        )
+        lag = rows[0][0] if rows else None
+        if lag is not None:
+            await db.execute(
+                "UPDATE delivery_log SET sent_at = ?, lag_seconds = ? WHERE outbox_id = ?",
+                (now, lag, outbox_id)
+            )
+        return lag
 
 
-async def get_random_active_reminder():
+async def mark_outbox_failed(outbox_id: int, error: str, retry_in: float | None) -> None:
     # """
-    # Возвращает одно случайное активное напоминание.
-    # Вернёт кортеж (id, text, photo_file_id) или None, если активных нет.
+    # Фиксирует неудачную попытку.
+    # retry_in — через сколько секунд повторить; None — сдаёмся: доставка failed,
+    # а напоминание возвращается в колоду, чтобы не потеряться
+    # (разовое остаётся использованным — иначе оно тут же ушло бы снова).
     # """
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with transaction() as db:
+        if retry_in is not None:
+            available_at = (datetime.utcnow() + timedelta(seconds=retry_in)).isoformat()
+            await db.execute(
+                """
+                UPDATE outbox SET status = 'pending', available_at = ?, last_error = ?
+                WHERE id = ? AND status = 'sending'
+                """,
+                (available_at, error, outbox_id)
+            )
+            return
+
         cursor = await db.execute(
             """
-            SELECT id, text, photo_file_id
-            FROM reminders
-            WHERE is_active = 1
-            ORDER BY RANDOM()
-            LIMIT 1
+            UPDATE outbox SET status = 'failed', last_error = ?
+            WHERE id = ? AND status = 'sending'
+            """,
+            (error, outbox_id)
+        )
+        if cursor.rowcount:
+            await db.execute(
+                """
+                UPDATE reminders SET is_active = 1
+                WHERE id = (SELECT reminder_id FROM outbox WHERE id = ?) AND send_at IS NULL
+                """,
+                (outbox_id,)
+            )
+            await db.execute(
+                """
+                INSERT OR IGNORE INTO reminder_deck (reminder_id, pair_id, sort_key)
+                SELECT o.reminder_id, o.pair_id, RANDOM() FROM outbox o
+                JOIN reminders r ON r.id = o.reminder_id
+                WHERE o.id = ? AND r.send_at IS NULL
+                """,
+                (outbox_id,)
+            )
+
+
+# Разовые напоминания пар без получателя не трогаем: они ждут, пока получатель появится
+_DUE_REMINDERS_FROM = """
+    FROM reminders r
+    JOIN pairs p ON p.id = r.pair_id
+    WHERE r.send_at IS NOT NULL AND r.is_active = 1 AND p.recipient_chat_id IS NOT NULL
+"""
+
+
+async def next_due_at() -> str | None:
+    # """
+    # Ближайший send_at среди неотправленных разовых напоминаний (по индексу).
+    # Пары без получателя не считаются — иначе их просроченное напоминание
+    # будило бы цикл без сна.
+    # """
+    row = await _fetchone(
+        f"SELECT r.send_at {_DUE_REMINDERS_FROM} ORDER BY r.send_at LIMIT 1"
+    )
+    return row[0] if row else None
+
+
+async def enqueue_due_reminders(limit: int = 500) -> int:
+    # """
+    # Ставит в outbox разовые напоминания, у которых наступил send_at
+    # (диапазонный запрос по idx_reminders_send_at), и помечает их использованными.
+    # Напоминания пар без получателя остаются ждать: уйдут, когда он появится.
+    # Возвращает, сколько напоминаний поставлено.
+    # """
+    now = datetime.utcnow().isoformat()
+    async with transaction() as db:
+        rows = await db.execute_fetchall(
+            f"""
+            SELECT r.id, r.pair_id, p.recipient_chat_id, r.text, r.photo_file_id, r.send_at
+            {_DUE_REMINDERS_FROM} AND r.send_at <= ?
+            ORDER BY r.send_at
+            LIMIT ?
+            """,
+            (now, limit)
+        )
+        await db.executemany(
             """
+            INSERT INTO outbox (
+                pair_id, chat_id, reminder_id, text, photo_file_id,
+                available_at, created_at, scheduled_at
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            [(pair_id, chat_id, r_id, text, photo_file_id, now, now, send_at)
+             for r_id, pair_id, chat_id, text, photo_file_id, send_at in rows]
+        )
+        await db.executemany(
+            "UPDATE reminders SET is_active = 0 WHERE id = ?",
+            [(row[0],) for row in rows]
         )
-        row = await cursor.fetchone()
-        return row
+    return len(rows)
 
 
-async def activate_all_reminders() -> int:
+async def requeue_stale_outbox() -> int:
     # """
-    # Делает все напоминания активными (is_active = 1).
-    # Возвращает количество затронутых строк.
+    # После перезапуска возвращает "зависшие" доставки (sending) в pending.
+    # Если процесс упал уже после ответа Telegram, сообщение уйдёт повторно —
+    # это единственный случай дубля.
     # """
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with transaction() as db:
         cursor = await db.execute(
-            "UPDATE reminders SET is_active = 1"
+            "UPDATE outbox SET status = 'pending' WHERE status = 'sending'"
         )
-        await db.commit()
         return cursor.rowcount
 
-async def set_waiting_wish(is_waiting: bool) -> None:
+
+# --- расписания ---
+
+_SCHEDULE_COLUMNS = "id, pair_id, time_of_day, days, tz, next_fire_at"
+
+
+async def list_schedules(pair_id: int | None = None) -> list[Schedule]:
+    # """Расписания пары (или все, если pair_id не задан — для загрузки в таймер)."""
+    if pair_id is None:
+        rows = await _fetchall(f"SELECT {_SCHEDULE_COLUMNS} FROM schedules")
+    else:
+        rows = await _fetchall(
+            f"SELECT {_SCHEDULE_COLUMNS} FROM schedules WHERE pair_id = ? ORDER BY time_of_day",
+            (pair_id,)
+        )
+    return [Schedule(*row) for row in rows]
+
+
+async def add_schedule(
+    pair_id: int, time_of_day: str, days: int, tz: str, next_fire_at: str
+) -> Schedule:
+    async with transaction() as db:
+        cursor = await db.execute(
+            """
+            INSERT INTO schedules (pair_id, time_of_day, days, tz, next_fire_at)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            (pair_id, time_of_day, days, tz, next_fire_at)
+        )
+        return Schedule(cursor.lastrowid, pair_id, time_of_day, days, tz, next_fire_at)
+
+
+async def delete_schedule(pair_id: int, schedule_id: int) -> bool:
+    # """Удаляет расписание пары. False — такого расписания у пары нет."""
+    async with transaction() as db:
+        cursor = await db.execute(
+            "DELETE FROM schedules WHERE id = ? AND pair_id = ?",
+            (schedule_id, pair_id)
+        )
+        return cursor.rowcount > 0
+
+
+async def list_unscheduled_pair_ids() -> list[int]:
+    # """Пары с получателем, но без единого расписания (им положено расписание по умолчанию)."""
+    rows = await _fetchall(
+        """
+        SELECT p.id FROM pairs p
+        WHERE p.recipient_chat_id IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM schedules s WHERE s.pair_id = p.id)
+        """
+    )
+    return [row[0] for row in rows]
+
+
+# --- аренды (выбор ведущего) ---
+
+
+class Lease(NamedTuple):
+    # """Кто держит аренду name и до какого момента (UTC, ISO)."""
+    name: str
+    holder: str
+    acquired_at: str
+    renewed_at: str
+    expires_at: str
+
+
+_LEASE_COLUMNS = "name, holder, acquired_at, renewed_at, expires_at"
+
+
+async def acquire_lease(name: str, holder: str, ttl: float) -> Lease | None:
     # """
-    # Сохраняет флаг, что мы ждём от девушки сообщение с хотелкой.
-    # True -> '1', False -> '0'.
+    # Берёт или продлевает аренду на ttl секунд одним UPSERT.
+    # Получится, если аренда свободна, истекла или уже наша;
+    # иначе None (держит другой процесс).
     # """
-    value = "1" if is_waiting else "0"
-    async with aiosqlite.connect(DB_PATH) as db:
+    now = datetime.utcnow()
+    expires_at = (now + timedelta(seconds=ttl)).isoformat()
+    now = now.isoformat()
+    async with transaction() as db:
+        rows = await db.execute_fetchall(
+            f"""
+            INSERT INTO leases (name, holder, acquired_at, renewed_at, expires_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (name) DO UPDATE SET
+                holder = excluded.holder,
+                acquired_at = CASE WHEN leases.holder = excluded.holder
+                                   THEN leases.acquired_at ELSE excluded.acquired_at END,
+                renewed_at = excluded.renewed_at,
+                expires_at = excluded.expires_at
+            WHERE leases.holder = excluded.holder OR leases.expires_at <= excluded.renewed_at
+            RETURNING {_LEASE_COLUMNS}
+            """,
+            (name, holder, now, now, expires_at)
+        )
+    return Lease(*rows[0]) if rows else None
+
+
+async def release_lease(name: str, holder: str) -> bool:
+    # """Отпускает аренду, если она наша, — следующий претендент заберёт её сразу."""
+    async with transaction() as db:
+        cursor = await db.execute(
+            "DELETE FROM leases WHERE name = ? AND holder = ?",
+            (name, holder)
+        )
+        return cursor.rowcount > 0
+
+
+async def get_lease(name: str) -> Lease | None:
+    row = await _fetchone(f"SELECT {_LEASE_COLUMNS} FROM leases WHERE name = ?", (name,))
+    return Lease(*row) if row else None
+
+
+# --- архив фото ---
+
+
+async def list_photos_to_archive(limit: int = 50) -> list[tuple[str, int]]:
+    # """(file_id, attempts) фото, которые пора скачать в архив (новые и ждущие повтора)."""
+    now = datetime.utcnow().isoformat()
+    rows = await _fetchall(
+        """
+        SELECT file_id, attempts FROM photo_archive
+        WHERE sha256 IS NULL AND next_try_at IS NOT NULL AND next_try_at <= ?
+        ORDER BY next_try_at
+        LIMIT ?
+        """,
+        (now, limit)
+    )
+    return [(file_id, attempts) for file_id, attempts in rows]
+
+
+async def mark_photo_archived(file_id: str, sha256: str, size: int) -> None:
+    now = datetime.utcnow().isoformat()
+    async with transaction() as db:
+        await db.execute(
+            """
+            INSERT INTO photo_archive (file_id, sha256, size, archived_at, next_try_at)
+            VALUES (?, ?, ?, ?, NULL)
+            ON CONFLICT (file_id) DO UPDATE SET
+                sha256 = excluded.sha256, size = excluded.size,
+                archived_at = excluded.archived_at, next_try_at = NULL, last_error = NULL
+            """,
+            (file_id, sha256, size, now)
+        )
+
+
+async def mark_photo_archive_failed(file_id: str, error: str, retry_in: float | None) -> None:
+    # """Неудачная попытка скачать фото; retry_in = None — больше не пробуем."""
+    next_try_at = (
+        (datetime.utcnow() + timedelta(seconds=retry_in)).isoformat()
+        if retry_in is not None else None
+    )
+    async with transaction() as db:
         await db.execute(
             """
-            INSERT OR REPLACE INTO app_state (key, value)
-            VALUES ('girlfriend_waiting_wish', ?)
+            UPDATE photo_archive
+            SET attempts = attempts + 1, next_try_at = ?, last_error = ?
+            WHERE file_id = ?
             """,
-            (value,)
+            (next_try_at, error, file_id)
         )
-        await db.commit()
 
 
-async def is_waiting_wish() -> bool:
+async def get_photo_hashes(file_ids: list[str]) -> dict[str, str]:
+    # """SHA-256 архивных копий для этих file_id (тех, что уже в архиве)."""
+    if not file_ids:
+        return {}
+    placeholders = ", ".join("?" * len(file_ids))
+    rows = await _fetchall(
+        f"""
+        SELECT file_id, sha256 FROM photo_archive
+        WHERE file_id IN ({placeholders}) AND sha256 IS NOT NULL
+        """,
+        tuple(file_ids)
+    )
+    return dict(rows)
+
+
+async def replace_photo_file_id(old_file_id: str, new_file_id: str) -> None:
     # """
-    # Возвращает True, если бот сейчас ждёт от девушки сообщение с хотелкой.
+    # Фото загружено заново из архива и получило новый file_id: меняем его
+    # везде, где он хранится, а в архиве новый file_id указывает на тот же файл.
     # """
-    async with aiosqlite.connect(DB_PATH) as db:
-        cursor = await db.execute(
-            "SELECT value FROM app_state WHERE key = 'girlfriend_waiting_wish'"
+    async with transaction() as db:
+        for table, column in (("reminders", "photo_file_id"), ("wishes", "photo_file_id"),
+                              ("media", "file_id"), ("outbox", "photo_file_id")):
+            await db.execute(
+                f"UPDATE {table} SET {column} = ? WHERE {column} = ?",
+                (new_file_id, old_file_id)
+            )
+        await db.execute(
+            """
+            INSERT OR REPLACE INTO photo_archive (file_id, sha256, size, archived_at, next_try_at)
+            SELECT ?, sha256, size, archived_at, NULL FROM photo_archive WHERE file_id = ?
+            """,
+            (new_file_id, old_file_id)
         )
-        row = await cursor.fetchone()
-        if row is None:
-            return False
-        return row[0] == "1"
 
 
-async def add_wish(user_id: int, text: str | None, photo_file_id: str | None) -> int:
+# --- хотелки ---
+
+# Статусы хотелки по порядку: новая → в планах → сделано / не будет
+WISH_STATUSES = ("new", "planned", "done", "rejected")
+
+
+async def add_wish(
+    pair_id: int,
+    user_id: int,
+    text: str | None,
+    photo_file_id: str | None,
+    media: list[str] | None = None,
+) -> int:
     # """
-    # Добавляет хотелку в таблицу wishes.
+    # Добавляет хотелку пары в таблицу wishes (media — фото альбома, как в add_reminder).
     # Возвращает ID созданной хотелки.
     # """
     created_at = datetime.utcnow().isoformat()
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with transaction() as db:
         cursor = await db.execute(
             """
-            INSERT INTO wishes (user_id, text, photo_file_id, status, created_at)
-            VALUES (?, ?, ?, 'new', ?)
+            INSERT INTO wishes (pair_id, user_id, text, photo_file_id, status, created_at)
+            VALUES (?, ?, ?, ?, 'new', ?)
             """,
-            (user_id, text, photo_file_id, created_at)
+            (pair_id, user_id, text, photo_file_id, created_at)
         )
-        await db.commit()
+        await _insert_media(db, "wish", cursor.lastrowid, media)
         return cursor.lastrowid
 
 
-async def list_wishes(limit: int | None = None):
+async def get_wish_digest_window(admin_id: int) -> float | None:
+    # """Окно сводки хотелок, которое выбрал админ (/wish_digest), или None — по умолчанию."""
+    value = await _get_state(f"wish_digest_window:{admin_id}")
+    return float(value) if value is not None else None
+
+
+async def set_wish_digest_window(admin_id: int, seconds: float) -> None:
+    await _set_state(f"wish_digest_window:{admin_id}", str(seconds))
+
+
+async def list_wishes_page(
+    pair_id: int,
+    before_id: int | None = None,
+    after_id: int | None = None,
+    limit: int = 20,
+    status: str | None = None,
+):
     # """
-    # Возвращает список хотелок.
+    # Страница хотелок пары, новые сверху (keyset-пагинация по id).
+    # status — только хотелки с этим статусом (индекс (pair_id, status, id)).
     # Каждый элемент: (id, user_id, text, photo_file_id, status, created_at).
+    # Возвращает (rows, has_newer, has_older).
     # """
-    query = "SELECT id, user_id, text, photo_file_id, status, created_at FROM wishes ORDER BY id DESC"
-    if limit:
-        query += f" LIMIT {int(limit)}"
+    query = """
+        SELECT id, user_id, text, photo_file_id, status, created_at
+        FROM wishes
+        WHERE pair_id = ?
+    """
+    params: tuple = (pair_id,)
+    if status is not None:
+        query += " AND status = ?"
+        params += (status,)
+    return await _keyset_page(query, params, before_id, after_id, limit)
 
-    async with aiosqlite.connect(DB_PATH) as db:
-        cursor = await db.execute(query)
-        rows = await cursor.fetchall()
-        return rows
-    
-async def is_wishes_feature_notified() -> bool:
+
+async def set_wish_status(pair_id: int, wish_id: int, status: str) -> str | None:
     # """
-    # Возвращает True, если мы уже отправляли девушке уведомление
-    # о новой функции с хотелками.
+    # Меняет статус хотелки пары (счётчики обновит триггер в этой же транзакции).
+    # Возвращает прежний статус или None, если такой хотелки у пары нет.
     # """
-    async with aiosqlite.connect(DB_PATH) as db:
-        cursor = await db.execute(
-            "SELECT value FROM app_state WHERE key = 'wishes_feature_notified'"
+    async with transaction() as db:
+        rows = await db.execute_fetchall(
+            "SELECT status FROM wishes WHERE id = ? AND pair_id = ?",
+            (wish_id, pair_id)
         )
-        row = await cursor.fetchone()
-        if row is None:
-            return False
-        return row[0] == "1"
+        if not rows:
+            return None
+        if rows[0][0] != status:
+            await db.execute(
+                "UPDATE wishes SET status = ? WHERE id = ?", (status, wish_id)
+            )
+        return rows[0][0]
+
 
+async def get_wish_counters(pair_id: int) -> dict[str, int]:
+    # """Количество хотелок пары по статусам (из wish_counters, без подсчёта)."""
+    rows = await _fetchall(
+        "SELECT status, count FROM wish_counters WHERE pair_id = ?", (pair_id,)
+    )
+    return {status: count for status, count in rows}
 
-async def set_wishes_feature_notified() -> None:
+
+# --- поиск ---
+
+# Маркеры подсветки в snippet(): заменяются на <b></b> уже после html-экранирования
+SEARCH_MARK_START = "\x02"
+SEARCH_MARK_END = "\x03"
+
+
+def _fts_query(words: list[str]) -> str:
+    # каждое слово — в кавычках (спецсимволы FTS5 не ломают запрос) и с * на конце:
+    # "ресторан" найдёт и "ресторане", и "ресторанчик"
+    return " ".join('"' + w.replace('"', '""') + '"*' for w in words)
+
+
+async def search(
+    pair_id: int, words: list[str], limit: int = 10, offset: int = 0
+) -> tuple[list, bool]:
     # """
-    # Помечает, что уведомление о новой функции уже отправлено.
+    # Полнотекстовый поиск по напоминаниям и хотелкам пары, лучшие (bm25) сверху.
+    # Строка должна содержать все слова из words (по префиксу).
+    # Каждый элемент: (kind, id, snippet), kind — "reminder" или "wish";
+    # в snippet найденные слова обёрнуты в SEARCH_MARK_START / SEARCH_MARK_END.
+    # Возвращает (rows, есть_ли_ещё).
     # """
-    async with aiosqlite.connect(DB_PATH) as db:
+    rows = await _fetchall(
+        f"""
+        SELECT rowid,
+               snippet(search_fts, 1, '{SEARCH_MARK_START}', '{SEARCH_MARK_END}', '…', 16)
+        FROM search_fts
+        WHERE search_fts MATCH ? AND pair_id = ?
+        ORDER BY rank
+        LIMIT ? OFFSET ?
+        """,
+        (_fts_query(words), pair_id, limit + 1, offset)
+    )
+    results = [
+        ("wish" if rowid % 2 else "reminder", rowid // 2, snippet)
+        for rowid, snippet in rows[:limit]
+    ]
+    return results, len(rows) > limit
+
+
+# --- массовый импорт / экспорт ---
+
+
+async def import_records(
+    pair_id: int,
+    default_user_id: int,
+    batches: AsyncIterator[list[dict]],
+) -> tuple[int, int]:
+    # """
+    # Импортирует напоминания и хотелки пачками (executemany) в ОДНОЙ транзакции:
+    # либо файл загрузится целиком, либо ничего.
+    # Запись — словарь с ключами type ("reminder"/"wish"), text, photo_file_id,
+    # is_active, status, created_at, user_id (все, кроме type, необязательны).
+    # Возвращает (сколько напоминаний, сколько хотелок).
+    # """
+    now = datetime.utcnow().isoformat()
+    reminders_count = 0
+    wishes_count = 0
+
+    async with transaction() as db:
+        row = await db.execute_fetchall("SELECT COALESCE(MAX(id), 0) FROM reminders")
+        last_reminder_id = row[0][0]
+
+        async for batch in batches:
+            reminders = [
+                (pair_id, r.get("text"), r.get("photo_file_id"),
+                 1 if r.get("is_active") is None else int(r["is_active"]))
+                for r in batch if r["type"] == "reminder"
+            ]
+            wishes = [
+                (pair_id, int(r.get("user_id") or default_user_id), r.get("text"),
+                 r.get("photo_file_id"), r.get("status") or "new",
+                 r.get("created_at") or now)
+                for r in batch if r["type"] == "wish"
+            ]
+            if reminders:
+                await db.executemany(
+                    """
+                    INSERT INTO reminders (pair_id, text, photo_file_id, is_active)
+                    VALUES (?, ?, ?, ?)
+                    """,
+                    reminders
+                )
+            if wishes:
+                await db.executemany(
+                    """
+                    INSERT INTO wishes (pair_id, user_id, text, photo_file_id, status, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    """,
+                    wishes
+                )
+            reminders_count += len(reminders)
+            wishes_count += len(wishes)
+
+        # новые активные напоминания — в колоду, одним запросом
         await db.execute(
             """
-            INSERT OR REPLACE INTO app_state (key, value)
-            VALUES ('wishes_feature_notified', '1')
+            INSERT INTO reminder_deck (reminder_id, pair_id, sort_key)
+            SELECT id, pair_id, RANDOM() FROM reminders
+            WHERE id > ? AND pair_id = ? AND is_active = 1
+            """,
+            (last_reminder_id, pair_id)
+        )
+
+    return reminders_count, wishes_count
+
+
+async def iter_reminders(pair_id: int, batch_size: int = 500):
+    # """
+    # Отдаёт напоминания пары пачками по id (для экспорта), не держа всё в памяти.
+    # Каждый элемент пачки — (id, text, photo_file_id, is_active).
+    # """
+    last_id = 0
+    while True:
+        rows = await _fetchall(
+            """
+            SELECT id, text, photo_file_id, is_active FROM reminders
+            WHERE pair_id = ? AND id > ?
+            ORDER BY id LIMIT ?
+            """,
+            (pair_id, last_id, batch_size)
+        )
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+async def iter_wishes(pair_id: int, batch_size: int = 500):
+    # """
+    # Отдаёт хотелки пары пачками по id (для экспорта).
+    # Каждый элемент пачки — (id, user_id, text, photo_file_id, status, created_at).
+    # """
+    last_id = 0
+    while True:
+        rows = await _fetchall(
             """
+            SELECT id, user_id, text, photo_file_id, status, created_at FROM wishes
+            WHERE pair_id = ? AND id > ?
+            ORDER BY id LIMIT ?
+            """,
+            (pair_id, last_id, batch_size)
         )
-        await db.commit()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
@@ -0,0 +1,194 @@
+import asyncio
+import logging
+from typing import NamedTuple
+
+from aiogram.methods import SendMediaGroup
+from aiogram.types import InputMediaPhoto
+
+from albums import MEDIA_GROUP_LIMIT
+from keyboards import get_wish_status_keyboard
+from metrics import metrics
+from sender import SendQueue
+
+logger = logging.getLogger(__name__)
+
+# Telegram: подпись — до 1024 символов, сообщение — до 4096
+CAPTION_LIMIT = 1024
+MESSAGE_LIMIT = 4096
+
+# Сколько текста хотелки показывать в строке сводки (меньше, если хотелок много)
+PREVIEW_CHARS = 150
+MIN_PREVIEW_CHARS = 20
+
+
+class WishNotice(NamedTuple):
+    wish_id: int
+    text: str | None
+    photo_file_id: str | None
+    # все фото, если хотелка пришла альбомом
+    media: tuple[str, ...] = ()
+
+
+def _truncate(text: str, limit: int) -> str:
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+def _preview(text: str | None, limit: int = PREVIEW_CHARS) -> str:
+    if not text:
+        return ""
+    return _truncate(" ".join(text.split()), limit)
+
+
+class WishDigest:
+    # """
+    # Уведомления админу о новых хотелках со сводкой.
+
+    # Первая хотелка открывает окно window секунд; всё, что пришло за окно,
+    # уходит админу одним сообщением со списком (#ID и начало текста),
+    # а фото — одним альбомом (send_media_group) вместо отдельного запроса
+    # на каждое. Одна хотелка за окно — обычное уведомление с кнопками статуса.
+    # window <= 0 — "мгновенно": каждая хотелка уходит сразу, как раньше.
+    # Буфер сбрасывается раньше окна, если набралось max_items хотелок.
+    # """
+
+    def __init__(self, send_queue: SendQueue, window: float = 60, max_items: int = 20):
+        self.send_queue = send_queue
+        self.window = window
+        self.max_items = max_items
+        self._buffers: dict[int, list[WishNotice]] = {}
+        self._timers: dict[int, asyncio.TimerHandle] = {}
+
+    def add(self, admin_id: int, notice: WishNotice, window: float | None = None) -> None:
+        # """
+        # Ставит хотелку в сводку админа. window — окно этого админа
+        # (/wish_digest), None — общее self.window. Ничего не ждёт.
+        # """
+        window = self.window if window is None else window
+        if window <= 0:
+            self._send(admin_id, [notice])
+            return
+
+        buffer = self._buffers.setdefault(admin_id, [])
+        buffer.append(notice)
+        if len(buffer) >= self.max_items:
+            self.flush(admin_id)
+        elif admin_id not in self._timers:
+            self._timers[admin_id] = asyncio.get_running_loop().call_later(
+                window, self.flush, admin_id
+            )
+
+    def flush(self, admin_id: int) -> None:
+        # """Отправляет накопленное админу сейчас же."""
+        timer = self._timers.pop(admin_id, None)
+        if timer is not None:
+            timer.cancel()
+        notices = self._buffers.pop(admin_id, None)
+        if notices:
+            self._send(admin_id, notices)
+
+    def stop(self) -> None:
+        # """Сбрасывает все буферы (до остановки очереди отправки)."""
+        for admin_id in list(self._buffers):
+            self.flush(admin_id)
+
+    def pending(self) -> int:
+        return sum(len(buffer) for buffer in self._buffers.values())
+
+    def _send(self, admin_id: int, notices: list[WishNotice]) -> None:
+        if len(notices) == 1:
+            requests = self._send_single(admin_id, notices[0])
+        else:
+            requests = self._send_digest(admin_id, notices)
+
+        metrics.inc("bot_wish_notices_total", len(notices))
+        metrics.inc("bot_wish_notice_requests_total", requests)
+        logger.info(
+            "Уведомление о хотелках",
+            extra={"admin_id": admin_id, "wishes": [n.wish_id for n in notices],
+                   "requests": requests},
+        )
+
+    def _send_single(self, admin_id: int, notice: WishNotice) -> int:
+        header = f"✨ Новая хотелка #{notice.wish_id}\n\n"
+        if notice.text:
+            header += f"Текст:\n{notice.text}\n"
+
+        # кнопки статуса: админ сразу отмечает "в планах" / "сделано" / "не будет"
+        keyboard = get_wish_status_keyboard(notice.wish_id)
+
+        if len(notice.media) > 1:
+            # альбом: подпись — у первого фото; к альбому кнопки не прикрепить,
+            # поэтому они идут следом отдельным сообщением
+            self.send_queue.enqueue(SendMediaGroup(
+                chat_id=admin_id,
+                media=[
+                    InputMediaPhoto(
+                        media=file_id, caption=_truncate(header, CAPTION_LIMIT) if i == 0 else None
+                    )
+                    for i, file_id in enumerate(notice.media[:MEDIA_GROUP_LIMIT])
+                ],
+            ))
+            self.send_queue.send_message(
+                chat_id=admin_id,
+                text=f"Статус хотелки #{notice.wish_id}:",
+                reply_markup=keyboard
+            )
+            return 2
+
+        if notice.photo_file_id:
+            # если есть фото — шлём фото с подписью (длинная хотелка обрезается)
+            self.send_queue.send_photo(
+                chat_id=admin_id,
+                photo=notice.photo_file_id,
+                caption=_truncate(header, CAPTION_LIMIT),
+                reply_markup=keyboard
+            )
+        else:
+            self.send_queue.send_message(
+                chat_id=admin_id,
+                text=_truncate(header, MESSAGE_LIMIT),
+                reply_markup=keyboard
+            )
+        return 1
+
+    def _send_digest(self, admin_id: int, notices: list[WishNotice]) -> int:
+        # все фото всех хотелок по порядку; подпись с #ID — у первого фото хотелки
+        photos: list[tuple[str, str | None]] = []
+        for notice in notices:
+            files = notice.media or ((notice.photo_file_id,) if notice.photo_file_id else ())
+            for i, file_id in enumerate(files):
+                caption = f"#{notice.wish_id} {_preview(notice.text, CAPTION_LIMIT - 16)}".rstrip()
+                photos.append((file_id, caption if i == 0 else None))
+        # запас на заголовок и подсказку внизу, в строке — на #ID и 📷×N
+        # (не меньше MIN_PREVIEW_CHARS — длину сводки держит WISH_DIGEST_MAX в config.py)
+        preview_chars = max(min(PREVIEW_CHARS, (MESSAGE_LIMIT - 200) // len(notices) - 20),
+                            MIN_PREVIEW_CHARS)
+
+        lines = [f"✨ Новые хотелки: {len(notices)}", ""]
+        for notice in notices:
+            line = f"#{notice.wish_id}"
+            if len(notice.media) > 1:
+                line += f" 📷×{len(notice.media)}"
+            elif notice.photo_file_id:
+                line += " 📷"
+            preview = _preview(notice.text, preview_chars)
+            if preview:
+                line += f" — {preview}"
+            lines.append(line)
+        lines += ["", "Статус: /wish_status ID статус, все новые — /wishes new"]
+        self.send_queue.send_message(chat_id=admin_id, text="\n".join(lines))
+        requests = 1
+
+        # альбомы по 10 фото; одно фото (или хвост из одного) альбомом не отправить
+        for start in range(0, len(photos), MEDIA_GROUP_LIMIT):
+            chunk = photos[start:start + MEDIA_GROUP_LIMIT]
+            if len(chunk) == 1:
+                file_id, caption = chunk[0]
+                self.send_queue.send_photo(chat_id=admin_id, photo=file_id, caption=caption)
+            else:
+                self.send_queue.enqueue(SendMediaGroup(
+                    chat_id=admin_id,
+                    media=[InputMediaPhoto(media=f, caption=c) for f, c in chunk],
+                ))
+            requests += 1
+        return requests
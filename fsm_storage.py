@@ -0,0 +1,91 @@
+from typing import Any, Mapping
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from db import get_fsm_state, load_fsm_states, save_fsm_state, take_legacy_waiting_wish_chats
+from states import WishForm
+
+
+class SQLiteStorage(BaseStorage):
+    # """
+    # FSM-хранилище aiogram поверх таблицы fsm_states.
+
+    # Как кэш пар в db.py: всё грузится в память один раз (load()),
+    # get_state/get_data отвечают из памяти без обращения к БД,
+    # а set_state/set_data пишут в БД и, после коммита, в кэш.
+    # Поэтому фильтр по состоянию для "чужого" сообщения ничего не стоит.
+
+    # cached=False — без кэша, каждое чтение идёт в БД: так состояние,
+    # выставленное одним процессом бота, видят и остальные (MULTI_INSTANCE).
+    # """
+
+    def __init__(self, cached: bool = True):
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self.cached = cached
+        self._cache: dict[str, tuple[str | None, dict[str, Any]]] = {}
+
+    async def load(self) -> None:
+        if self.cached:
+            self._cache = {key: (state, data) for key, state, data in await load_fsm_states()}
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        raw_key = self.key_builder.build(key)
+        state = state.state if isinstance(state, State) else state
+        data = (await self._get(raw_key))[1]
+        await self._save(raw_key, state, data)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        return (await self._get(self.key_builder.build(key)))[0]
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        raw_key = self.key_builder.build(key)
+        state = (await self._get(raw_key))[0]
+        await self._save(raw_key, state, dict(data))
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        return dict((await self._get(self.key_builder.build(key)))[1])
+
+    async def close(self) -> None:
+        pass
+
+    async def _get(self, raw_key: str) -> tuple[str | None, dict[str, Any]]:
+        if not self.cached:
+            return await get_fsm_state(raw_key)
+        return self._cache.get(raw_key, (None, {}))
+
+    async def _save(self, raw_key: str, state: str | None, data: dict[str, Any]) -> None:
+        await save_fsm_state(raw_key, state, data)
+        if not self.cached:
+            return
+        if state is None and not data:
+            self._cache.pop(raw_key, None)
+        else:
+            self._cache[raw_key] = (state, data)
+
+
+async def create_storage(kind: str, cached: bool = True) -> BaseStorage:
+    # """
+    # FSM-хранилище по настройке FSM_STORAGE: "sqlite" (переживает рестарт)
+    # или "memory" (для тестов и бенчмарков). cached — см. SQLiteStorage.
+    # """
+    if kind == "memory":
+        return MemoryStorage()
+    if kind != "sqlite":
+        raise ValueError(f"Неизвестное FSM_STORAGE: {kind}")
+    storage = SQLiteStorage(cached)
+    await storage.load()
+    return storage
+
+
+async def migrate_legacy_waiting_wish(storage: BaseStorage, bot_id: int) -> int:
+    # """
+    # Переносит старый флаг pairs.waiting_wish в состояние WishForm.waiting.
+    # Получатель пишет боту в личку, поэтому chat_id = user_id.
+    # """
+    chats = await take_legacy_waiting_wish_chats()
+    for chat_id in chats:
+        key = StorageKey(bot_id=bot_id, chat_id=chat_id, user_id=chat_id)
+        await storage.set_state(key, WishForm.waiting)
+    return len(chats)
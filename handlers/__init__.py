@@ -1,10 +1,17 @@
 from aiogram import Dispatcher
 
+from albums import MediaGroupMiddleware
+from config import MEDIA_GROUP_WAIT
+
 from .common import router as common_router
 from .admin import router as admin_router
+from .transfer import router as transfer_router
 
 
 def register_handlers(dp: Dispatcher):
     # """Регистрирует все роутеры (группы хэндлеров) в диспетчере."""
+    # альбом доходит до хэндлеров одним сообщением (data["album"])
+    dp.message.outer_middleware(MediaGroupMiddleware(MEDIA_GROUP_WAIT))
     dp.include_router(common_router)
-    dp.include_router(admin_router)
\ No newline at end of file
+    dp.include_router(admin_router)
+    dp.include_router(transfer_router)
\ No newline at end of file
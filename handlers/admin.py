@@ -1,22 +1,64 @@
+import html
+import re
+from datetime import datetime, timezone
+
+import pytz
+
 from aiogram import Router, F, Bot
-from aiogram.types import Message
-from aiogram.filters import Command
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup
+from aiogram.filters import Command, CommandObject
+from aiogram.utils.deep_linking import create_start_link
 
-from config import ADMIN_ID
+from config import ADMIN_IDS, SCHEDULE_TZ
 from db import (
     add_reminder,
-    list_reminders,
+    list_reminders_page,
     deactivate_reminder,
-    get_girlfriend_chat_id,
-    get_random_active_reminder,
+    get_or_create_pair,
+    enqueue_next_reminder,
     activate_all_reminders,
-    list_wishes,
+    list_wishes_page,
+    set_wish_status,
+    get_wish_counters,
+    get_wish_digest_window,
+    set_wish_digest_window,
+    WISH_STATUSES,
+    create_invite,
+    search,
+    list_schedules,
+    SEARCH_MARK_START,
+    SEARCH_MARK_END,
+    get_app_state_stats,
+    get_pair_cache_stats,
 )
+from metrics import metrics
+from outbox import OutboxWorker
+from scheduler import (
+    ReminderScheduler,
+    DueReminderLoop,
+    parse_time,
+    parse_days,
+    parse_local_datetime,
+    pair_timezone,
+    format_days,
+    EVERY_DAY,
+)
+from sender import SendQueue
+from leader import LeaderElection
+from albums import album_photos
+from digest import WishDigest
 from keyboards import (
     ADMIN_BTN_SEND,
     ADMIN_BTN_LIST,
     ADMIN_BTN_RESET,
     ADMIN_BTN_WISHES,
+    PageCallback,
+    get_page_keyboard,
+    SearchCallback,
+    get_search_keyboard,
+    WishStatusCallback,
+    get_wish_status_keyboard,
+    WISH_STATUS_LABELS,
 )
 
 router = Router()
@@ -24,20 +66,42 @@ router = Router()
 
 def is_admin(message: Message) -> bool:
     # """Проверяет, является ли пользователь админом."""
-    return message.from_user and message.from_user.id == ADMIN_ID
+    return message.from_user and message.from_user.id in ADMIN_IDS
+
+
+# --- /invite ---
+
+
+@router.message(Command("invite"))
+async def invite_handler(message: Message, bot: Bot):
+    # """
+    # /invite — выдаёт ссылку-приглашение для получателя (только админ).
+    # Кто откроет ссылку, тот и станет получателем напоминаний этого админа.
+    # """
+    if not is_admin(message):
+        return await message.answer("Эта команда только для админа 😇")
+
+    code = await create_invite(message.from_user.id)
+    link = await create_start_link(bot, code)
+    await message.answer(
+        "Отправь эту ссылку своей девушке 💌\n\n"
+        f"{link}\n\n"
+        "Ссылка одноразовая, новая /invite делает старую недействительной."
+    )
 
 
 # --- /add ---
 
 
 @router.message(Command("add"))
-async def add_handler(message: Message):
+async def add_handler(message: Message, album: list[Message] | None = None):
     # """
     # /add — добавить напоминание (только админ).
 
     # Работает:
     # - как текст: /add я тебя люблю
     # - как фото с подписью: (фото) + подпись '/add ...'
+    # - как альбом, где у одного из фото подпись '/add ...' — сохраняются все фото
     # """
     if not is_admin(message):
         return await message.answer("Эта команда только для админа 😇")
@@ -60,17 +124,20 @@ async def add_handler(message: Message):
 
     text = parts[1].strip()
 
-    photo_file_id = None
-    if message.photo:
-        largest_photo = message.photo[-1]
-        photo_file_id = largest_photo.file_id
+    photos = album_photos(message, album)
+    photo_file_id = photos[0] if photos else None
 
-    reminder_id = await add_reminder(text=text, photo_file_id=photo_file_id)
+    pair = await get_or_create_pair(message.from_user.id)
+    reminder_id = await add_reminder(
+        pair_id=pair.id, text=text, photo_file_id=photo_file_id, media=photos
+    )
 
     desc = []
     if text:
         desc.append("📝 текст")
-    if photo_file_id:
+    if len(photos) > 1:
+        desc.append(f"🖼 альбом из {len(photos)} фото")
+    elif photo_file_id:
         desc.append("🖼 фото")
     desc_str = " + ".join(desc) if desc else "пустое напоминание"
 
@@ -81,22 +148,92 @@ async def add_handler(message: Message):
     )
 
 
-# --- /list + кнопка 'Список напоминаний' ---
+# --- /add_at ---
 
+# дата и время в начале аргументов: "2026-10-20 18:30", "20.10.2026 18:30", "20.10 18:30", "18:30"
+_ADD_AT_RE = re.compile(
+    r"^((?:\d{4}-\d{2}-\d{2}|\d{1,2}\.\d{1,2}(?:\.\d{4})?)\s+)?(\d{1,2}:\d{2})\s+(.+)$",
+    re.DOTALL,
+)
 
-@router.message(Command("list"))
-@router.message(F.text == ADMIN_BTN_LIST)
-async def list_handler(message: Message):
-    # """Показывает список напоминаний (только админ)."""
+
+@router.message(Command("add_at"))
+async def add_at_handler(
+    message: Message,
+    command: CommandObject,
+    due_loop: DueReminderLoop,
+    album: list[Message] | None = None,
+):
+    # """
+    # /add_at <дата время> <текст> — разовое напоминание на конкретное время (только админ).
+    # Время местное — в таймзоне расписания пары. Можно фото или альбом с такой подписью.
+    # """
     if not is_admin(message):
         return await message.answer("Эта команда только для админа 😇")
 
-    reminders = await list_reminders()
+    usage = (
+        "Формат: `/add_at 20.10 18:30 текст`\n"
+        "Дата: `2026-10-20`, `20.10.2026`, `20.10` или без даты — ближайшее такое время.\n"
+        "Можно отправить фото с такой подписью."
+    )
+    match = _ADD_AT_RE.match((command.args or "").strip())
+    if not match:
+        return await message.answer(usage, parse_mode="Markdown")
+
+    pair = await get_or_create_pair(message.from_user.id)
+    tz = await pair_timezone(pair.id, SCHEDULE_TZ)
+    now = datetime.now(timezone.utc)
+    when = (match.group(1) or "") + match.group(2)
+    send_at = parse_local_datetime(when, tz, now)
+    if send_at is None:
+        return await message.answer(f"Не понял дату и время: {when} 🤔")
+    if send_at <= now:
+        return await message.answer("Это время уже прошло 🤔")
+
+    photos = album_photos(message, album)
+    reminder_id = await add_reminder(
+        pair_id=pair.id,
+        text=match.group(3).strip(),
+        photo_file_id=photos[0] if photos else None,
+        send_at=send_at.replace(tzinfo=None).isoformat(),
+        media=photos,
+    )
+    # вдруг это раньше, чем то, до чего сейчас спит цикл
+    due_loop.wake()
+
+    local = send_at.astimezone(pytz.timezone(tz))
+    text = (
+        f"Напоминание сохранено ✅\n"
+        f"ID: {reminder_id}\n"
+        f"Отправлю {local:%d.%m.%Y в %H:%M} ({tz})"
+    )
+    if pair.recipient_chat_id is None:
+        text += (
+            "\n\nПолучателя пока нет — напоминание подождёт и уйдёт, "
+            "как только девушка подключится по /invite."
+        )
+    await message.answer(text)
+
+
+# --- /list + кнопка 'Список напоминаний' ---
+
+# Сколько строк показываем на одной странице списков
+PAGE_SIZE = 20
+
+
+async def render_reminders_page(
+    pair_id: int, before_id: int | None = None, after_id: int | None = None
+) -> tuple[str | None, InlineKeyboardMarkup | None]:
+    # """Собирает текст и кнопки одной страницы напоминаний (None — пусто)."""
+    reminders, has_newer, has_older = await list_reminders_page(
+        pair_id, before_id=before_id, after_id=after_id, limit=PAGE_SIZE
+    )
     if not reminders:
-        return await message.answer("Пока нет ни одного напоминания.")
+        return None, None
 
+    zone = pytz.timezone(await pair_timezone(pair_id, SCHEDULE_TZ))
     lines = []
-    for r_id, text, photo_file_id, is_active in reminders:
+    for r_id, text, photo_file_id, is_active, send_at in reminders:
         status = "✅" if is_active else "🚫"
         if photo_file_id and text:
             kind = "🖼+📝"
@@ -109,9 +246,32 @@ async def list_handler(message: Message):
         if len(short_text) > 40:
             short_text = short_text[:37] + "..."
 
-        lines.append(f"{r_id}. {status} {kind} {short_text}")
+        when = ""
+        if send_at:
+            local = datetime.fromisoformat(send_at).replace(tzinfo=pytz.utc).astimezone(zone)
+            when = f" ⏰ {local:%d.%m %H:%M}"
+
+        lines.append(f"{r_id}. {status}{when} {kind} {short_text}")
+
+    keyboard = get_page_keyboard(
+        "reminders", reminders[0][0], reminders[-1][0], has_newer, has_older
+    )
+    return "Твои напоминания:\n\n" + "\n".join(lines), keyboard
 
-    await message.answer("Твои напоминания:\n\n" + "\n".join(lines))
+
+@router.message(Command("list"))
+@router.message(F.text == ADMIN_BTN_LIST)
+async def list_handler(message: Message):
+    # """Показывает первую страницу напоминаний (только админ)."""
+    if not is_admin(message):
+        return await message.answer("Эта команда только для админа 😇")
+
+    pair = await get_or_create_pair(message.from_user.id)
+    text, keyboard = await render_reminders_page(pair.id)
+    if text is None:
+        return await message.answer("Пока нет ни одного напоминания.")
+
+    await message.answer(text, reply_markup=keyboard)
 
 
 # --- /delete ---
@@ -136,7 +296,8 @@ async def delete_handler(message: Message):
     except ValueError:
         return await message.answer("ID должен быть числом.")
 
-    success = await deactivate_reminder(reminder_id)
+    pair = await get_or_create_pair(message.from_user.id)
+    success = await deactivate_reminder(pair.id, reminder_id)
     if success:
         await message.answer(f"Напоминание с ID {reminder_id} отключено 🚫")
     else:
@@ -148,47 +309,34 @@ async def delete_handler(message: Message):
 
 @router.message(Command("send_random"))
 @router.message(F.text == ADMIN_BTN_SEND)
-async def send_random_handler(message: Message, bot: Bot):
+async def send_random_handler(message: Message, outbox: OutboxWorker):
     # """
-    # Отправляет девушке случайное активное напоминание.
-    # После отправки помечает его как неактивное.
+    # Ставит в outbox случайное активное напоминание для девушки.
+    # Выбор, пометка "использовано" и постановка в очередь — одна транзакция,
+    # отправит фоновый воркер.
     # """
     if not is_admin(message):
         return await message.answer("Эта команда только для админа 😇")
 
-    girlfriend_chat_id = await get_girlfriend_chat_id()
-    if girlfriend_chat_id is None:
+    pair = await get_or_create_pair(message.from_user.id)
+    if pair.recipient_chat_id is None:
         return await message.answer(
             "Я ещё не знаю chat_id девушки 🥺\n"
-            "Пусть она напишет этому боту команду /start хотя бы один раз."
+            "Отправь ей ссылку из /invite, пусть она откроет её хотя бы один раз."
         )
 
-    reminder = await get_random_active_reminder()
-    if reminder is None:
+    r_id = await enqueue_next_reminder(pair)
+    if r_id is None:
         return await message.answer(
             "Нет активных напоминаний 😢\n"
             "Добавь хотя бы одно через `/add`.",
             parse_mode="Markdown",
         )
 
-    r_id, text, photo_file_id = reminder
-
-    if photo_file_id:
-        await bot.send_photo(
-            chat_id=girlfriend_chat_id,
-            photo=photo_file_id,
-            caption=text or None,
-        )
-    else:
-        await bot.send_message(
-            chat_id=girlfriend_chat_id,
-            text=text or "❤️",
-        )
-
-    await deactivate_reminder(r_id)
+    outbox.wake()
 
     await message.answer(
-        f"Случайное напоминание (ID {r_id}) отправлено девушке 💌\n"
+        f"Случайное напоминание (ID {r_id}) отправляется девушке 💌\n"
         f"И помечено как использованное."
     )
 
@@ -205,7 +353,8 @@ async def reset_handler(message: Message):
     if not is_admin(message):
         return await message.answer("Эта команда только для админа 😇")
 
-    count = await activate_all_reminders()
+    pair = await get_or_create_pair(message.from_user.id)
+    count = await activate_all_reminders(pair.id)
     await message.answer(
         f"Готово ✅\n"
         f"Активировал(а) {count} напоминаний.\n\n"
@@ -216,21 +365,35 @@ async def reset_handler(message: Message):
 # --- /wishes + кнопка 'Хотелки' ---
 
 
-@router.message(Command("wishes"))
-@router.message(F.text == ADMIN_BTN_WISHES)
-async def wishes_list_handler(message: Message):
-    # """
-    # Показывает список хотелок девушки (только админ).
-    # """
-    if not is_admin(message):
-        return await message.answer("Эта команда только для админа 😇")
+# Как статус можно написать в командах
+_WISH_STATUS_ALIASES = {
+    **{status: status for status in WISH_STATUSES},
+    "новая": "new", "новые": "new",
+    "план": "planned", "планы": "planned", "в_планах": "planned",
+    "сделано": "done", "готово": "done",
+    "отказ": "rejected", "не_будет": "rejected", "нет": "rejected",
+}
+
+
+def parse_wish_status(value: str) -> str | None:
+    return _WISH_STATUS_ALIASES.get(value.strip().lower())
 
-    wishes = await list_wishes(limit=20)
+
+async def render_wishes_page(
+    pair_id: int,
+    before_id: int | None = None,
+    after_id: int | None = None,
+    status: str | None = None,
+) -> tuple[str | None, InlineKeyboardMarkup | None]:
+    # """Собирает текст и кнопки одной страницы хотелок (None — пусто)."""
+    wishes, has_newer, has_older = await list_wishes_page(
+        pair_id, before_id=before_id, after_id=after_id, limit=PAGE_SIZE, status=status
+    )
     if not wishes:
-        return await message.answer("Пока нет ни одной хотелки 💭")
+        return None, None
 
     lines = []
-    for w_id, user_id, text, photo_file_id, status, created_at in wishes:
+    for w_id, user_id, text, photo_file_id, w_status, created_at in wishes:
         if photo_file_id and text:
             kind = "🖼+📝"
         elif photo_file_id:
@@ -242,6 +405,437 @@ async def wishes_list_handler(message: Message):
         if len(short_text) > 40:
             short_text = short_text[:37] + "..."
 
-        lines.append(f"#{w_id} [{status}] {kind} {short_text} ({created_at})")
+        status_icon = WISH_STATUS_LABELS.get(w_status, w_status).split()[0]
+        lines.append(f"#{w_id} {status_icon} {kind} {short_text} ({created_at[:10]})")
+
+    keyboard = get_page_keyboard(
+        "wishes", wishes[0][0], wishes[-1][0], has_newer, has_older, status or ""
+    )
+    title = "Список хотелок"
+    if status:
+        title += f" — {WISH_STATUS_LABELS[status]}"
+    return title + ":\n\n" + "\n".join(lines), keyboard
+
+
+@router.message(Command("wishes"))
+@router.message(F.text == ADMIN_BTN_WISHES)
+async def wishes_list_handler(message: Message, command: CommandObject | None = None):
+    # """
+    # /wishes [статус] — первая страница хотелок девушки (только админ).
+    # Статус: new / planned / done / rejected (или по-русски: новые, план, сделано, отказ).
+    # """
+    if not is_admin(message):
+        return await message.answer("Эта команда только для админа 😇")
+
+    status = None
+    if command is not None and command.args:
+        status = parse_wish_status(command.args)
+        if status is None:
+            return await message.answer(
+                "Не знаю такой статус 🤔\nМожно: new, planned, done, rejected"
+            )
+
+    pair = await get_or_create_pair(message.from_user.id)
+    text, keyboard = await render_wishes_page(pair.id, status=status)
+    if text is None:
+        if status is not None:
+            return await message.answer(f"Хотелок со статусом «{WISH_STATUS_LABELS[status]}» нет")
+        return await message.answer("Пока нет ни одной хотелки 💭")
+
+    await message.answer(text, reply_markup=keyboard)
+
+
+@router.message(Command("wish_status"))
+async def wish_status_handler(message: Message, command: CommandObject):
+    # """/wish_status ID статус — меняет статус хотелки (только админ)."""
+    if not is_admin(message):
+        return await message.answer("Эта команда только для админа 😇")
+
+    args = (command.args or "").split()
+    status = parse_wish_status(args[1]) if len(args) == 2 else None
+    if status is None or not args[0].lstrip("#").isdigit():
+        return await message.answer(
+            "Формат: `/wish_status ID статус`\nСтатусы: new, planned, done, rejected",
+            parse_mode="Markdown",
+        )
+
+    wish_id = int(args[0].lstrip("#"))
+    pair = await get_or_create_pair(message.from_user.id)
+    if await set_wish_status(pair.id, wish_id, status) is None:
+        return await message.answer("Такой хотелки нет 🤔")
+    await message.answer(f"Хотелка #{wish_id}: {WISH_STATUS_LABELS[status]}")
+
+
+@router.callback_query(WishStatusCallback.filter())
+async def wish_status_callback_handler(
+    callback: CallbackQuery, callback_data: WishStatusCallback
+):
+    # """Кнопки статуса под уведомлением о новой хотелке."""
+    if callback.from_user.id not in ADMIN_IDS:
+        return await callback.answer("Это только для админа 😇")
+    if callback_data.status not in WISH_STATUSES:
+        return await callback.answer()
+
+    pair = await get_or_create_pair(callback.from_user.id)
+    previous = await set_wish_status(pair.id, callback_data.id, callback_data.status)
+    if previous is None:
+        return await callback.answer("Такой хотелки нет 🤔")
+
+    if previous != callback_data.status:
+        await callback.message.edit_reply_markup(
+            reply_markup=get_wish_status_keyboard(callback_data.id, callback_data.status)
+        )
+    await callback.answer(WISH_STATUS_LABELS[callback_data.status])
+
+
+@router.message(Command("wishes_stats"))
+async def wishes_stats_handler(message: Message):
+    # """/wishes_stats — сколько хотелок в каждом статусе (только админ)."""
+    if not is_admin(message):
+        return await message.answer("Эта команда только для админа 😇")
+
+    pair = await get_or_create_pair(message.from_user.id)
+    counters = await get_wish_counters(pair.id)
+    total = sum(counters.values())
+    if not total:
+        return await message.answer("Пока нет ни одной хотелки 💭")
+
+    lines = [f"{WISH_STATUS_LABELS[s]}: {counters.get(s, 0)}" for s in WISH_STATUSES]
+    # статусы не из списка (например, из импорта) тоже показываем
+    lines += [f"{s}: {n}" for s, n in counters.items() if s not in WISH_STATUS_LABELS and n]
+    await message.answer(
+        "Хотелки:\n\n" + "\n".join(lines) + f"\n\nВсего: {total}\n"
+        "Открытых: " + str(counters.get("new", 0) + counters.get("planned", 0))
+    )
+
+
+# Окно сводки хотелок не больше часа — иначе админ узнает о хотелке слишком поздно
+MAX_DIGEST_WINDOW = 3600
+
+
+@router.message(Command("wish_digest"))
+async def wish_digest_handler(
+    message: Message, command: CommandObject, wish_digest: WishDigest
+):
+    # """
+    # /wish_digest [сразу | секунды] — как присылать новые хотелки (только админ):
+    # сразу каждую или одной сводкой за окно. Без аргумента — текущая настройка.
+    # """
+    if not is_admin(message):
+        return await message.answer("Эта команда только для админа 😇")
+
+    admin_id = message.from_user.id
+    arg = (command.args or "").strip().lower()
+    if not arg:
+        window = await get_wish_digest_window(admin_id)
+        window = wish_digest.window if window is None else window
+        current = "сразу" if window <= 0 else f"сводкой раз в {window:g} с"
+        return await message.answer(
+            f"Новые хотелки приходят {current}.\n\n"
+            "Поменять: /wish_digest сразу или /wish_digest 60 (секунды, до часа)"
+        )
+
+    if arg in ("сразу", "instant", "0"):
+        window = 0.0
+    elif arg.isdigit() and 0 < int(arg) <= MAX_DIGEST_WINDOW:
+        window = float(arg)
+    else:
+        return await message.answer("Формат: /wish_digest сразу или /wish_digest 60 (секунды, до часа)")
+
+    await set_wish_digest_window(admin_id, window)
+    if window <= 0:
+        # то, что уже ждёт в сводке, — тоже сразу
+        wish_digest.flush(admin_id)
+        return await message.answer("Готово: каждая хотелка будет приходить сразу ⚡️")
+    await message.answer(f"Готово: хотелки будут приходить сводкой раз в {window:g} с 📬")
+
+
+# --- листание списков (инлайн-кнопки) ---
+
+
+@router.callback_query(PageCallback.filter())
+async def page_callback_handler(callback: CallbackQuery, callback_data: PageCallback):
+    # """
+    # Кнопки "новее/старее" под /list и /wishes: перерисовывает то же сообщение.
+    # """
+    if callback.from_user.id not in ADMIN_IDS:
+        return await callback.answer("Это только для админа 😇")
+
+    pair = await get_or_create_pair(callback.from_user.id)
+    before_id = callback_data.before or None
+    after_id = callback_data.after or None
 
-    await message.answer("Список хотелок:\n\n" + "\n".join(lines))
+    if callback_data.kind == "wishes":
+        status = callback_data.status if callback_data.status in WISH_STATUSES else None
+        text, keyboard = await render_wishes_page(pair.id, before_id, after_id, status)
+    else:
+        text, keyboard = await render_reminders_page(pair.id, before_id, after_id)
+
+    if text is None:
+        return await callback.answer("Дальше ничего нет")
+
+    await callback.message.edit_text(text, reply_markup=keyboard)
+    await callback.answer()
+
+
+# --- расписание рассылки ---
+
+
+@router.message(Command("schedule"))
+async def schedule_handler(message: Message):
+    # """/schedule — показывает расписания рассылки своей пары (только админ)."""
+    if not is_admin(message):
+        return await message.answer("Эта команда только для админа 😇")
+
+    pair = await get_or_create_pair(message.from_user.id)
+    schedules = await list_schedules(pair.id)
+
+    lines = []
+    for s in schedules:
+        next_local = (
+            datetime.fromisoformat(s.next_fire_at)
+            .replace(tzinfo=pytz.utc)
+            .astimezone(pytz.timezone(s.tz))
+        )
+        lines.append(
+            f"#{s.id}: {s.time_of_day} {format_days(s.days)} ({s.tz}), "
+            f"следующее — {next_local:%d.%m %H:%M}"
+        )
+
+    help_text = (
+        "\n\nДобавить: `/schedule_add 09:30 пн-пт Europe/Moscow`\n"
+        "(дни и таймзона необязательны)\n"
+        "Удалить: `/schedule_del ID`"
+    )
+    if not lines:
+        return await message.answer(
+            "Расписаний нет — напоминания приходят только по /send_random." + help_text,
+            parse_mode="Markdown",
+        )
+    await message.answer(
+        "Расписание напоминаний:\n\n" + "\n".join(lines) + help_text,
+        parse_mode="Markdown",
+    )
+
+
+@router.message(Command("schedule_add"))
+async def schedule_add_handler(
+    message: Message, command: CommandObject, scheduler: ReminderScheduler
+):
+    # """
+    # /schedule_add HH:MM [дни] [таймзона] — ещё одно время рассылки (только админ).
+    # Дни: пн-пт, сб,вс, 1-5, * (по умолчанию каждый день).
+    # Таймзона по умолчанию — как у прошлого расписания пары.
+    # """
+    if not is_admin(message):
+        return await message.answer("Эта команда только для админа 😇")
+
+    args = (command.args or "").split()
+    time_of_day = parse_time(args[0]) if args else None
+    if time_of_day is None:
+        return await message.answer(
+            "Формат: `/schedule_add 09:30 пн-пт Europe/Moscow`", parse_mode="Markdown"
+        )
+
+    pair = await get_or_create_pair(message.from_user.id)
+    existing = await list_schedules(pair.id)
+    days = EVERY_DAY
+    tz = existing[0].tz if existing else scheduler.default_tz
+
+    for arg in args[1:]:
+        if "/" in arg or arg.upper() == "UTC":
+            if arg not in pytz.all_timezones_set:
+                return await message.answer(f"Не знаю таймзону {arg} 🤔")
+            tz = arg
+        else:
+            days = parse_days(arg)
+            if days is None:
+                return await message.answer(f"Не понял дни недели: {arg} 🤔")
+
+    schedule = await scheduler.add(pair.id, time_of_day, days, tz)
+    await message.answer(
+        f"Готово ✅ Расписание #{schedule.id}: {time_of_day} {format_days(days)} ({tz})"
+    )
+
+
+@router.message(Command("schedule_del"))
+async def schedule_del_handler(
+    message: Message, command: CommandObject, scheduler: ReminderScheduler
+):
+    # """/schedule_del ID — удаляет расписание (только админ)."""
+    if not is_admin(message):
+        return await message.answer("Эта команда только для админа 😇")
+
+    arg = (command.args or "").strip().lstrip("#")
+    if not arg.isdigit():
+        return await message.answer("Формат: `/schedule_del ID`", parse_mode="Markdown")
+
+    pair = await get_or_create_pair(message.from_user.id)
+    if not await scheduler.delete(pair.id, int(arg)):
+        return await message.answer("Такого расписания нет 🤔")
+    await message.answer(f"Расписание #{arg} удалено")
+
+
+# --- /search ---
+
+# Результатов на одной странице поиска
+SEARCH_PAGE_SIZE = 10
+
+# Запрос едет в callback_data кнопок (лимит Telegram — 64 байта),
+# поэтому длинный запрос обрезается по словам
+SEARCH_QUERY_MAX_BYTES = 48
+
+
+def normalize_search_query(raw: str) -> str:
+    # """Оставляет только слова (без знаков и операторов FTS5), сколько влезет в кнопку."""
+    query = ""
+    for word in re.findall(r"\w+", raw.lower()):
+        candidate = f"{query} {word}" if query else word
+        if len(candidate.encode()) > SEARCH_QUERY_MAX_BYTES:
+            break
+        query = candidate
+    return query
+
+
+def _highlight(snippet: str) -> str:
+    # экранируем текст хотелки/напоминания, а маркеры FTS превращаем в жирный шрифт
+    return (
+        html.escape(snippet)
+        .replace(SEARCH_MARK_START, "<b>")
+        .replace(SEARCH_MARK_END, "</b>")
+    )
+
+
+async def render_search_page(
+    pair_id: int, query: str, offset: int = 0
+) -> tuple[str | None, InlineKeyboardMarkup | None]:
+    # """Собирает текст (HTML) и кнопки одной страницы результатов (None — ничего)."""
+    results, has_more = await search(
+        pair_id, query.split(), limit=SEARCH_PAGE_SIZE, offset=offset
+    )
+    if not results:
+        return None, None
+
+    lines = [f"🔎 Поиск: <b>{html.escape(query)}</b>", ""]
+    for number, (kind, item_id, snippet) in enumerate(results, start=offset + 1):
+        label = f"💭 хотелка #{item_id}" if kind == "wish" else f"📝 напоминание {item_id}"
+        lines.append(f"{number}. {label}\n{_highlight(snippet)}")
+
+    keyboard = get_search_keyboard(query, offset, SEARCH_PAGE_SIZE, has_more)
+    return "\n".join(lines), keyboard
+
+
+@router.message(Command("search"))
+async def search_handler(message: Message, command: CommandObject):
+    # """
+    # /search <запрос> — полнотекстовый поиск по напоминаниям и хотелкам (только админ).
+    # Ищет строки, где есть все слова запроса (в том числе как начало слова).
+    # """
+    if not is_admin(message):
+        return await message.answer("Эта команда только для админа 😇")
+
+    query = normalize_search_query(command.args or "")
+    if not query:
+        return await message.answer(
+            "Напиши, что искать: `/search ресторан`", parse_mode="Markdown"
+        )
+
+    pair = await get_or_create_pair(message.from_user.id)
+    text, keyboard = await render_search_page(pair.id, query)
+    if text is None:
+        return await message.answer("Ничего не нашлось 🤷")
+
+    await message.answer(text, reply_markup=keyboard, parse_mode="HTML")
+
+
+@router.callback_query(SearchCallback.filter())
+async def search_callback_handler(callback: CallbackQuery, callback_data: SearchCallback):
+    # """Кнопки "назад/дальше" под результатами поиска."""
+    if callback.from_user.id not in ADMIN_IDS:
+        return await callback.answer("Это только для админа 😇")
+
+    pair = await get_or_create_pair(callback.from_user.id)
+    text, keyboard = await render_search_page(pair.id, callback_data.q, callback_data.offset)
+    if text is None:
+        return await callback.answer("Дальше ничего нет")
+
+    await callback.message.edit_text(text, reply_markup=keyboard, parse_mode="HTML")
+    await callback.answer()
+
+
+# --- /stats_perf ---
+
+
+def _format_top(title: str, name: str, limit: int = 8) -> list[str]:
+    lines = [title]
+    for label, h in metrics.top(name, limit):
+        avg_ms = h.sum / h.count * 1000 if h.count else 0.0
+        lines.append(
+            f"• {label}: {h.count} шт, ср {avg_ms:.1f} мс, макс {h.max * 1000:.1f} мс"
+        )
+    if len(lines) == 1:
+        lines.append("• пока пусто")
+    return lines
+
+
+@router.message(Command("stats_perf"))
+async def stats_perf_handler(message: Message, send_queue: SendQueue):
+    # """
+    # /stats_perf — сводка производительности с момента запуска (только админ):
+    # самые "дорогие" хэндлеры, запросы к БД и к Bot API, очередь отправки, кэши.
+    # Полные гистограммы — на GET /metrics.
+    # """
+    if not is_admin(message):
+        return await message.answer("Эта команда только для админа 😇")
+
+    lines = []
+    lines += _format_top("⏱ Хэндлеры:", "bot_update_duration_seconds")
+    lines.append("")
+    lines += _format_top("🗄 Запросы к БД:", "bot_db_query_duration_seconds")
+    lines.append("")
+    lines += _format_top("📡 Bot API:", "bot_api_request_duration_seconds")
+
+    errors = metrics.counters.get("bot_api_errors_total", {})
+    if errors:
+        lines.append(f"Ошибок Bot API: {int(sum(errors.values()))}")
+
+    q = send_queue.stats()
+    app_state = get_app_state_stats()
+    pairs = get_pair_cache_stats()
+    lines += [
+        "",
+        f"📬 Очередь: {q['depth']} ждут, {q['in_flight']} в полёте, "
+        f"отправлено {q['sent']}, ошибок {q['failed']}, flood wait {q['flood_waits']}",
+        f"Задержка очереди: p50 {q['latency_p50']:.2f} с, p95 {q['latency_p95']:.2f} с",
+        f"💾 Кэш app_state: {app_state['hits']} попаданий / {app_state['misses']} промахов",
+        f"💾 Кэш пар: {pairs['hits']} попаданий / {pairs['misses']} промахов",
+    ]
+    await message.answer("\n".join(lines))
+
+
+# --- /leader ---
+
+
+@router.message(Command("leader"))
+async def leader_handler(message: Message, election: LeaderElection):
+    # """
+    # /leader — какой процесс бота сейчас ведущий (держит аренду и выполняет
+    # рассылки по расписанию, разовые напоминания и резервные копии).
+    # """
+    if not is_admin(message):
+        return await message.answer("Эта команда только для админа 😇")
+
+    lease = await election.status()
+    lines = [f"🖥 Этот процесс: {election.holder} — {'ведущий' if election.is_leader else 'ведомый'}"]
+    if lease is None:
+        lines.append("👑 Ведущего нет: аренда свободна")
+    else:
+        now = datetime.utcnow()
+        left = (datetime.fromisoformat(lease.expires_at) - now).total_seconds()
+        since = datetime.fromisoformat(lease.acquired_at).strftime("%d.%m %H:%M:%S")
+        lines.append(f"👑 Ведущий: {lease.holder} (с {since} UTC)")
+        if left > 0:
+            lines.append(f"Аренда продлена, истекает через {left:.0f} с")
+        else:
+            lines.append(f"Аренда истекла {-left:.0f} с назад — её заберёт первый свободный процесс")
+    await message.answer("\n".join(lines))
@@ -1,50 +1,102 @@
-from aiogram import Router, F, Bot
+import logging
+
+from aiogram import Router, F
 from aiogram.types import Message
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
+from aiogram.fsm.context import FSMContext
 
-from config import ADMIN_ID
+from config import ADMIN_ID, ADMIN_IDS
 from db import (
-    get_girlfriend_chat_id,
-    set_girlfriend_chat_id,
-    is_waiting_wish,
-    set_waiting_wish,
+    get_pair_by_admin,
+    get_pair_by_recipient,
+    accept_invite,
+    set_recipient,
     add_wish,
+    get_wish_digest_window,
+)
+from digest import WishDigest, WishNotice
+from albums import album_caption, album_photos
+from scheduler import DueReminderLoop, ReminderScheduler
+from keyboards import (
+    get_admin_keyboard,
+    get_girlfriend_keyboard,
+    GIRL_BTN_WANT,
 )
-from keyboards import get_admin_keyboard, get_girlfriend_keyboard, GIRL_BTN_WANT
+from states import WishForm
 
 # Роутер для общих команд
 router = Router()
 
+logger = logging.getLogger(__name__)
+
 
 @router.message(Command("start"))
-async def start_handler(message: Message):
+async def start_handler(
+    message: Message,
+    command: CommandObject,
+    scheduler: ReminderScheduler,
+    due_loop: DueReminderLoop | None = None,
+):
     # """
     # /start:
     # - для админа: показывает сервисное сообщение и админскую клавиатуру.
-    # - для девушки: сохраняет её chat_id (если ещё не сохранён) и показывает кнопку "Хочу".
+    # - для девушки: привязывает её chat_id к паре (по ссылке из /invite,
+    #   либо к паре основного ADMIN_ID, если там ещё никого нет)
+    #   и показывает кнопку "Хочу".
     # """
     user_id = message.from_user.id if message.from_user else None
 
-    if user_id == ADMIN_ID:
+    if user_id in ADMIN_IDS:
         await message.answer(
             "Привет, админ! 👨‍💻\n\n"
             "Я готов отправлять напоминания.\n"
             "Команды:\n"
             "/add — добавить напоминание\n"
+            "/add_at — напоминание на конкретное время\n"
             "/list — список напоминаний\n"
             "/delete ID — отключить напоминание\n"
             "/send_random — отправить случайное напоминание девушке\n"
             "/reset — снова активировать все напоминания\n"
-            "/wishes — список хотелок",
+            "/wishes [статус] — список хотелок\n"
+            "/wish_status ID статус — сменить статус хотелки\n"
+            "/wishes_stats — сколько хотелок в каждом статусе\n"
+            "/wish_digest — сводка новых хотелок или сразу\n"
+            "/search — поиск по напоминаниям и хотелкам\n"
+            "/schedule — расписание напоминаний\n"
+            "/invite — ссылка-приглашение для девушки",
             reply_markup=get_admin_keyboard()
         )
         return
 
-    # не админ — потенциально твоя девушка
-    girlfriend_chat_id = await get_girlfriend_chat_id()
-
-    if girlfriend_chat_id is None:
-        await set_girlfriend_chat_id(message.chat.id)
+    # не админ — потенциально чья-то девушка
+    pair = await get_pair_by_recipient(message.chat.id)
+    is_new = False
+
+    if command.args:
+        # пришла по ссылке-приглашению
+        invited = await accept_invite(command.args.strip(), message.chat.id)
+        if invited is None:
+            return await message.answer("Ссылка-приглашение недействительна 🥺")
+        is_new = pair is None or invited.id != pair.id
+        pair = invited
+        logger.info("Приглашение принято", extra={"pair_id": pair.id})
+    elif pair is None:
+        # старое поведение: первая, кто написал /start, — девушка основного админа
+        legacy_pair = await get_pair_by_admin(ADMIN_ID)
+        if legacy_pair is None or legacy_pair.recipient_chat_id is not None:
+            return await message.answer(
+                "Привет! Чтобы пользоваться ботом, нужна ссылка-приглашение 💌"
+            )
+        pair = await set_recipient(legacy_pair, message.chat.id)
+        is_new = True
+        logger.info("Получатель привязан к паре основного админа", extra={"pair_id": pair.id})
+
+    if is_new:
+        # новой получательнице — расписание по умолчанию, если админ ещё не завёл своё
+        await scheduler.add_default(pair.id)
+        if due_loop is not None:
+            # разовые напоминания, ждавшие получателя, — отправить сейчас
+            due_loop.wake()
         await message.answer(
             "Привет! 🥰\n\n"
             "Я бот, которого Серёжа сделал специально для тебя.\n"
@@ -69,22 +121,21 @@ async def whoami_handler(message: Message):
         parse_mode="Markdown"
     )
 
-@router.message(F.text == GIRL_BTN_WANT)
-async def girl_want_button_handler(message: Message):
+# Фильтры ниже проверяются в памяти (текст, id, состояние FSM из кэша хранилища),
+# так что обычное сообщение, которое нас не касается, отсеивается без запросов к БД
+
+@router.message(F.text == GIRL_BTN_WANT, ~F.from_user.id.in_(ADMIN_IDS))
+async def girl_want_button_handler(message: Message, state: FSMContext):
     # """
     # Обрабатывает нажатие кнопки 'Хочу' от девушки.
-    # Переводит бота в режим ожидания хотелки.
+    # Переводит её в состояние WishForm.waiting — ждём хотелку.
     # """
-    # Если вдруг это нажал админ — игнорируем
-    if message.from_user and message.from_user.id == ADMIN_ID:
-        return
-
-    girlfriend_chat_id = await get_girlfriend_chat_id()
-    if girlfriend_chat_id is None or message.chat.id != girlfriend_chat_id:
+    pair = await get_pair_by_recipient(message.chat.id)
+    if pair is None:
         # Неизвестный пользователь — пока ничего не делаем
         return
 
-    await set_waiting_wish(True)
+    await state.set_state(WishForm.waiting)
 
     await message.answer(
         "Напиши, пожалуйста, что ты хочешь 💫\n\n"
@@ -92,44 +143,41 @@ async def girl_want_button_handler(message: Message):
         "Я всё сохраню и передам Серёже 💌"
     )
 
-@router.message(F.from_user.id != ADMIN_ID)  # общий обработчик для сообщений девушки
-async def girl_wish_message_handler(message: Message, bot: Bot):
+@router.message(WishForm.waiting, ~F.from_user.id.in_(ADMIN_IDS))
+async def girl_wish_message_handler(
+    message: Message,
+    state: FSMContext,
+    wish_digest: WishDigest,
+    album: list[Message] | None = None,
+):
     # """
-    # Ловит сообщение от девушки, если бот сейчас ждёт от неё хотелку.
-    # Сохраняет её в БД и шлёт уведомление админу.
+    # Ловит сообщение от девушки в состоянии WishForm.waiting.
+    # Сохраняет хотелку в БД и ставит уведомление админу её пары в сводку.
+    # Альбом (несколько скриншотов разом) приходит сюда одним вызовом —
+    # его собирает MediaGroupMiddleware — и сохраняется одной хотелкой.
     # """
-    # Игнорируем админа
-    if message.from_user and message.from_user.id == ADMIN_ID:
-        return
-
-    girlfriend_chat_id = await get_girlfriend_chat_id()
-    if girlfriend_chat_id is None or message.chat.id != girlfriend_chat_id:
-        # Не та пользовательница
-        return
+    # Выходим из состояния "ждём" в любом случае
+    await state.clear()
 
-    # Проверяем, ждём ли сейчас хотелку
-    waiting = await is_waiting_wish()
-    if not waiting:
-        # Обычное сообщение, не в режиме "Хочу" — не трогаем
+    pair = await get_pair_by_recipient(message.chat.id)
+    if pair is None:
+        # Пару за это время отвязали
         return
 
-    # Сбрасываем флаг "ждём"
-    await set_waiting_wish(False)
-
     # Собираем данные хотелки
-    text = message.text or message.caption or None
-
-    photo_file_id = None
-    if message.photo:
-        largest_photo = message.photo[-1]
-        photo_file_id = largest_photo.file_id
+    text = album_caption(message, album)
+    photos = album_photos(message, album)
+    photo_file_id = photos[0] if photos else None
 
     # Сохраняем в БД
     wish_id = await add_wish(
+        pair_id=pair.id,
         user_id=message.from_user.id,
         text=text,
-        photo_file_id=photo_file_id
+        photo_file_id=photo_file_id,
+        media=photos,
     )
+    logger.info("Новая хотелка", extra={"pair_id": pair.id, "wish_id": wish_id})
 
     # Подтверждение девушке
     await message.answer(
@@ -137,22 +185,9 @@ async def girl_wish_message_handler(message: Message, bot: Bot):
         "Серёжа обязательно про неё узнает 💖"
     )
 
-    # Уведомление админу
-    from config import ADMIN_ID as ADMIN
-
-    header = f"✨ Новая хотелка #{wish_id}\n\n"
-    if text:
-        header += f"Текст:\n{text}\n"
-
-    if photo_file_id:
-        # если есть фото — шлём фото с подписью
-        await bot.send_photo(
-            chat_id=ADMIN,
-            photo=photo_file_id,
-            caption=header
-        )
-    else:
-        await bot.send_message(
-            chat_id=ADMIN,
-            text=header
-        )
+    # Уведомление админу пары: сразу или сводкой за окно (/wish_digest)
+    wish_digest.add(
+        pair.admin_id,
+        WishNotice(wish_id, text, photo_file_id, tuple(photos)),
+        window=await get_wish_digest_window(pair.admin_id),
+    )
@@ -0,0 +1,296 @@
+import csv
+import io
+import json
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime
+
+import aiofiles
+from aiogram import Router, Bot
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message, FSInputFile
+
+from backup import BackupWorker
+from config import ADMIN_ID
+from db import WISH_STATUSES, get_or_create_pair, import_records, iter_reminders, iter_wishes
+from .admin import is_admin
+
+router = Router()
+
+logger = logging.getLogger(__name__)
+
+# Сколько записей вставляется одним executemany
+IMPORT_BATCH_SIZE = 500
+
+# Колонки CSV (первая строка файла — заголовок)
+CSV_FIELDS = ["type", "text", "photo_file_id", "is_active", "status", "created_at", "user_id"]
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+def _normalize(record: dict, line_no: int) -> dict:
+    # в JSONL строкой может оказаться любое JSON-значение, не только объект
+    if not isinstance(record, dict):
+        raise ImportFormatError(
+            f"строка {line_no}: ожидается объект {{...}}, а не {type(record).__name__}"
+        )
+    # пустые строки из CSV -> None, тип по умолчанию — напоминание
+    record = {k: (v if v != "" else None) for k, v in record.items() if k}
+
+    # text из JSON может прийти числом — храним строкой; остальные поля — только строки
+    if isinstance(record.get("text"), (int, float)) and not isinstance(record["text"], bool):
+        record["text"] = str(record["text"])
+    for key in ("type", "text", "photo_file_id", "status", "created_at"):
+        if record.get(key) is not None and not isinstance(record[key], str):
+            raise ImportFormatError(
+                f"строка {line_no}: {key} должен быть строкой, а не {record[key]!r}"
+            )
+
+    kind = (record.get("type") or "reminder").lower()
+    if kind not in ("reminder", "wish"):
+        raise ImportFormatError(f"строка {line_no}: неизвестный type {kind!r}")
+    if not record.get("text") and not record.get("photo_file_id"):
+        raise ImportFormatError(f"строка {line_no}: нет ни text, ни photo_file_id")
+    record["type"] = kind
+
+    # числа из CSV приходят строками — приводим здесь, чтобы ошибка была с номером строки
+    for key in ("is_active", "user_id"):
+        if record.get(key) is not None:
+            try:
+                record[key] = int(record[key])
+            except (TypeError, ValueError):
+                raise ImportFormatError(
+                    f"строка {line_no}: {key} должен быть числом, а не {record[key]!r}"
+                ) from None
+    if record.get("status") is not None and record["status"] not in WISH_STATUSES:
+        raise ImportFormatError(f"строка {line_no}: неизвестный status {record['status']!r}")
+    if record.get("created_at") is not None:
+        try:
+            datetime.fromisoformat(str(record["created_at"]))
+        except ValueError:
+            raise ImportFormatError(
+                f"строка {line_no}: created_at не в формате ISO: {record['created_at']!r}"
+            ) from None
+    return record
+
+
+async def _read_batches(path: str, fmt: str):
+    # """
+    # Читает файл построчно через aiofiles и отдаёт пачки записей.
+    # CSV-запись может занимать несколько строк (перенос внутри кавычек),
+    # поэтому склеиваем строки, пока число кавычек не станет чётным.
+    # """
+    batch: list[dict] = []
+    header: list[str] | None = None
+    pending = ""
+    line_no = 0
+
+    async with aiofiles.open(path, "r", encoding="utf-8-sig") as f:
+        async for line in f:
+            line_no += 1
+            if fmt == "jsonl":
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError as e:
+                    raise ImportFormatError(f"строка {line_no}: {e.msg}") from e
+                batch.append(_normalize(record, line_no))
+            else:
+                pending += line
+                if pending.count('"') % 2:
+                    continue
+                try:
+                    row = next(csv.reader([pending]), [])
+                except csv.Error as e:
+                    raise ImportFormatError(f"строка {line_no}: {e}") from e
+                pending = ""
+                if not row:
+                    continue
+                if header is None:
+                    header = [h.strip().lower() for h in row]
+                    continue
+                batch.append(_normalize(dict(zip(header, row)), line_no))
+
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                yield batch
+                batch = []
+
+    if pending.strip():
+        raise ImportFormatError("файл оборвался внутри кавычек")
+    if batch:
+        yield batch
+
+
+def _detect_format(file_name: str | None) -> str | None:
+    name = (file_name or "").lower()
+    if name.endswith(".csv"):
+        return "csv"
+    if name.endswith((".jsonl", ".ndjson", ".json")):
+        return "jsonl"
+    return None
+
+
+# --- /import ---
+
+
+@router.message(Command("import"))
+async def import_handler(message: Message, bot: Bot):
+    # """
+    # /import — массовая загрузка напоминаний и хотелок (только админ).
+    # Файл .csv или .jsonl отправляется документом с подписью /import.
+    # """
+    if not is_admin(message):
+        return await message.answer("Эта команда только для админа 😇")
+
+    document = message.document
+    fmt = _detect_format(document.file_name) if document else None
+    if fmt is None:
+        return await message.answer(
+            "Отправь файл .csv или .jsonl документом с подписью `/import`.\n\n"
+            "CSV: первая строка — заголовок, колонки "
+            "`type,text,photo_file_id,is_active,status,created_at,user_id`.\n"
+            "JSONL: по одному объекту на строку, например "
+            '`{"type": "reminder", "text": "люблю тебя"}`.\n'
+            "type — `reminder` или `wish`, обязателен text или photo\\_file\\_id.",
+            parse_mode="Markdown",
+        )
+
+    pair = await get_or_create_pair(message.from_user.id)
+    started = time.monotonic()
+
+    fd, path = tempfile.mkstemp(suffix=f".{fmt}")
+    os.close(fd)
+    try:
+        # bot.download пишет файл на диск кусками, в память целиком не грузит
+        await bot.download(document, destination=path)
+        reminders, wishes = await import_records(
+            pair.id,
+            pair.recipient_chat_id or message.from_user.id,
+            _read_batches(path, fmt),
+        )
+    except ValueError as e:
+        # транзакция уже откатилась — в БД ничего не попало
+        logger.info("Импорт отклонён", extra={"pair_id": pair.id, "error": str(e)})
+        return await message.answer(f"Файл не загружен, ошибка: {e}")
+    finally:
+        os.remove(path)
+
+    logger.info(
+        "Импорт завершён",
+        extra={"pair_id": pair.id, "reminders": reminders, "wishes": wishes,
+               "duration_ms": round((time.monotonic() - started) * 1000, 1)},
+    )
+
+    await message.answer(
+        "Импорт завершён ✅\n"
+        f"Напоминаний: {reminders}\n"
+        f"Хотелок: {wishes}\n"
+        f"Время: {time.monotonic() - started:.2f} с"
+    )
+
+
+# --- /export ---
+
+
+@router.message(Command("export"))
+async def export_handler(message: Message, command: CommandObject):
+    # """
+    # /export [csv|jsonl] — выгружает напоминания и хотелки файлом (только админ).
+    # Записи читаются из БД пачками и сразу пишутся в файл.
+    # """
+    if not is_admin(message):
+        return await message.answer("Эта команда только для админа 😇")
+
+    fmt = "csv" if (command.args or "").strip().lower() == "csv" else "jsonl"
+    pair = await get_or_create_pair(message.from_user.id)
+    started = time.monotonic()
+
+    fd, path = tempfile.mkstemp(suffix=f".{fmt}")
+    os.close(fd)
+    reminders = 0
+    wishes = 0
+    try:
+        async with aiofiles.open(path, "w", encoding="utf-8", newline="") as f:
+            if fmt == "csv":
+                await f.write(",".join(CSV_FIELDS) + "\r\n")
+
+            async for rows in iter_reminders(pair.id):
+                records = [
+                    {"type": "reminder", "text": text, "photo_file_id": photo_file_id,
+                     "is_active": is_active}
+                    for _, text, photo_file_id, is_active in rows
+                ]
+                await f.write(_serialize(records, fmt))
+                reminders += len(records)
+
+            async for rows in iter_wishes(pair.id):
+                records = [
+                    {"type": "wish", "text": text, "photo_file_id": photo_file_id,
+                     "status": status, "created_at": created_at, "user_id": user_id}
+                    for _, user_id, text, photo_file_id, status, created_at in rows
+                ]
+                await f.write(_serialize(records, fmt))
+                wishes += len(records)
+
+        await message.answer_document(
+            FSInputFile(path, filename=f"export.{fmt}"),
+            caption=(
+                f"Напоминаний: {reminders}, хотелок: {wishes}\n"
+                f"Время: {time.monotonic() - started:.2f} с"
+            ),
+        )
+    finally:
+        os.remove(path)
+
+
+def _serialize(records: list[dict], fmt: str) -> str:
+    if fmt == "csv":
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        for r in records:
+            writer.writerow(["" if r.get(k) is None else r.get(k) for k in CSV_FIELDS])
+        return buf.getvalue()
+    return "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records)
+
+
+# --- /backup ---
+
+# Telegram не принимает от бота документы больше 50 МБ
+MAX_DOCUMENT_BYTES = 50 * 1024 * 1024
+
+
+@router.message(Command("backup"))
+async def backup_handler(message: Message, command: CommandObject, backups: BackupWorker):
+    # """
+    # /backup [new] — присылает последнюю резервную копию БД; new — сначала снять свежую.
+    # В копии данные всех пар, поэтому команда только для владельца бота (ADMIN_ID).
+    # """
+    if not message.from_user or message.from_user.id != ADMIN_ID:
+        return await message.answer("Эта команда только для владельца бота 😇")
+
+    path = backups.latest()
+    if path is None or (command.args or "").strip().lower() == "new":
+        await message.answer("Делаю резервную копию…")
+        try:
+            path = (await backups.backup()).path
+        except Exception as e:
+            # место на диске, права на каталог, битая БД (integrity_check)
+            logger.exception("Не удалось сделать резервную копию по команде")
+            return await message.answer(f"Резервная копия не получилась, ошибка: {e}")
+
+    size = path.stat().st_size
+    if size > MAX_DOCUMENT_BYTES:
+        return await message.answer(
+            f"Копия {path.name} — {size / 1024 / 1024:.1f} МБ, больше лимита Telegram. "
+            f"Она лежит на сервере: {path}"
+        )
+
+    await message.answer_document(
+        FSInputFile(path),
+        caption=f"{path.name}, {size / 1024:.0f} КБ (integrity_check: ok)",
+    )
@@ -1,4 +1,10 @@
-from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
+from aiogram.filters.callback_data import CallbackData
+from aiogram.types import (
+    ReplyKeyboardMarkup,
+    KeyboardButton,
+    InlineKeyboardMarkup,
+    InlineKeyboardButton,
+)
 
 # --- КНОПКИ ДЛЯ АДМИНА ---
 
@@ -45,3 +51,104 @@ def get_girlfriend_keyboard() -> ReplyKeyboardMarkup:
     )
     return keyboard
 
+
+# --- ИНЛАЙН-НАВИГАЦИЯ ПО СПИСКАМ ---
+
+
+class PageCallback(CallbackData, prefix="page"):
+    # """
+    # Кнопки "новее/старее" под списками.
+    # kind — какой список ("reminders" / "wishes"),
+    # before / after — id-курсор для keyset-пагинации (0 = не задан),
+    # status — фильтр хотелок по статусу ("" = все).
+    # """
+    kind: str
+    before: int = 0
+    after: int = 0
+    status: str = ""
+
+
+def get_page_keyboard(
+    kind: str,
+    first_id: int,
+    last_id: int,
+    has_newer: bool,
+    has_older: bool,
+    status: str = "",
+) -> InlineKeyboardMarkup | None:
+    # """
+    # Клавиатура навигации для страницы списка (новые сверху).
+    # first_id / last_id — id первой и последней строки на странице.
+    # """
+    buttons = []
+    if has_newer:
+        buttons.append(InlineKeyboardButton(
+            text="⬅️ Новее",
+            callback_data=PageCallback(kind=kind, after=first_id, status=status).pack(),
+        ))
+    if has_older:
+        buttons.append(InlineKeyboardButton(
+            text="Старее ➡️",
+            callback_data=PageCallback(kind=kind, before=last_id, status=status).pack(),
+        ))
+    if not buttons:
+        return None
+    return InlineKeyboardMarkup(inline_keyboard=[buttons])
+
+
+class SearchCallback(CallbackData, prefix="search"):
+    # """
+    # Кнопки "назад/дальше" под результатами /search.
+    # q — нормализованный запрос (слова через пробел), offset — сдвиг страницы.
+    # """
+    q: str
+    offset: int = 0
+
+
+def get_search_keyboard(
+    query: str, offset: int, page_size: int, has_more: bool
+) -> InlineKeyboardMarkup | None:
+    # """Навигация по страницам результатов поиска (лучшие совпадения сверху)."""
+    buttons = []
+    if offset > 0:
+        buttons.append(InlineKeyboardButton(
+            text="⬅️ Назад",
+            callback_data=SearchCallback(q=query, offset=max(0, offset - page_size)).pack(),
+        ))
+    if has_more:
+        buttons.append(InlineKeyboardButton(
+            text="Дальше ➡️",
+            callback_data=SearchCallback(q=query, offset=offset + page_size).pack(),
+        ))
+    if not buttons:
+        return None
+    return InlineKeyboardMarkup(inline_keyboard=[buttons])
+
+
+# --- СТАТУСЫ ХОТЕЛОК ---
+
+WISH_STATUS_LABELS = {
+    "new": "🆕 Новая",
+    "planned": "📌 В планах",
+    "done": "✅ Сделано",
+    "rejected": "🚫 Не будет",
+}
+
+
+class WishStatusCallback(CallbackData, prefix="wish"):
+    # """Кнопки смены статуса под уведомлением о новой хотелке."""
+    id: int
+    status: str
+
+
+def get_wish_status_keyboard(wish_id: int, current: str = "new") -> InlineKeyboardMarkup:
+    # """Кнопки статусов хотелки; текущий статус отмечен точкой."""
+    buttons = [
+        InlineKeyboardButton(
+            text=("• " if status == current else "") + label,
+            callback_data=WishStatusCallback(id=wish_id, status=status).pack(),
+        )
+        for status, label in WISH_STATUS_LABELS.items()
+        if status != "new"
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=[buttons])
@@ -0,0 +1,124 @@
+import asyncio
+import inspect
+import logging
+import time
+from typing import Any, Callable
+
+from db import Lease, acquire_lease, release_lease, get_lease
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderElection:
+    # """
+    # Выбор ведущего среди нескольких процессов бота на одной bot.db.
+
+    # Аренда — строка в таблице leases: ведущий продлевает её каждые ttl/3,
+    # остальные с тем же шагом пытаются её забрать, и это получается, только
+    # когда аренда истекла (ведущий упал) или отпущена (ведущий остановился).
+    # Пока процесс ведущий, у него запущены задачи add_job(): планировщик,
+    # разовые напоминания, outbox, резервные копии — так рассылка не уходит
+    # дважды. Если продлить аренду не удаётся дольше ttl, процесс сам
+    # останавливает задачи: к этому моменту аренду мог забрать другой.
+    # """
+
+    def __init__(self, holder: str, ttl: float = 15, name: str = "leader"):
+        self.holder = holder
+        self.ttl = ttl
+        self.name = name
+        self.interval = ttl / 3
+        self._jobs: list[tuple[str, Callable[[], Any], Callable[[], Any] | None]] = []
+        self._lease: Lease | None = None
+        # до какого момента (monotonic) аренда точно наша
+        self._deadline = 0.0
+        self._task: asyncio.Task | None = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self._lease is not None
+
+    def add_job(
+        self, name: str, start: Callable[[], Any], stop: Callable[[], Any] | None = None
+    ) -> None:
+        # """Задача ведущего: start() — при избрании, stop() — при потере аренды."""
+        self._jobs.append((name, start, stop))
+
+    async def start(self) -> None:
+        # """Первая попытка — сразу: одиночный процесс становится ведущим без задержки."""
+        await self._tick()
+        self._task = asyncio.create_task(self._run(), name="leader-election")
+
+    async def stop(self) -> None:
+        # """Останавливает задачи и отпускает аренду — другой процесс заберёт её сразу."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.is_leader:
+            await self._demote("остановка")
+            try:
+                await release_lease(self.name, self.holder)
+            except Exception:
+                logger.exception("Не удалось отпустить аренду")
+
+    async def status(self) -> Lease | None:
+        # """Текущая аренда из БД (кто ведущий сейчас) или None."""
+        return await get_lease(self.name)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self._tick()
+
+    async def _tick(self) -> None:
+        started = time.monotonic()
+        try:
+            lease = await acquire_lease(self.name, self.holder, self.ttl)
+        except Exception:
+            logger.exception("Не удалось обновить аренду", extra={"holder": self.holder})
+            if self.is_leader and time.monotonic() >= self._deadline:
+                await self._demote("аренда истекла")
+            return
+
+        if lease is None:
+            if self.is_leader:
+                await self._demote("аренду забрал другой процесс")
+            return
+
+        # отсчёт от начала запроса: в БД срок мог начаться раньше, чем пришёл ответ
+        self._deadline = started + self.ttl
+        was_leader = self.is_leader
+        self._lease = lease
+        if not was_leader:
+            await self._elect()
+
+    async def _elect(self) -> None:
+        metrics.inc("bot_leader_changes_total", to="leader")
+        logger.info(
+            "Процесс стал ведущим",
+            extra={"holder": self.holder, "jobs": [name for name, _, _ in self._jobs]},
+        )
+        for name, start, _ in self._jobs:
+            try:
+                result = start()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception:
+                logger.exception("Задача ведущего не запустилась", extra={"job": name})
+
+    async def _demote(self, reason: str) -> None:
+        self._lease = None
+        metrics.inc("bot_leader_changes_total", to="follower")
+        logger.warning(
+            "Процесс больше не ведущий", extra={"holder": self.holder, "reason": reason}
+        )
+        for name, _, stop in reversed(self._jobs):
+            if stop is None:
+                continue
+            try:
+                result = stop()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception:
+                logger.exception("Задача ведущего не остановилась", extra={"job": name})
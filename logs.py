@@ -0,0 +1,135 @@
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any
+
+# Поля текущего апдейта (update_id, chat_id, handler) — их ставит middleware,
+# а ContextFilter добавляет в каждую запись, сделанную в этой задаче
+_context: ContextVar[dict[str, Any]] = ContextVar("log_context", default={})
+
+# Атрибуты, которые есть у любой LogRecord, — всё остальное считаем полями из extra=
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+
+def bind(**fields: Any):
+    # """Добавляет поля в контекст логов текущей задачи. Возвращает токен для reset()."""
+    return _context.set({**_context.get(), **fields})
+
+
+def reset(token) -> None:
+    _context.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    # """Переносит поля контекста в запись (выполняется в потоке цикла событий)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        for key, value in _context.get().items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    # """
+    # Пропускает только долю DEBUG-записей (rate от 0 до 1).
+    # Всё, что INFO и выше, проходит всегда. Отбрасывание происходит
+    # до постановки в очередь, так что "шумный" DEBUG почти ничего не стоит.
+    # """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.rate >= 1:
+            return True
+        return random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    # """Одна запись — одна строка JSON: ts, level, logger, msg, exc и поля из extra/контекста."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    # """
+    # Стандартный QueueHandler склеивает трейсбек с текстом сообщения.
+    # Здесь сообщение и трейсбек готовятся отдельно, чтобы JSON остался структурным.
+    # """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(
+    level: str = "INFO",
+    path: str | None = None,
+    max_bytes: int = 10 * 1024 * 1024,
+    backup_count: int = 5,
+    debug_sample_rate: float = 1.0,
+) -> logging.handlers.QueueListener:
+    # """
+    # Настраивает корневой логгер: записи уходят в очередь, а форматирование
+    # и запись в stderr/файл делает фоновый поток QueueListener — цикл событий
+    # никогда не ждёт диска. path — файл с ротацией по размеру (None — только stderr).
+    # Возвращает запущенный listener, его нужно остановить при выходе (stop()).
+    # """
+    formatter = JsonFormatter()
+    handlers: list[logging.Handler] = [logging.StreamHandler(sys.stderr)]
+    if path:
+        handlers.append(
+            logging.handlers.RotatingFileHandler(
+                path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+            )
+        )
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(debug_sample_rate))
+    queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.addHandler(queue_handler)
+    root.setLevel(level.upper())
+
+    # aiogram пишет INFO на каждый апдейт, aiosqlite — DEBUG на каждый запрос —
+    # оставляем только важное
+    logging.getLogger("aiogram.event").setLevel(logging.WARNING)
+    logging.getLogger("aiosqlite").setLevel(logging.INFO)
+
+    listener = logging.handlers.QueueListener(
+        log_queue, *handlers, respect_handler_level=True
+    )
+    listener.start()
+    return listener
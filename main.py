@@ -1,76 +1,89 @@
-import asyncio
-
-from aiogram import Bot, Dispatcher
-from aiogram.exceptions import TelegramNetworkError
-
-
-from config import BOT_TOKEN
-from db import (
+import time
+
+# Точка отсчёта для замера старта — до тяжёлых импортов (aiogram — основная их часть)
+_STARTED = time.perf_counter()
+
+import asyncio  # noqa: E402
+import logging  # noqa: E402
+from datetime import timedelta  # noqa: E402
+
+from aiogram import Bot, Dispatcher  # noqa: E402
+from aiogram.client.session.base import BaseSession  # noqa: E402
+
+from config import (  # noqa: E402
+    BOT_TOKEN,
+    ADMIN_ID,
+    FANOUT_BATCH_SIZE,
+    FANOUT_CONCURRENCY,
+    BOT_MODE,
+    WEBAPP_HOST,
+    METRICS_PORT,
+    LOG_LEVEL,
+    LOG_FILE,
+    LOG_MAX_BYTES,
+    LOG_BACKUP_COUNT,
+    LOG_DEBUG_SAMPLE_RATE,
+    DAILY_REMINDER_HOUR,
+    SCHEDULE_TZ,
+    CATCHUP_GRACE_MINUTES,
+    FSM_STORAGE,
+    BACKUP_DIR,
+    BACKUP_INTERVAL_HOURS,
+    BACKUP_KEEP,
+    BACKUP_STEP_PAGES,
+    MULTI_INSTANCE,
+    LEADER_LEASE_SECONDS,
+    INSTANCE_ID,
+    WISH_DIGEST_SECONDS,
+    WISH_DIGEST_MAX,
+    MEDIA_ARCHIVE_DIR,
+    MEDIA_ARCHIVE_WORKERS,
+    SEND_GLOBAL_RATE,
+    SEND_PER_CHAT_RATE,
+    SEND_WORKERS,
+)
+from db import (  # noqa: E402
+    DB_PATH,
+    Pair,
     init_db,
-    get_girlfriend_chat_id,
-    get_random_active_reminder,
-    deactivate_reminder,
-    is_wishes_feature_notified,
+    close_db,
+    load_app_state,
+    load_pairs,
+    migrate_legacy_pair,
+    list_recipient_pairs,
     set_wishes_feature_notified,
-
+    get_app_state_stats,
+    get_pair_cache_stats,
+)
+from handlers import register_handlers  # noqa: E402
+from sender import SendQueue  # noqa: E402
+from outbox import OutboxWorker  # noqa: E402
+from fsm_storage import create_storage, migrate_legacy_waiting_wish  # noqa: E402
+from logs import setup_logging  # noqa: E402
+from scheduler import ReminderScheduler, DueReminderLoop, MAX_SLEEP  # noqa: E402
+from startup import StartupTimer  # noqa: E402
+from backup import BackupWorker  # noqa: E402
+from leader import LeaderElection  # noqa: E402
+from digest import WishDigest  # noqa: E402
+from archive import MediaArchive  # noqa: E402
+from metrics import (  # noqa: E402
+    metrics,
+    setup_update_metrics,
+    register_gauges,
+    start_metrics_server,
+    ApiMetricsMiddleware,
 )
-from handlers import register_handlers
-
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.cron import CronTrigger
-import pytz
-
-
-async def send_daily_reminder(bot: Bot):
-    # """
-    # Отправляет один случайный активный ремайндер девушке.
-    # Вызывается планировщиком каждый день в 10:00.
-    # """
-    girlfriend_chat_id = await get_girlfriend_chat_id()
-    if girlfriend_chat_id is None:
-        # Девушка ещё не писала боту /start — просто выходим тихо
-        print("[scheduler] Нет chat_id девушки, напоминание не отправлено")
-        return
-
-    reminder = await get_random_active_reminder()
-    if reminder is None:
-        # Нет активных напоминаний
-        print("[scheduler] Нет активных напоминаний, отправлять нечего")
-        return
-
-    r_id, text, photo_file_id = reminder
-
-    # Отправляем либо фото+текст, либо просто текст
-    if photo_file_id:
-        await bot.send_photo(
-            chat_id=girlfriend_chat_id,
-            photo=photo_file_id,
-            caption=text or None
-        )
-    else:
-        await bot.send_message(
-            chat_id=girlfriend_chat_id,
-            text=text or "❤️"
-        )
-    # Деавктивирует отправленное напоминание
-    await deactivate_reminder(r_id)
-
-    print(f"[scheduler] Отправлено запланированное напоминание ID={r_id}")
-
 
+logger = logging.getLogger(__name__)
 
-async def notify_about_wishes_feature(bot: Bot):
+async def notify_about_wishes_feature(send_queue: SendQueue):
     # """
-    # Один раз отправляет девушке сообщение о новой функции 'хотелки'.
-    # Больше не шлёт, если в app_state стоит флаг wishes_feature_notified = 1.
+    # Один раз отправляет каждой девушке сообщение о новой функции 'хотелки'.
+    # Больше не шлёт паре, у которой стоит флаг wishes_feature_notified.
     # """
-    # Уже уведомляли? Тогда выходим.
-    if await is_wishes_feature_notified():
-        return
-
-    girlfriend_chat_id = await get_girlfriend_chat_id()
-    if girlfriend_chat_id is None:
-        # Ещё не знаем, кто девушка — некого уведомлять.
+    # Уведомляем только тех, кого ещё не уведомляли.
+    pairs = [p for p in await list_recipient_pairs() if not p.wishes_feature_notified]
+    if not pairs:
         return
 
     text = (
@@ -93,56 +106,183 @@ async def notify_about_wishes_feature(bot: Bot):
         "Можешь попробовать прямо сейчас!"
     )
 
-    await bot.send_message(chat_id=girlfriend_chat_id, text=text)
+    async def notify(pair: Pair) -> None:
+        await send_queue.send_message(chat_id=pair.recipient_chat_id, text=text)
 
-    # Помечаем, что уведомление отправлено
-    await set_wishes_feature_notified()
+        # Помечаем, что уведомление отправлено
+        await set_wishes_feature_notified(pair)
 
+    results = await asyncio.gather(
+        *(notify(pair) for pair in pairs), return_exceptions=True
+    )
+    for pair, result in zip(pairs, results):
+        if isinstance(result, Exception):
+            logger.warning(
+                "Не удалось отправить уведомление о новой функции",
+                extra={"pair_id": pair.id, "chat_id": pair.recipient_chat_id,
+                       "error": repr(result)},
+            )
 
 
-async def main():
+
+async def main(session: BaseSession | None = None):
     # """
-    # Инициализирует БД, настраивает бота, регистрирует хэндлеры,
-    # поднимает планировщик и запускает long polling.
+    # Инициализирует БД, настраивает бота, регистрирует хэндлеры
+    # и запускает long polling или вебхук (BOT_MODE).
+    # Некритичное для первого апдейта (выбор ведущего и запуск его задач)
+    # идёт фоновыми задачами уже после запуска приёма апдейтов.
+    # session — своя сессия Bot API (для бенчмарка старта), по умолчанию aiohttp.
     # """
-    # Инициализируем базу
-    await init_db()
+    timer = StartupTimer(_STARTED)
+    timer.mark("imports", _STARTED)
 
-    # Создаём бота и диспетчер
-    bot = Bot(token=BOT_TOKEN)
-    dp = Dispatcher()
+    # Логи пишет фоновый поток, цикл событий не ждёт stderr/диск
+    log_listener = setup_logging(
+        LOG_LEVEL, LOG_FILE, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_DEBUG_SAMPLE_RATE
+    )
 
-    # Регистрируем хэндлеры
-    register_handlers(dp)
-    
-    # 👉 безопасно пытаемся отправить уведомление о новой фиче
-    try:
-        await notify_about_wishes_feature(bot)
-    except TelegramNetworkError as e:
-        print(f"[notify] Не удалось отправить уведомление о новой функции: {e}")
+    # Открываем общее соединение, применяем миграции, грузим кэши
+    # (без кэшей, если процессов несколько — иначе они разойдутся)
+    with timer.phase("db"):
+        await init_db()
+        if not MULTI_INSTANCE:
+            await load_app_state()
+            await load_pairs()
+        await migrate_legacy_pair(ADMIN_ID)
+
+    # Создаём бота и диспетчер; состояния FSM (ждём хотелку) — в FSM_STORAGE
+    with timer.phase("bot"):
+        bot = Bot(token=BOT_TOKEN, session=session)
+        storage = await create_storage(FSM_STORAGE, cached=not MULTI_INSTANCE)
+        await migrate_legacy_waiting_wish(storage, bot.id)
+        dp = Dispatcher(storage=storage)
+        dp.update.outer_middleware(timer.middleware())
+
+        # Общая очередь исходящих сообщений, доступна хэндлерам как send_queue
+        send_queue = SendQueue(
+            bot,
+            workers=SEND_WORKERS,
+            global_rate=SEND_GLOBAL_RATE,
+            per_chat_rate=SEND_PER_CHAT_RATE,
+        )
+        send_queue.start()
+        dp["send_queue"] = send_queue
+
+        # Уведомления админу о новых хотелках — сводкой за WISH_DIGEST_SECONDS
+        wish_digest = WishDigest(send_queue, window=WISH_DIGEST_SECONDS, max_items=WISH_DIGEST_MAX)
+        dp["wish_digest"] = wish_digest
+
+        # Архив фото на диске: если file_id перестанет работать, outbox загрузит фото из него
+        archive = None
+        if MEDIA_ARCHIVE_DIR:
+            archive = MediaArchive(bot, MEDIA_ARCHIVE_DIR, workers=MEDIA_ARCHIVE_WORKERS)
+
+        # Воркер outbox: доставляет напоминания, поставленные планировщиком и /send_random
+        outbox = OutboxWorker(send_queue, batch_size=FANOUT_CONCURRENCY, archive=archive)
+        dp["outbox"] = outbox
+
+        # Планировщик: один таймер на расписания всех пар. Сам таймер (и догон
+        # пропущенных запусков) запускается у ведущего, но add()/delete()
+        # из хэндлеров пишут в БД в любом процессе
+        scheduler = ReminderScheduler(
+            outbox,
+            batch_size=FANOUT_BATCH_SIZE,
+            grace=timedelta(minutes=CATCHUP_GRACE_MINUTES),
+            default_time=f"{DAILY_REMINDER_HOUR:02d}:00",
+            default_tz=SCHEDULE_TZ,
+            resync_interval=MAX_SLEEP if MULTI_INSTANCE else 0,
+        )
+        dp["scheduler"] = scheduler
+
+        # Разовые напоминания (/add_at): цикл спит до ближайшего send_at
+        due_loop = DueReminderLoop(outbox, batch_size=FANOUT_BATCH_SIZE)
+        dp["due_loop"] = due_loop
+
+        # Резервные копии БД по расписанию (и по /backup)
+        backups = BackupWorker(
+            DB_PATH,
+            BACKUP_DIR,
+            interval=BACKUP_INTERVAL_HOURS * 3600,
+            keep=BACKUP_KEEP,
+            step_pages=BACKUP_STEP_PAGES,
+        )
+        dp["backups"] = backups
+
+        # Всё плановое выше — только у ведущего процесса, иначе при нескольких
+        # процессах каждая рассылка ушла бы по разу от каждого
+        election = LeaderElection(INSTANCE_ID, ttl=LEADER_LEASE_SECONDS)
+        election.add_job("outbox", outbox.start, outbox.stop)
+        election.add_job("scheduler", scheduler.start, scheduler.stop)
+        election.add_job("due", due_loop.start, due_loop.stop)
+        election.add_job("backups", backups.start, backups.stop)
+        if archive is not None:
+            election.add_job("archive", archive.start, archive.stop)
+        dp["election"] = election
+
+    with timer.phase("handlers"):
+        # Регистрируем хэндлеры
+        register_handlers(dp)
+
+        # Метрики: время апдейтов по хэндлерам, запросы к Bot API, очередь и кэши
+        setup_update_metrics(dp)
+        bot.session.middleware(ApiMetricsMiddleware())
+        register_gauges(
+            send_queue, {"app_state": get_app_state_stats, "pairs": get_pair_cache_stats}
+        )
+        metrics.gauge(
+            "bot_backup_age_seconds", backups.age, "Возраст последней резервной копии (-1 — нет)"
+        )
+        metrics.gauge(
+            "bot_leader", lambda: int(election.is_leader), "1 — этот процесс ведущий"
+        )
 
+    # Фоновые задачи — после того, как приём апдейтов уже запущен
+    background: list[asyncio.Task] = []
 
-    # Таймзона для расписания — Europe/Helsinki
-    helsinki_tz = pytz.timezone("Europe/Helsinki")
+    def start_notify() -> None:
+        # ошибки отправки очередь уже обработала и залогировала
+        background.append(timer.background("notify", notify_about_wishes_feature(send_queue)))
 
-    # Настраиваем планировщик
-    scheduler = AsyncIOScheduler(timezone=helsinki_tz)
+    election.add_job("notify", start_notify)
 
-    # каждый день в 11:00 по Хельсинки
-    scheduler.add_job(
-        send_daily_reminder,
-        trigger=CronTrigger(hour=11, minute=0),
-        args=(bot,),
-        name="daily_love_reminder",
-    )
+    async def on_startup() -> None:
+        timer.report("Бот принимает апдейты")
+        background.append(timer.background("leader", election.start()))
 
-    # Запускаем планировщик
-    scheduler.start()
-    print("Планировщик запущен: ежедневное напоминание в 10:00")
+    dp.startup.register(on_startup)
+
+    # В режиме polling /metrics отдаёт отдельный маленький сервер
+    metrics_runner = None
+    if BOT_MODE != "webhook" and METRICS_PORT:
+        metrics_runner = await start_metrics_server(WEBAPP_HOST, METRICS_PORT)
+        logger.info(f"Метрики: http://{WEBAPP_HOST}:{METRICS_PORT}/metrics")
 
-    print("Бот запущен...")
     # Запускаем обработку апдейтов
-    await dp.start_polling(bot)
+    try:
+        if BOT_MODE == "webhook":
+            from webhook import run_webhook
+
+            await run_webhook(bot, dp)
+        else:
+            # если раньше работали через вебхук — снимаем его, иначе polling не запустится
+            await bot.delete_webhook()
+            logger.info("Бот запущен (polling)")
+            # сессию закрываем сами в finally: сначала должна опустеть очередь отправки
+            await dp.start_polling(bot, close_bot_session=False)
+    finally:
+        for task in background:
+            task.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
+        # останавливает задачи ведущего и отпускает аренду для следующего процесса
+        await election.stop()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        # недособранные сводки — в очередь, пока она ещё работает
+        wish_digest.stop()
+        await send_queue.stop()
+        await bot.session.close()
+        await close_db()
+        log_listener.stop()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,277 @@
+import logging
+import time
+from collections import defaultdict
+from typing import TYPE_CHECKING, Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import TelegramObject, Update
+
+import logs
+
+if TYPE_CHECKING:
+    # aiohttp.web нужен только серверу /metrics и вебхуку — в polling без
+    # METRICS_PORT не тратим на него время старта
+    from aiohttp import web
+
+logger = logging.getLogger("bot.updates")
+
+# Границы корзин гистограмм длительности (секунды)
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+Labels = tuple[tuple[str, str], ...]
+
+
+class Histogram:
+    # """Гистограмма в духе Prometheus: корзины + count/sum, плюс max для /stats_perf."""
+
+    __slots__ = ("buckets", "count", "sum", "max")
+
+    def __init__(self):
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+        for i, bound in enumerate(DURATION_BUCKETS):
+            if value <= bound:
+                self.buckets[i] += 1
+
+
+class Metrics:
+    # """
+    # Простой реестр метрик в памяти процесса: счётчики, гистограммы и
+    # "ленивые" gauge (значение считается в момент выдачи /metrics).
+    # """
+
+    def __init__(self):
+        self.counters: dict[str, dict[Labels, float]] = defaultdict(lambda: defaultdict(float))
+        self.histograms: dict[str, dict[Labels, Histogram]] = defaultdict(dict)
+        self.gauges: dict[str, Callable[[], float]] = {}
+        self.help: dict[str, str] = {}
+
+    def describe(self, name: str, text: str) -> None:
+        self.help[name] = text
+
+    def inc(self, name: str, value: float = 1, **labels: Any) -> None:
+        self.counters[name][_labels(labels)] += value
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        key = _labels(labels)
+        histogram = self.histograms[name].get(key)
+        if histogram is None:
+            histogram = self.histograms[name][key] = Histogram()
+        histogram.observe(value)
+
+    def gauge(self, name: str, callback: Callable[[], float], text: str = "") -> None:
+        self.gauges[name] = callback
+        if text:
+            self.help[name] = text
+
+    def render(self) -> str:
+        # """Текстовый формат Prometheus (text/plain; version=0.0.4)."""
+        lines: list[str] = []
+
+        for name, series in sorted(self.counters.items()):
+            self._header(lines, name, "counter")
+            for key, value in series.items():
+                lines.append(f"{name}{_fmt(key)} {value:g}")
+
+        for name, series in sorted(self.histograms.items()):
+            self._header(lines, name, "histogram")
+            for key, h in series.items():
+                for bound, count in zip(DURATION_BUCKETS, h.buckets):
+                    lines.append(f"{name}_bucket{_fmt(key + (('le', f'{bound:g}'),))} {count}")
+                lines.append(f"{name}_bucket{_fmt(key + (('le', '+Inf'),))} {h.count}")
+                lines.append(f"{name}_sum{_fmt(key)} {h.sum:.6f}")
+                lines.append(f"{name}_count{_fmt(key)} {h.count}")
+
+        for name, callback in sorted(self.gauges.items()):
+            self._header(lines, name, "gauge")
+            try:
+                lines.append(f"{name} {float(callback()):g}")
+            except Exception:
+                continue
+
+        return "\n".join(lines) + "\n"
+
+    def top(self, name: str, limit: int = 10) -> list[tuple[str, Histogram]]:
+        # """Серии гистограммы, отсортированные по суммарному времени (для /stats_perf)."""
+        series = [
+            (",".join(v for _, v in key) or "-", h)
+            for key, h in self.histograms.get(name, {}).items()
+        ]
+        series.sort(key=lambda item: item[1].sum, reverse=True)
+        return series[:limit]
+
+    def _header(self, lines: list[str], name: str, kind: str) -> None:
+        if name in self.help:
+            lines.append(f"# HELP {name} {self.help[name]}")
+        lines.append(f"# TYPE {name} {kind}")
+
+
+def _labels(labels: dict[str, Any]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _fmt(key: Labels) -> str:
+    if not key:
+        return ""
+    escaped = (
+        (k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in key
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+# Общий реестр процесса
+metrics = Metrics()
+metrics.describe("bot_update_duration_seconds", "Время обработки апдейта по хэндлерам")
+metrics.describe("bot_db_query_duration_seconds", "Время запросов к SQLite по функциям db.py")
+metrics.describe("bot_db_rows_total", "Строк прочитано/изменено запросами db.py")
+metrics.describe("bot_api_request_duration_seconds", "Время запросов к Bot API по методам")
+metrics.describe("bot_api_requests_total", "Запросы к Bot API по методам")
+metrics.describe("bot_api_errors_total", "Ошибки Bot API по методам и типам")
+metrics.describe("bot_db_errors_total", "Откаченные транзакции по функциям db.py")
+metrics.describe("bot_job_duration_seconds", "Время фоновых задач планировщика")
+metrics.describe("bot_job_start_lag_seconds", "Опоздание запуска задачи относительно расписания")
+metrics.describe("bot_startup_phase_seconds", "Фазы старта бота (first_update — до первого апдейта)")
+metrics.describe("bot_delivery_lag_seconds", "Задержка доставки от планового времени (расписание, /add_at)")
+metrics.describe("bot_leader_changes_total", "Переходы процесса в ведущие и обратно")
+metrics.describe("bot_wish_notices_total", "Хотелки, о которых уведомлён админ")
+metrics.describe("bot_wish_notice_requests_total", "Запросы к Bot API на уведомления о хотелках")
+metrics.describe("bot_media_archived_total", "Фото, скачанные в архив (new, duplicate, failed)")
+metrics.describe("bot_media_archive_bytes_total", "Байт записано в архив фото")
+metrics.describe("bot_media_reuploads_total", "Фото, заново загруженные из архива вместо file_id")
+
+
+# --- aiogram: апдейты ---
+
+
+class HandlerTimingMiddleware(BaseMiddleware):
+    # """
+    # Inner-middleware: узнаёт, какой хэндлер сработал, и кладёт имя
+    # в общий словарь, который завёл UpdateTimingMiddleware.
+    # """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        timing = data.get("update_timing")
+        handler_object = data.get("handler")
+        if timing is not None and handler_object is not None:
+            timing["handler"] = handler_object.callback.__name__
+            logs.bind(handler=timing["handler"])
+        return await handler(event, data)
+
+
+class UpdateTimingMiddleware(BaseMiddleware):
+    # """
+    # Outer-middleware на dp.update: меряет полное время обработки апдейта
+    # (фильтры, БД, ответы) и пишет его с меткой имени хэндлера.
+    # Заодно кладёт update_id/chat_id в контекст логов — их получат все записи апдейта.
+    # """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: dict[str, Any],
+    ) -> Any:
+        timing = {"handler": "unhandled"}
+        data["update_timing"] = timing
+        chat = data.get("event_chat")
+        token = logs.bind(update_id=event.update_id, chat_id=chat.id if chat else None)
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            return await handler(event, data)
+        except Exception:
+            status = "error"
+            logger.exception("Ошибка при обработке апдейта", extra={"handler": timing["handler"]})
+            raise
+        finally:
+            # ожидание остальных частей альбома (albums.py) — не время обработки
+            duration = time.perf_counter() - started - timing.get("waited", 0.0)
+            timing["duration"] = duration
+            metrics.observe(
+                "bot_update_duration_seconds", duration,
+                handler=timing["handler"], status=status,
+            )
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    "Апдейт обработан",
+                    extra={"handler": timing["handler"], "status": status,
+                           "duration_ms": round(duration * 1000, 3)},
+                )
+            logs.reset(token)
+
+
+def setup_update_metrics(dp) -> None:
+    # """Подключает замер апдейтов к диспетчеру (inner — для всех вложенных роутеров)."""
+    dp.update.outer_middleware(UpdateTimingMiddleware())
+    dp.message.middleware(HandlerTimingMiddleware())
+    dp.callback_query.middleware(HandlerTimingMiddleware())
+
+
+# --- aiogram: запросы к Bot API ---
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    # """Считает запросы к Bot API, их время и ошибки по методам."""
+
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            metrics.inc("bot_api_errors_total", method=name, error=type(e).__name__)
+            raise
+        finally:
+            metrics.inc("bot_api_requests_total", method=name)
+            metrics.observe(
+                "bot_api_request_duration_seconds", time.perf_counter() - started, method=name
+            )
+
+
+# --- HTTP /metrics ---
+
+
+async def metrics_handler(request: "web.Request") -> "web.Response":
+    from aiohttp import web
+
+    return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8")
+
+
+async def start_metrics_server(host: str, port: int) -> "web.AppRunner":
+    # """Отдельный aiohttp-сервер с /metrics (для режима polling)."""
+    from aiohttp import web
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+def register_gauges(send_queue, cache_stats: dict[str, Callable[[], dict[str, int]]]) -> None:
+    # """
+    # Gauge по очереди отправки и кэшам db.py.
+    # cache_stats: {"app_state": get_app_state_stats, "pairs": get_pair_cache_stats}.
+    # """
+    for key in ("depth", "in_flight", "chats_waiting", "sent", "failed", "retries", "flood_waits"):
+        metrics.gauge(f"bot_send_queue_{key}", lambda key=key: send_queue.stats()[key])
+    for key in ("latency_p50", "latency_p95", "latency_max"):
+        metrics.gauge(f"bot_send_queue_{key}_seconds", lambda key=key: send_queue.stats()[key])
+    for cache, stats in cache_stats.items():
+        for key in ("hits", "misses"):
+            metrics.gauge(f"bot_cache_{cache}_{key}", lambda stats=stats, key=key: stats()[key])
@@ -0,0 +1,477 @@
+import logging
+import sqlite3
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, NamedTuple
+
+logger = logging.getLogger(__name__)
+
+
+async def _add_column_if_missing(db, table: str, column: str, decl: str) -> None:
+    # """ALTER TABLE ... ADD COLUMN, если такой колонки ещё нет (для старых БД)."""
+    rows = await db.execute_fetchall(f"PRAGMA table_info({table})")
+    if column not in {row[1] for row in rows}:
+        await db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+async def _m001_baseline(db) -> None:
+    # """
+    # Схема, которая раньше создавалась в init_db(). Всё идемпотентно
+    # (IF NOT EXISTS, проверка колонок), поэтому на старой БД без schema_version
+    # миграция просто досоздаёт недостающее.
+    # """
+    # пары "админ — получатель": один инстанс бота обслуживает много пар
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS pairs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            admin_id INTEGER NOT NULL UNIQUE,
+            recipient_chat_id INTEGER UNIQUE,
+            invite_code TEXT UNIQUE,
+            waiting_wish INTEGER NOT NULL DEFAULT 0, -- устарело, см. fsm_states
+            wishes_feature_notified INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL
+        )
+    """)
+
+    # напоминания
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS reminders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            pair_id INTEGER REFERENCES pairs (id),
+            text TEXT,
+            photo_file_id TEXT,
+            is_active INTEGER NOT NULL DEFAULT 1
+        )
+    """)
+    await _add_column_if_missing(
+        db, "reminders", "pair_id", "INTEGER REFERENCES pairs (id)"
+    )
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_reminders_pair_id
+        ON reminders (pair_id, id)
+    """)
+
+    # разовые напоминания на конкретное время (/add_at): send_at в UTC.
+    # В колоду они не попадают, их забирает DueReminderLoop по этому индексу
+    await _add_column_if_missing(db, "reminders", "send_at", "TEXT")
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_reminders_send_at
+        ON reminders (send_at) WHERE send_at IS NOT NULL AND is_active = 1
+    """)
+
+    # "колода" активных напоминаний: случайный sort_key задаёт порядок,
+    # следующее напоминание пары — строка с минимальным ключом (по индексу)
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS reminder_deck (
+            reminder_id INTEGER PRIMARY KEY,
+            pair_id INTEGER,
+            sort_key INTEGER NOT NULL
+        )
+    """)
+    await _add_column_if_missing(db, "reminder_deck", "pair_id", "INTEGER")
+    await db.execute("DROP INDEX IF EXISTS idx_reminder_deck_sort_key")
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_reminder_deck_pair_sort_key
+        ON reminder_deck (pair_id, sort_key)
+    """)
+
+    # активные напоминания, которых ещё нет в колоде (старая БД)
+    await db.execute("""
+        INSERT OR IGNORE INTO reminder_deck (reminder_id, pair_id, sort_key)
+        SELECT id, pair_id, RANDOM() FROM reminders
+        WHERE is_active = 1 AND send_at IS NULL
+    """)
+
+    # служебные значения (флаги и т.п.)
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS app_state (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+    """)
+
+    # состояния FSM aiogram (SQLiteStorage): ключ — строка из DefaultKeyBuilder
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS fsm_states (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data TEXT NOT NULL DEFAULT '{}'
+        )
+    """)
+
+    # НОВОЕ: таблица хотелок
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS wishes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            pair_id INTEGER REFERENCES pairs (id),
+            user_id INTEGER NOT NULL,
+            text TEXT,
+            photo_file_id TEXT,
+            status TEXT NOT NULL DEFAULT 'new', -- new / planned / done / rejected
+            created_at TEXT NOT NULL
+        )
+    """)
+    await _add_column_if_missing(
+        db, "wishes", "pair_id", "INTEGER REFERENCES pairs (id)"
+    )
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_wishes_pair_id
+        ON wishes (pair_id, id)
+    """)
+
+    # outbox доставок: выбор напоминания и постановка в outbox — одна транзакция,
+    # отправляет фоновый воркер, message_id/sent_at — квитанция о доставке
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            pair_id INTEGER NOT NULL,
+            chat_id INTEGER NOT NULL,
+            reminder_id INTEGER,
+            text TEXT,
+            photo_file_id TEXT,
+            status TEXT NOT NULL DEFAULT 'pending', -- pending / sending / sent / failed
+            attempts INTEGER NOT NULL DEFAULT 0,
+            available_at TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            sent_at TEXT,
+            message_id INTEGER,
+            last_error TEXT,
+            scheduled_at TEXT -- плановое время (расписание, /add_at) для замера задержки
+        )
+    """)
+    await _add_column_if_missing(db, "outbox", "scheduled_at", "TEXT")
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_outbox_pending
+        ON outbox (available_at) WHERE status = 'pending'
+    """)
+
+    # расписания рассылки: у пары может быть несколько (время + дни недели + таймзона).
+    # next_fire_at (UTC) — следующий запуск; переживает рестарт, поэтому
+    # пропущенный, пока бот был выключен, запуск видно сразу при старте
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS schedules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            pair_id INTEGER NOT NULL REFERENCES pairs (id),
+            time_of_day TEXT NOT NULL, -- HH:MM по местному времени
+            days INTEGER NOT NULL DEFAULT 127, -- битовая маска, пн = 1, вс = 64
+            tz TEXT NOT NULL,
+            next_fire_at TEXT NOT NULL
+        )
+    """)
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_schedules_pair_id
+        ON schedules (pair_id)
+    """)
+
+    # одна строка на пару и слот расписания: напоминание не уйдёт дважды,
+    # sent_at - scheduled_at = фактическая задержка доставки
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS delivery_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            pair_id INTEGER NOT NULL,
+            run_date TEXT NOT NULL, -- слот по местному времени, YYYY-MM-DDTHH:MM
+            scheduled_at TEXT NOT NULL,
+            enqueued_at TEXT NOT NULL,
+            outbox_id INTEGER,
+            reminder_id INTEGER,
+            sent_at TEXT,
+            lag_seconds REAL,
+            UNIQUE (pair_id, run_date)
+        )
+    """)
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_delivery_log_outbox_id
+        ON delivery_log (outbox_id) WHERE outbox_id IS NOT NULL
+    """)
+
+    await _init_search(db)
+
+
+async def _init_search(db) -> None:
+    # """
+    # Полнотекстовый индекс FTS5 по напоминаниям и хотелкам (одна таблица,
+    # чтобы ранжировать результаты вместе). rowid = id * 2 для напоминаний
+    # и id * 2 + 1 для хотелок — так триггеры обновляют строку по rowid,
+    # без сканирования индекса. Если таблицы ещё не было — заполняем её
+    # из существующих строк.
+    # """
+    rows = await db.execute_fetchall(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search_fts'"
+    )
+    created = not rows
+
+    await db.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5 (
+            pair_id UNINDEXED,
+            text,
+            tokenize = 'unicode61 remove_diacritics 2'
+        )
+    """)
+
+    for table, offset in (("reminders", 0), ("wishes", 1)):
+        rowid_new = f"new.id * 2 + {offset}"
+        rowid_old = f"old.id * 2 + {offset}"
+        await db.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_search_insert
+            AFTER INSERT ON {table} WHEN new.text IS NOT NULL
+            BEGIN
+                INSERT INTO search_fts (rowid, pair_id, text)
+                VALUES ({rowid_new}, new.pair_id, new.text);
+            END
+        """)
+        await db.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_search_update
+            AFTER UPDATE OF text, pair_id ON {table}
+            BEGIN
+                DELETE FROM search_fts WHERE rowid = {rowid_old};
+                INSERT INTO search_fts (rowid, pair_id, text)
+                SELECT {rowid_new}, new.pair_id, new.text WHERE new.text IS NOT NULL;
+            END
+        """)
+        await db.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_search_delete
+            AFTER DELETE ON {table}
+            BEGIN
+                DELETE FROM search_fts WHERE rowid = {rowid_old};
+            END
+        """)
+
+        if created:
+            await db.execute(f"""
+                INSERT INTO search_fts (rowid, pair_id, text)
+                SELECT id * 2 + {offset}, pair_id, text FROM {table}
+                WHERE text IS NOT NULL
+            """)
+
+
+async def _m002_filter_indexes(db) -> None:
+    # """
+    # Индексы под фильтры и сортировки: активные напоминания пары,
+    # хотелки пары по статусу и по дате создания.
+    # """
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_reminders_pair_active
+        ON reminders (pair_id, is_active)
+    """)
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_wishes_pair_status
+        ON wishes (pair_id, status, id)
+    """)
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_wishes_pair_created_at
+        ON wishes (pair_id, created_at)
+    """)
+
+
+async def _m003_wish_counters(db) -> None:
+    # """
+    # Счётчики хотелок пары по статусам. Их ведут триггеры на wishes, то есть
+    # в той же транзакции, что и сама вставка/смена статуса/удаление, —
+    # /wishes_stats читает несколько строк вместо подсчёта по всей таблице.
+    # """
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS wish_counters (
+            pair_id INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (pair_id, status)
+        ) WITHOUT ROWID
+    """)
+
+    increment = """
+        INSERT INTO wish_counters (pair_id, status, count)
+        SELECT new.pair_id, new.status, 1 WHERE new.pair_id IS NOT NULL
+        ON CONFLICT (pair_id, status) DO UPDATE SET count = count + 1;
+    """
+    decrement = """
+        UPDATE wish_counters SET count = count - 1
+        WHERE pair_id = old.pair_id AND status = old.status;
+    """
+    await db.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS wishes_counter_insert
+        AFTER INSERT ON wishes
+        BEGIN {increment} END
+    """)
+    await db.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS wishes_counter_update
+        AFTER UPDATE OF status, pair_id ON wishes
+        WHEN old.status IS NOT new.status OR old.pair_id IS NOT new.pair_id
+        BEGIN {decrement} {increment} END
+    """)
+    await db.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS wishes_counter_delete
+        AFTER DELETE ON wishes
+        BEGIN {decrement} END
+    """)
+
+    # существующие хотелки
+    await db.execute("DELETE FROM wish_counters")
+    await db.execute("""
+        INSERT INTO wish_counters (pair_id, status, count)
+        SELECT pair_id, status, COUNT(*) FROM wishes
+        WHERE pair_id IS NOT NULL
+        GROUP BY pair_id, status
+    """)
+
+
+async def _m004_leases(db) -> None:
+    # """
+    # Аренды (lease) для выбора ведущего среди нескольких процессов бота:
+    # одна строка на имя, holder — кто держит, expires_at — до какого момента
+    # (UTC, ISO). Продлевает только держатель, забрать можно только истёкшую.
+    # """
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS leases (
+            name TEXT PRIMARY KEY,
+            holder TEXT NOT NULL,
+            acquired_at TEXT NOT NULL,
+            renewed_at TEXT NOT NULL,
+            expires_at TEXT NOT NULL
+        ) WITHOUT ROWID
+    """)
+
+
+async def _m005_media(db) -> None:
+    # """
+    # Альбомы: все фото напоминания или хотелки, присланные одной медиагруппой.
+    # owner — 'reminder' или 'wish', position — порядок в альбоме.
+    # В photo_file_id родителя остаётся первое фото, так что старый код,
+    # экспорт и списки работают как раньше. Строки удаляются вместе с родителем.
+    # """
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS media (
+            owner TEXT NOT NULL,
+            owner_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            file_id TEXT NOT NULL,
+            PRIMARY KEY (owner, owner_id, position)
+        ) WITHOUT ROWID
+    """)
+    for owner, table in (("reminder", "reminders"), ("wish", "wishes")):
+        await db.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_media_delete
+            AFTER DELETE ON {table} BEGIN
+                DELETE FROM media WHERE owner = '{owner}' AND owner_id = old.id;
+            END
+        """)
+
+
+async def _m006_photo_archive(db) -> None:
+    # """
+    # Локальный архив фото: file_id -> SHA-256 содержимого (файл лежит
+    # в MEDIA_ARCHIVE_DIR по хэшу). Строку с sha256 = NULL ставят триггеры
+    # на каждое новое фото напоминания, хотелки или альбома — это очередь
+    # для MediaArchive. next_try_at: '' — скачать сразу, время — повтор
+    # после ошибки, NULL — попытки кончились.
+    # """
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS photo_archive (
+            file_id TEXT PRIMARY KEY,
+            sha256 TEXT,
+            size INTEGER,
+            archived_at TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_try_at TEXT DEFAULT '',
+            last_error TEXT
+        ) WITHOUT ROWID
+    """)
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_photo_archive_pending
+        ON photo_archive (next_try_at) WHERE sha256 IS NULL AND next_try_at IS NOT NULL
+    """)
+
+    for table, column in (("reminders", "photo_file_id"), ("wishes", "photo_file_id"),
+                          ("media", "file_id")):
+        await db.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_photo_archive
+            AFTER INSERT ON {table} WHEN new.{column} IS NOT NULL BEGIN
+                INSERT OR IGNORE INTO photo_archive (file_id) VALUES (new.{column});
+            END
+        """)
+        # фото, сохранённые до архива
+        await db.execute(f"""
+            INSERT OR IGNORE INTO photo_archive (file_id)
+            SELECT DISTINCT {column} FROM {table} WHERE {column} IS NOT NULL
+        """)
+
+
+# Миграции схемы по порядку: (версия, название, функция).
+# Новые — только в конец; уже применённые на проде не меняем
+MIGRATIONS: list[tuple[int, str, Callable[..., Awaitable[None]]]] = [
+    (1, "baseline", _m001_baseline),
+    (2, "filter_indexes", _m002_filter_indexes),
+    (3, "wish_counters", _m003_wish_counters),
+    (4, "leases", _m004_leases),
+    (5, "media", _m005_media),
+    (6, "photo_archive", _m006_photo_archive),
+]
+
+
+class AppliedMigration(NamedTuple):
+    version: int
+    name: str
+    duration_ms: float
+
+
+async def run_migrations(db) -> list[AppliedMigration]:
+    # """
+    # Применяет миграции новее версии из schema_version — все в одной транзакции:
+    # либо БД переходит на последнюю версию целиком, либо остаётся как была.
+    # BEGIN IMMEDIATE сразу берёт блокировку записи, так что второй процесс,
+    # стартующий одновременно, дождётся и увидит уже обновлённую версию.
+    # Пишет в лог, какие миграции применены и сколько заняла каждая.
+    # """
+    started = time.perf_counter()
+    applied: list[AppliedMigration] = []
+    latest = MIGRATIONS[-1][0]
+
+    # обычный рестарт: схема уже свежая — хватает одного чтения, без блокировки записи
+    try:
+        rows = await db.execute_fetchall("SELECT MAX(version) FROM schema_version")
+    except sqlite3.OperationalError:
+        rows = None  # новая БД или старая, без schema_version
+    if rows and rows[0][0] == latest:
+        logger.debug("Схема БД актуальна", extra={"schema_version": latest})
+        return applied
+
+    await db.execute("BEGIN IMMEDIATE")
+    try:
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TEXT NOT NULL,
+                duration_ms REAL NOT NULL
+            )
+        """)
+        rows = await db.execute_fetchall("SELECT MAX(version) FROM schema_version")
+        current = rows[0][0] or 0
+
+        for version, name, migrate in MIGRATIONS:
+            if version <= current:
+                continue
+            migration_started = time.perf_counter()
+            await migrate(db)
+            duration_ms = round((time.perf_counter() - migration_started) * 1000, 1)
+            await db.execute(
+                """
+                INSERT INTO schema_version (version, name, applied_at, duration_ms)
+                VALUES (?, ?, ?, ?)
+                """,
+                (version, name, datetime.utcnow().isoformat(), duration_ms)
+            )
+            applied.append(AppliedMigration(version, name, duration_ms))
+    except Exception:
+        await db.rollback()
+        raise
+    await db.commit()
+
+    logger.info(
+        "Схема БД готова",
+        extra={
+            "schema_version": applied[-1].version if applied else current,
+            "applied": [f"{m.version:03d}_{m.name} {m.duration_ms} мс" for m in applied],
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+        },
+    )
+    return applied
@@ -0,0 +1,221 @@
+import asyncio
+import logging
+import random
+
+from aiogram.exceptions import (
+    TelegramAPIError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+from aiogram.methods import SendMediaGroup
+from aiogram.types import FSInputFile, InputMediaPhoto, Message
+
+from albums import MEDIA_GROUP_LIMIT
+from archive import MediaArchive, is_file_id_error
+from db import (
+    claim_outbox_batch,
+    mark_outbox_sent,
+    mark_outbox_failed,
+    requeue_stale_outbox,
+)
+from metrics import metrics
+from sender import SendQueue
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxWorker:
+    # """
+    # Фоновый воркер, который разбирает таблицу outbox.
+
+    # Планировщик и хэндлеры только пишут в outbox (в той же транзакции,
+    # где выбирают напоминание) и зовут wake(). Воркер забирает пачки
+    # pending -> sending, отправляет через SendQueue и пишет квитанцию
+    # (message_id, sent_at). Временные ошибки возвращают доставку в pending
+    # с задержкой (экспоненциальной, до max_retry_delay, со случайным разбросом),
+    # после max_attempts — failed, а напоминание — обратно в колоду.
+    # Если Telegram не принял file_id фото, а в archive есть копия, фото
+    # уходит заново файлом, и дальше используется уже новый file_id.
+    # """
+
+    def __init__(
+        self,
+        send_queue: SendQueue,
+        batch_size: int = 50,
+        max_attempts: int = 5,
+        retry_delay: float = 60,
+        idle_interval: float = 30,
+        archive: MediaArchive | None = None,
+        max_retry_delay: float = 3600,
+    ):
+        self.send_queue = send_queue
+        self.archive = archive
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.idle_interval = idle_interval
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        requeued = await requeue_stale_outbox()
+        if requeued:
+            logger.info("Вернул в очередь незавершённые доставки", extra={"requeued": requeued})
+        self._task = asyncio.create_task(self._run(), name="outbox-worker")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    def wake(self) -> None:
+        # """Сообщает воркеру, что в outbox появились новые доставки."""
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                processed = await self.drain_once()
+            except Exception:
+                logger.exception("Ошибка при разборе outbox")
+                processed = 0
+
+            if processed:
+                continue
+            # call_later вместо wait_for: в Python 3.11 wait_for может проглотить
+            # отмену, если событие сработало одновременно с stop()
+            timer = asyncio.get_running_loop().call_later(self.idle_interval, self._wakeup.set)
+            try:
+                await self._wakeup.wait()
+            finally:
+                timer.cancel()
+
+    async def drain_once(self) -> int:
+        # """Забирает и отправляет одну пачку. Возвращает её размер."""
+        batch = await claim_outbox_batch(self.batch_size)
+        if batch:
+            await asyncio.gather(*(self._deliver(*row) for row in batch))
+        return len(batch)
+
+    async def _deliver(
+        self,
+        outbox_id: int,
+        chat_id: int,
+        text: str | None,
+        photo_file_id: str | None,
+        attempts: int,
+        media: tuple[str, ...] = (),
+    ) -> None:
+        try:
+            try:
+                sent = await self._send(chat_id, text, photo_file_id, media)
+            except TelegramAPIError as e:
+                if self.archive is None or not photo_file_id or not is_file_id_error(e):
+                    raise
+                sent = await self._resend_from_archive(chat_id, text, photo_file_id, media, e)
+        except (TelegramRetryAfter, TelegramNetworkError, TelegramServerError) as e:
+            retry_in = self._retry_in(attempts, e)
+            logger.warning(
+                "Доставка не удалась",
+                extra={"outbox_id": outbox_id, "chat_id": chat_id, "attempts": attempts,
+                       "retry_in": retry_in, "error": str(e)},
+            )
+            await mark_outbox_failed(outbox_id, str(e), retry_in)
+            return
+        except TelegramAPIError as e:
+            # 400/403 — повтор не поможет (например, бот заблокирован)
+            logger.warning(
+                "Доставка отклонена Telegram",
+                extra={"outbox_id": outbox_id, "chat_id": chat_id, "error": str(e)},
+            )
+            await mark_outbox_failed(outbox_id, str(e), None)
+            return
+        except Exception as e:
+            # не Telegram: ошибка БД, битый альбом, архив не прочитался (OSError) —
+            # без этого строка осталась бы в 'sending' до перезапуска
+            retry_in = self._retry_in(attempts, e)
+            logger.exception(
+                "Ошибка при доставке",
+                extra={"outbox_id": outbox_id, "chat_id": chat_id, "attempts": attempts,
+                       "retry_in": retry_in},
+            )
+            await mark_outbox_failed(outbox_id, f"{type(e).__name__}: {e}", retry_in)
+            return
+
+        lag = await mark_outbox_sent(outbox_id, sent[0].message_id)
+        if lag is not None:
+            # плановая рассылка: задержка от времени по расписанию до доставки
+            metrics.observe("bot_delivery_lag_seconds", lag)
+
+    def _retry_in(self, attempts: int, error: Exception) -> float | None:
+        # """
+        # Через сколько секунд повторить доставку; None — попытки кончились.
+        # Экспонента от retry_delay до max_retry_delay; разброс 50–100%, чтобы
+        # после сбоя Telegram доставки не возвращались одной волной.
+        # RetryAfter (флуд-контроль) — не раньше, чем просит Telegram.
+        # """
+        if attempts >= self.max_attempts:
+            return None
+        delay = min(self.max_retry_delay, self.retry_delay * 2 ** (attempts - 1))
+        delay *= random.uniform(0.5, 1.0)
+        if isinstance(error, TelegramRetryAfter):
+            delay = max(delay, float(error.retry_after))
+        return delay
+
+    async def _send(
+        self,
+        chat_id: int,
+        text: str | None,
+        photo_file_id: str | None,
+        media: tuple[str, ...],
+        files: dict[str, FSInputFile] | None = None,
+    ) -> list[Message]:
+        # """Отправляет доставку; files — замена file_id на файлы из архива."""
+        files = files or {}
+        if len(media) > 1:
+            # альбом: текст — подписью к первому фото, квитанция — по первому сообщению
+            return await self.send_queue.enqueue(SendMediaGroup(
+                chat_id=chat_id,
+                media=[
+                    InputMediaPhoto(
+                        media=files.get(file_id, file_id),
+                        caption=(text or None) if i == 0 else None,
+                    )
+                    for i, file_id in enumerate(media[:MEDIA_GROUP_LIMIT])
+                ],
+            ))
+        if photo_file_id:
+            return [await self.send_queue.send_photo(
+                chat_id=chat_id,
+                photo=files.get(photo_file_id, photo_file_id),
+                caption=text or None,
+            )]
+        return [await self.send_queue.send_message(chat_id=chat_id, text=text or "❤️")]
+
+    async def _resend_from_archive(
+        self,
+        chat_id: int,
+        text: str | None,
+        photo_file_id: str,
+        media: tuple[str, ...],
+        error: TelegramAPIError,
+    ) -> list[Message]:
+        file_ids = list(media[:MEDIA_GROUP_LIMIT]) if len(media) > 1 else [photo_file_id]
+        files = await self.archive.input_files(file_ids)
+        if not files:
+            raise error
+        logger.info(
+            "file_id не принят, отправляю фото из архива",
+            extra={"chat_id": chat_id, "files": len(files), "error": str(error)},
+        )
+        messages = await self._send(chat_id, text, photo_file_id, media, files)
+        metrics.inc("bot_media_reuploads_total", len(files))
+        for file_id, message in zip(file_ids, messages):
+            if file_id in files:
+                await self.archive.remember_upload(file_id, message)
+        return messages
@@ -0,0 +1,416 @@
+import asyncio
+import heapq
+import logging
+import re
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytz
+
+from db import (
+    Schedule,
+    list_schedules,
+    list_unscheduled_pair_ids,
+    add_schedule,
+    delete_schedule,
+    fire_schedules,
+    next_due_at,
+    enqueue_due_reminders,
+)
+from metrics import metrics
+from outbox import OutboxWorker
+
+logger = logging.getLogger(__name__)
+
+# Все дни недели (битовая маска: пн = 1, вт = 2, ..., вс = 64)
+EVERY_DAY = 0b1111111
+
+_DAY_NAMES = ["пн", "вт", "ср", "чт", "пт", "сб", "вс"]
+_DAY_ALIASES = {
+    **{name: i for i, name in enumerate(_DAY_NAMES)},
+    **{name: i for i, name in enumerate(["mon", "tue", "wed", "thu", "fri", "sat", "sun"])},
+}
+
+# Таймер не спит дольше этого (с): если системные часы перевели, мы это заметим
+MAX_SLEEP = 60
+
+
+def parse_time(value: str) -> str | None:
+    # """'9:05' -> '09:05'; None, если это не время."""
+    match = re.fullmatch(r"(\d{1,2})[:.](\d{2})", value.strip())
+    if not match:
+        return None
+    hour, minute = int(match.group(1)), int(match.group(2))
+    if hour > 23 or minute > 59:
+        return None
+    return f"{hour:02d}:{minute:02d}"
+
+
+def parse_days(value: str) -> int | None:
+    # """
+    # Дни недели в битовую маску: "пн-пт", "сб,вс", "mon,wed", "1-5", "*".
+    # None — не разобрали.
+    # """
+    value = value.strip().lower()
+    if value in ("*", "daily", "ежедневно", "каждый"):
+        return EVERY_DAY
+
+    def day_index(token: str) -> int | None:
+        if token.isdigit() and 1 <= int(token) <= 7:
+            return int(token) - 1
+        return _DAY_ALIASES.get(token)
+
+    mask = 0
+    for part in value.split(","):
+        bounds = [day_index(t.strip()) for t in part.split("-")]
+        if not bounds or len(bounds) > 2 or None in bounds:
+            return None
+        start, end = bounds[0], bounds[-1]
+        day = start
+        while True:
+            mask |= 1 << day
+            if day == end:
+                break
+            day = (day + 1) % 7
+    return mask or None
+
+
+def format_days(mask: int) -> str:
+    if mask == EVERY_DAY:
+        return "каждый день"
+    return ",".join(name for i, name in enumerate(_DAY_NAMES) if mask & (1 << i))
+
+
+def next_fire_time(time_of_day: str, days: int, tz: str, after: datetime) -> datetime:
+    # """
+    # Ближайший момент после after (aware), когда по местному времени tz
+    # наступает time_of_day в один из дней days. Возвращает aware-время в UTC.
+    # """
+    zone = pytz.timezone(tz)
+    hour, minute = map(int, time_of_day.split(":"))
+    day = after.astimezone(zone).date()
+    for _ in range(8):
+        if days & (1 << day.weekday()):
+            fire = zone.localize(datetime(day.year, day.month, day.day, hour, minute))
+            if fire > after:
+                return fire.astimezone(timezone.utc)
+        day += timedelta(days=1)
+    raise ValueError("в расписании не выбран ни один день недели")
+
+
+def last_fire_time(
+    time_of_day: str, days: int, tz: str, since: datetime, now: datetime
+) -> datetime:
+    # """
+    # Последний слот расписания в промежутке [since, now]; since — сам слот
+    # (next_fire_at). После долгого простоя это самый свежий пропущенный запуск,
+    # а не самый старый. Дальше недели назад не смотрим — там слотов всё равно нет.
+    # """
+    slot = since
+    if now - slot > timedelta(days=8):
+        candidate = next_fire_time(time_of_day, days, tz, now - timedelta(days=8))
+        if candidate <= now:
+            slot = candidate
+    while (following := next_fire_time(time_of_day, days, tz, slot)) <= now:
+        slot = following
+    return slot
+
+
+def parse_local_datetime(value: str, tz: str, now: datetime) -> datetime | None:
+    # """
+    # Дата и время по местному времени tz в aware UTC. Понимает
+    # "2026-10-20 18:30", "20.10.2026 18:30", "20.10 18:30" и просто "18:30"
+    # (сегодня, а если уже прошло — завтра). None — не разобрали.
+    # """
+    zone = pytz.timezone(tz)
+    local_now = now.astimezone(zone)
+    value = " ".join(value.split())
+
+    time_only = parse_time(value)
+    if time_only is not None:
+        hour, minute = map(int, time_only.split(":"))
+        day = local_now.date()
+        if (hour, minute) <= (local_now.hour, local_now.minute):
+            day += timedelta(days=1)
+        naive = datetime(day.year, day.month, day.day, hour, minute)
+    else:
+        naive = None
+        for fmt in ("%Y-%m-%d %H:%M", "%d.%m.%Y %H:%M"):
+            try:
+                naive = datetime.strptime(value, fmt)
+                break
+            except ValueError:
+                continue
+        if naive is None:
+            try:
+                # без года: ближайшее такое число (в этом году или в следующем)
+                parsed = datetime.strptime(f"{value} {local_now.year}", "%d.%m %H:%M %Y")
+            except ValueError:
+                return None
+            naive = parsed
+            if zone.localize(naive) <= local_now:
+                try:
+                    naive = naive.replace(year=naive.year + 1)
+                except ValueError:  # 29.02
+                    return None
+
+    return zone.localize(naive).astimezone(timezone.utc)
+
+
+async def pair_timezone(pair_id: int, default: str) -> str:
+    # """Таймзона пары — как у её первого расписания, иначе default."""
+    schedules = await list_schedules(pair_id)
+    return schedules[0].tz if schedules else default
+
+
+def _to_utc(value: str) -> datetime:
+    return datetime.fromisoformat(value).replace(tzinfo=timezone.utc)
+
+
+def _to_db(value: datetime) -> str:
+    return value.astimezone(timezone.utc).replace(tzinfo=None).isoformat()
+
+
+class ReminderScheduler:
+    # """
+    # Один таймер на все расписания.
+
+    # Держит min-heap (время запуска, id расписания), спит до ближайшего
+    # запуска и разбирает всё, что наступило, пачками по batch_size:
+    # одна транзакция ставит напоминания в outbox и сдвигает next_fire_at.
+    # Изменение расписания — просто новый элемент кучи (O(log n)); старый
+    # элемент остаётся в куче и отбрасывается при извлечении.
+
+    # Запуск, пропущенный пока бот был выключен, выполняется при старте,
+    # если опоздание не больше grace; иначе слот пропускается. После простоя
+    # в несколько дней выполняется только последний пропущенный слот.
+    # Паре с получателем, у которой нет ни одного расписания, выдаётся
+    # расписание по умолчанию: default_time каждый день в default_tz.
+
+    # resync_interval > 0 — раз в столько секунд куча перечитывается из БД:
+    # когда процессов бота несколько, расписания меняют и те, где таймер
+    # не запущен (см. leader.py).
+    # """
+
+    def __init__(
+        self,
+        outbox: OutboxWorker,
+        batch_size: int = 500,
+        grace: timedelta = timedelta(hours=6),
+        default_time: str = "11:00",
+        default_tz: str = "Europe/Helsinki",
+        resync_interval: float = 0,
+    ):
+        self.outbox = outbox
+        self.batch_size = batch_size
+        self.grace = grace
+        self.default_time = default_time
+        self.default_tz = default_tz
+        self.resync_interval = resync_interval
+        self._synced_at = 0.0
+        self._heap: list[tuple[float, int]] = []
+        self._schedules: dict[int, tuple[float, Schedule]] = {}
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    # --- публичное API ---
+
+    async def start(self) -> None:
+        await self.reload()
+        for pair_id in await list_unscheduled_pair_ids():
+            await self.add_default(pair_id)
+        self._task = asyncio.create_task(self._run(), name="reminder-scheduler")
+        logger.info("Планировщик запущен", extra={"schedules": len(self._schedules)})
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def reload(self) -> None:
+        # """Заново строит кучу по таблице schedules."""
+        # чистим до чтения: start() может идти в фоне, пока хэндлеры уже
+        # вызывают add(), — такие расписания либо попадут в выборку, либо
+        # лягут в кучу уже после очистки
+        self._heap.clear()
+        self._schedules.clear()
+        for schedule in await list_schedules():
+            if schedule.id not in self._schedules:
+                self._push(schedule)
+        self._synced_at = time.monotonic()
+
+    async def add(self, pair_id: int, time_of_day: str, days: int, tz: str) -> Schedule:
+        # """Создаёт расписание пары и сразу ставит его в таймер."""
+        next_fire = next_fire_time(time_of_day, days, tz, datetime.now(timezone.utc))
+        schedule = await add_schedule(pair_id, time_of_day, days, tz, _to_db(next_fire))
+        self._push(schedule)
+        return schedule
+
+    async def add_default(self, pair_id: int) -> Schedule | None:
+        # """Выдаёт паре расписание по умолчанию, если у неё ещё нет ни одного."""
+        if await list_schedules(pair_id):
+            return None
+        return await self.add(pair_id, self.default_time, EVERY_DAY, self.default_tz)
+
+    async def delete(self, pair_id: int, schedule_id: int) -> bool:
+        if not await delete_schedule(pair_id, schedule_id):
+            return False
+        # элемент в куче останется, но без записи в _schedules будет пропущен
+        self._schedules.pop(schedule_id, None)
+        return True
+
+    def __len__(self) -> int:
+        return len(self._schedules)
+
+    # --- внутренности ---
+
+    def _push(self, schedule: Schedule, at: float | None = None) -> None:
+        fire_ts = at if at is not None else _to_utc(schedule.next_fire_at).timestamp()
+        self._schedules[schedule.id] = (fire_ts, schedule)
+        heapq.heappush(self._heap, (fire_ts, schedule.id))
+        if self._heap[0][1] == schedule.id:
+            # новый самый ранний запуск — будим таймер, чтобы он пересчитал сон
+            self._wakeup.set()
+
+    def _pop_due(self, now: float) -> list[Schedule]:
+        batch = []
+        while self._heap and self._heap[0][0] <= now and len(batch) < self.batch_size:
+            fire_ts, schedule_id = heapq.heappop(self._heap)
+            entry = self._schedules.get(schedule_id)
+            if entry is None or entry[0] != fire_ts:
+                continue  # расписание удалили или перенесли
+            batch.append(entry[1])
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            if self.resync_interval and time.monotonic() - self._synced_at >= self.resync_interval:
+                try:
+                    await self.reload()
+                except Exception:
+                    logger.exception("Не удалось перечитать расписания")
+                    self._synced_at = time.monotonic()
+            now = time.time()
+            batch = self._pop_due(now)
+            if batch:
+                try:
+                    await self._fire(batch)
+                except Exception:
+                    logger.exception("Ошибка при рассылке по расписанию")
+                    # повторим эти же слоты чуть позже, next_fire_at не сдвигался
+                    for schedule in batch:
+                        if schedule.id in self._schedules:
+                            self._push(schedule, at=now + 30)
+                continue
+
+            delay = MAX_SLEEP
+            if self._heap:
+                delay = min(MAX_SLEEP, self._heap[0][0] - now)
+            # спим до ближайшего запуска или до _push() с более ранним временем
+            timer = asyncio.get_running_loop().call_later(max(delay, 0), self._wakeup.set)
+            try:
+                await self._wakeup.wait()
+            finally:
+                timer.cancel()
+
+    async def _fire(self, batch: list[Schedule]) -> None:
+        started = time.perf_counter()
+        now = datetime.now(timezone.utc)
+        items = []
+        lags = []
+        for schedule in batch:
+            fire_at = _to_utc(schedule.next_fire_at)
+            next_fire = next_fire_time(
+                schedule.time_of_day, schedule.days, schedule.tz, max(fire_at, now)
+            )
+            # после простоя next_fire_at — самый старый пропущенный слот;
+            # grace и ключ delivery_log считаем по самому свежему
+            slot = last_fire_time(
+                schedule.time_of_day, schedule.days, schedule.tz, fire_at, now
+            )
+            run = None
+            if now - slot <= self.grace:
+                local = slot.astimezone(pytz.timezone(schedule.tz))
+                run = (local.strftime("%Y-%m-%dT%H:%M"), _to_db(slot))
+                lags.append((now - slot).total_seconds())
+            items.append((schedule, _to_db(next_fire), run))
+
+        queued = await fire_schedules(items)
+        self.outbox.wake()
+
+        for schedule, next_fire_at, _ in items:
+            # delete() во время await убрал расписание из _schedules — не возвращаем его
+            if schedule.id in self._schedules:
+                self._push(schedule._replace(next_fire_at=next_fire_at))
+
+        for lag in lags:
+            metrics.observe("bot_job_start_lag_seconds", lag, job="schedule")
+        metrics.observe("bot_job_duration_seconds", time.perf_counter() - started, job="schedule")
+        logger.info(
+            "Сработали расписания",
+            extra={"schedules": len(batch), "skipped": len(batch) - len(lags), "queued": queued,
+                   "duration_ms": round((time.perf_counter() - started) * 1000, 1)},
+        )
+
+
+class DueReminderLoop:
+    # """
+    # Доставка разовых напоминаний (/add_at) к их send_at.
+
+    # Берёт из БД только наступившие строки (диапазонный запрос по частичному
+    # индексу idx_reminders_send_at), ставит их в outbox и спит до ближайшего
+    # следующего send_at (но не дольше MAX_SLEEP). Новое напоминание на более
+    # раннее время будит цикл через wake().
+    # """
+
+    def __init__(self, outbox: OutboxWorker, batch_size: int = 500):
+        self.outbox = outbox
+        self.batch_size = batch_size
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run(), name="due-reminders")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    def wake(self) -> None:
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            delay = MAX_SLEEP
+            try:
+                started = time.perf_counter()
+                taken = await enqueue_due_reminders(self.batch_size)
+                if taken:
+                    self.outbox.wake()
+                    metrics.observe(
+                        "bot_job_duration_seconds", time.perf_counter() - started, job="due"
+                    )
+                    logger.info("Разовые напоминания поставлены в очередь", extra={"taken": taken})
+                    if taken >= self.batch_size:
+                        continue  # разбираем остаток без сна
+
+                next_at = await next_due_at()
+                if next_at is not None:
+                    wait = _to_utc(next_at) - datetime.now(timezone.utc)
+                    delay = min(MAX_SLEEP, wait.total_seconds())
+            except Exception:
+                logger.exception("Ошибка при доставке разовых напоминаний")
+                delay = 30
+
+            timer = asyncio.get_running_loop().call_later(max(delay, 0), self._wakeup.set)
+            try:
+                await self._wakeup.wait()
+            finally:
+                timer.cancel()
@@ -0,0 +1,291 @@
+import asyncio
+import logging
+from collections import deque
+from time import monotonic
+from typing import Any
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramAPIError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+from aiogram.methods import SendMessage, SendPhoto, TelegramMethod
+from aiogram.types import InputFile
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    # """
+    # Простое ведро токенов: rate токенов в секунду, не больше capacity.
+    # pause() блокирует ведро целиком (например, после 429 от Telegram).
+    # """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self) -> float:
+        # """Забирает токен и возвращает 0, либо возвращает, сколько секунд подождать."""
+        now = monotonic()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(self) -> None:
+        # """Ждёт, пока появится токен, и забирает его (по очереди, FIFO)."""
+        async with self._lock:
+            while (wait := self.try_acquire()) > 0:
+                await asyncio.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        self.blocked_until = max(self.blocked_until, monotonic() + seconds)
+
+    def is_idle(self) -> bool:
+        # """True, если ведро полное и не заблокировано — его можно выбросить."""
+        now = monotonic()
+        self._refill(now)
+        return self.tokens >= self.capacity and now >= self.blocked_until
+
+
+class _Job:
+    __slots__ = ("method", "future", "enqueued_at", "attempts", "not_before")
+
+    def __init__(self, method: TelegramMethod, future: asyncio.Future):
+        self.method = method
+        self.future = future
+        self.enqueued_at = monotonic()
+        self.attempts = 0
+        self.not_before = 0.0
+
+
+def _consume_exception(future: asyncio.Future) -> None:
+    # ошибку уже залогировал воркер; не даём asyncio ругаться на "never retrieved"
+    if not future.cancelled():
+        future.exception()
+
+
+class SendQueue:
+    # """
+    # Общая очередь исходящих сообщений.
+
+    # - у каждого чата своя FIFO-очередь и своё ведро (по умолчанию 1 сообщение/с),
+    #   плюс общее ведро на весь бот (~30 сообщений/с);
+    # - чат, у которого нет токена, откладывается, а не держит воркера;
+    # - TelegramRetryAfter ставит на паузу общее ведро на retry_after секунд,
+    #   сетевые/5xx ошибки повторяются с экспоненциальной задержкой;
+    # - enqueue() возвращает Future с отправленным Message: хэндлер может
+    #   его не ждать и сразу отвечать пользователю.
+    # """
+
+    def __init__(
+        self,
+        bot: Bot,
+        workers: int = 10,
+        global_rate: float = 30,
+        per_chat_rate: float = 1,
+        max_attempts: int = 5,
+        base_backoff: float = 1.0,
+        max_backoff: float = 60.0,
+    ):
+        self.bot = bot
+        self.workers = workers
+        self.per_chat_rate = per_chat_rate
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chat_buckets: dict[int | str, TokenBucket] = {}
+        self._pending: dict[int | str, deque[_Job]] = {}
+        self._scheduled: set[int | str] = set()
+        self._ready: asyncio.Queue = asyncio.Queue()
+        self._tasks: list[asyncio.Task] = []
+
+        self.depth = 0
+        self.in_flight = 0
+        self.stats_counters = {"sent": 0, "failed": 0, "retries": 0, "flood_waits": 0}
+        self._latencies: deque[float] = deque(maxlen=1000)
+
+    # --- публичное API ---
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"send-queue-{i}")
+            for i in range(self.workers)
+        ]
+
+    async def stop(self, timeout: float = 10) -> None:
+        # """Даёт очереди дослать накопленное (не дольше timeout) и гасит воркеров."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while (self.depth or self.in_flight) and loop.time() < deadline:
+            await asyncio.sleep(0.1)
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def enqueue(self, method: TelegramMethod) -> asyncio.Future:
+        # """Ставит любой метод Bot API с chat_id в очередь, возвращает Future с результатом."""
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_consume_exception)
+
+        chat_id = method.chat_id
+        self._pending.setdefault(chat_id, deque()).append(_Job(method, future))
+        self.depth += 1
+        self._schedule(chat_id, 0)
+        return future
+
+    def send_message(self, chat_id: int | str, text: str, **kwargs: Any) -> asyncio.Future:
+        return self.enqueue(SendMessage(chat_id=chat_id, text=text, **kwargs))
+
+    def send_photo(
+        self, chat_id: int | str, photo: str | InputFile, **kwargs: Any
+    ) -> asyncio.Future:
+        return self.enqueue(SendPhoto(chat_id=chat_id, photo=photo, **kwargs))
+
+    def stats(self) -> dict[str, Any]:
+        # """Глубина очереди, счётчики и задержка от постановки до отправки (с)."""
+        latencies = sorted(self._latencies)
+
+        def percentile(p: float) -> float:
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+
+        return {
+            "depth": self.depth,
+            "in_flight": self.in_flight,
+            "chats_waiting": len(self._pending),
+            **self.stats_counters,
+            "latency_p50": percentile(0.50),
+            "latency_p95": percentile(0.95),
+            "latency_max": latencies[-1] if latencies else 0.0,
+        }
+
+    # --- внутренности ---
+
+    def _schedule(self, chat_id: int | str, delay: float) -> None:
+        # один чат стоит в _ready не больше одного раза — так сохраняется порядок
+        if chat_id in self._scheduled:
+            return
+        self._scheduled.add(chat_id)
+        if delay > 0:
+            asyncio.get_running_loop().call_later(delay, self._ready.put_nowait, chat_id)
+        else:
+            self._ready.put_nowait(chat_id)
+
+    def _chat_bucket(self, chat_id: int | str) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) > 10_000:
+                # выбрасываем вёдра чатов, которым давно ничего не слали
+                self._chat_buckets = {
+                    k: b for k, b in self._chat_buckets.items() if not b.is_idle()
+                }
+            bucket = TokenBucket(self.per_chat_rate, 1)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    async def _worker(self) -> None:
+        while True:
+            chat_id = await self._ready.get()
+            self._scheduled.discard(chat_id)
+
+            jobs = self._pending.get(chat_id)
+            if not jobs:
+                self._pending.pop(chat_id, None)
+                continue
+
+            # первая задача чата ждёт повтора после ошибки
+            wait = jobs[0].not_before - monotonic()
+            if wait > 0:
+                self._schedule(chat_id, wait)
+                continue
+
+            wait = self._chat_bucket(chat_id).try_acquire()
+            if wait > 0:
+                self._schedule(chat_id, wait)
+                continue
+
+            await self._global.acquire()
+
+            job = jobs.popleft()
+            self.depth -= 1
+            self.in_flight += 1
+            delay = 0.0
+            try:
+                delay = await self._send(job)
+            finally:
+                self.in_flight -= 1
+
+            if delay > 0:
+                # повтор — возвращаем в начало очереди чата
+                job.not_before = monotonic() + delay
+                jobs.appendleft(job)
+                self.depth += 1
+
+            if jobs:
+                self._schedule(chat_id, delay)
+            else:
+                self._pending.pop(chat_id, None)
+
+    async def _send(self, job: _Job) -> float:
+        # """Отправляет задачу; возвращает задержку перед повтором или 0."""
+        job.attempts += 1
+        try:
+            result = await self.bot(job.method)
+        except TelegramRetryAfter as e:
+            # флуд-контроль на весь бот: стопорим общее ведро
+            self.stats_counters["flood_waits"] += 1
+            self._global.pause(e.retry_after)
+            logger.warning("Flood control, пауза отправки", extra={"retry_after": e.retry_after})
+            if job.attempts < self.max_attempts:
+                self.stats_counters["retries"] += 1
+                return float(e.retry_after)
+            return self._fail(job, e)
+        except (TelegramNetworkError, TelegramServerError) as e:
+            if job.attempts < self.max_attempts:
+                self.stats_counters["retries"] += 1
+                return min(self.max_backoff, self.base_backoff * 2 ** (job.attempts - 1))
+            return self._fail(job, e)
+        except TelegramAPIError as e:
+            # 400/403 и т.п. — повторять бессмысленно
+            return self._fail(job, e)
+        except Exception as e:
+            return self._fail(job, e)
+
+        self.stats_counters["sent"] += 1
+        self._latencies.append(monotonic() - job.enqueued_at)
+        if not job.future.done():
+            job.future.set_result(result)
+        return 0.0
+
+    def _fail(self, job: _Job, error: BaseException) -> float:
+        self.stats_counters["failed"] += 1
+        logger.warning(
+            "Не удалось выполнить запрос к Bot API",
+            extra={"method": type(job.method).__name__, "chat_id": job.method.chat_id,
+                   "attempts": job.attempts, "error": str(error)},
+        )
+        if not job.future.done():
+            job.future.set_exception(error)
+        return 0.0
@@ -0,0 +1,92 @@
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Iterator
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTimer:
+    # """
+    # Замер старта по фазам: импорты, БД, бот, хэндлеры, фоновые задачи
+    # и главное — время от запуска процесса до первого обработанного апдейта.
+    # started — perf_counter() в самом начале main.py, до тяжёлых импортов.
+    # """
+
+    def __init__(self, started: float):
+        self.started = started
+        self.phases: dict[str, float] = {}
+        self.first_update: float | None = None
+
+    def mark(self, name: str, since: float) -> None:
+        duration = time.perf_counter() - since
+        self.phases[name] = duration
+        metrics.observe("bot_startup_phase_seconds", duration, phase=name)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.mark(name, started)
+
+    def background(self, name: str, coro: Awaitable[Any]) -> asyncio.Task:
+        # """Запускает некритичную работу после старта polling; время и ошибки — в лог."""
+        async def run() -> None:
+            started = time.perf_counter()
+            try:
+                await coro
+            except Exception:
+                logger.exception("Фоновая задача старта упала", extra={"phase": name})
+            finally:
+                self.mark(name, started)
+                logger.info(
+                    "Фоновая задача старта завершена",
+                    extra={"phase": name, "duration_ms": round(self.phases[name] * 1000, 1)},
+                )
+
+        return asyncio.create_task(run(), name=f"startup-{name}")
+
+    def report(self, event: str) -> None:
+        # """Пишет в лог разбивку по фазам на момент event."""
+        elapsed = time.perf_counter() - self.started
+        logger.info(
+            event,
+            extra={
+                "elapsed_ms": round(elapsed * 1000, 1),
+                "phases_ms": {name: round(d * 1000, 1) for name, d in self.phases.items()},
+            },
+        )
+
+    def middleware(self) -> "FirstUpdateMiddleware":
+        return FirstUpdateMiddleware(self)
+
+
+class FirstUpdateMiddleware(BaseMiddleware):
+    # """Outer-middleware на dp.update: один раз фиксирует время до первого апдейта."""
+
+    def __init__(self, timer: StartupTimer):
+        self.timer = timer
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        if self.timer.first_update is not None:
+            return await handler(event, data)
+
+        self.timer.first_update = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            self.timer.mark("first_update", self.timer.started)
+            self.timer.report("Первый апдейт обработан")
@@ -0,0 +1,6 @@
+from aiogram.fsm.state import State, StatesGroup
+
+
+class WishForm(StatesGroup):
+    # """Хотелка: после кнопки «Хочу» ждём от получательницы одно сообщение."""
+    waiting = State()
@@ -0,0 +1,65 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+import scheduler
+from db import Schedule
+from scheduler import EVERY_DAY, ReminderScheduler, _to_db, last_fire_time
+
+
+class _Outbox:
+    def wake(self) -> None:
+        pass
+
+
+class LastFireTimeTest(unittest.TestCase):
+    def test_same_slot_when_nothing_missed(self):
+        now = datetime(2026, 10, 18, 10, 30, tzinfo=timezone.utc)
+        slot = datetime(2026, 10, 18, 10, 0, tzinfo=timezone.utc)
+        self.assertEqual(last_fire_time("10:00", EVERY_DAY, "UTC", slot, now), slot)
+
+    def test_latest_slot_after_multi_day_downtime(self):
+        now = datetime(2026, 10, 18, 10, 30, tzinfo=timezone.utc)
+        three_days_ago = datetime(2026, 10, 15, 10, 0, tzinfo=timezone.utc)
+        self.assertEqual(
+            last_fire_time("10:00", EVERY_DAY, "UTC", three_days_ago, now),
+            datetime(2026, 10, 18, 10, 0, tzinfo=timezone.utc),
+        )
+
+    def test_long_downtime_respects_weekdays(self):
+        # только пн; сейчас вс 18.10.2026 — последний слот в пн 12.10
+        now = datetime(2026, 10, 18, 12, 0, tzinfo=timezone.utc)
+        long_ago = datetime(2026, 1, 5, 9, 0, tzinfo=timezone.utc)
+        self.assertEqual(
+            last_fire_time("09:00", 1, "UTC", long_ago, now),
+            datetime(2026, 10, 12, 9, 0, tzinfo=timezone.utc),
+        )
+
+
+class FireAfterDowntimeTest(unittest.IsolatedAsyncioTestCase):
+    async def _fire(self, slot: datetime, downtime: timedelta) -> tuple:
+        # ежедневно во время slot; next_fire_at остался с запуска downtime назад
+        schedule = Schedule(1, 1, slot.strftime("%H:%M"), EVERY_DAY, "UTC",
+                            _to_db(slot - downtime))
+        timer = ReminderScheduler(_Outbox(), grace=timedelta(hours=6))
+        fired = mock.AsyncMock(return_value=1)
+        with mock.patch.object(scheduler, "fire_schedules", fired):
+            await timer._fire([schedule])
+        [(_, next_fire_at, run)] = fired.await_args.args[0]
+        return next_fire_at, run
+
+    async def test_recent_slot_fires_after_multi_day_downtime(self):
+        slot = (datetime.now(timezone.utc) - timedelta(minutes=30)).replace(second=0, microsecond=0)
+        next_fire_at, run = await self._fire(slot, timedelta(days=3))
+        self.assertEqual(run, (slot.strftime("%Y-%m-%dT%H:%M"), _to_db(slot)))
+        self.assertEqual(next_fire_at, _to_db(slot + timedelta(days=1)))
+
+    async def test_slot_outside_grace_is_skipped(self):
+        slot = (datetime.now(timezone.utc) - timedelta(hours=7)).replace(second=0, microsecond=0)
+        next_fire_at, run = await self._fire(slot, timedelta(days=3))
+        self.assertIsNone(run)
+        self.assertEqual(next_fire_at, _to_db(slot + timedelta(days=1)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import asyncio
+import logging
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from metrics import metrics_handler
+from config import (
+    WEBHOOK_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBAPP_HOST,
+    WEBAPP_PORT,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class _RequestHandler(SimpleRequestHandler):
+    # """
+    # SimpleRequestHandler без закрытия сессии бота при остановке сервера:
+    # её закрывает main() после того, как опустеет очередь отправки.
+    # """
+
+    async def close(self) -> None:
+        pass
+
+
+async def health_handler(request: web.Request) -> web.Response:
+    # """GET /healthz — для reverse proxy и мониторинга."""
+    return web.json_response({"status": "ok"})
+
+
+def create_app(bot: Bot, dp: Dispatcher) -> web.Application:
+    # """
+    # Собирает aiohttp-приложение: POST WEBHOOK_PATH принимает апдейты,
+    # GET /healthz отвечает, что бот жив, GET /metrics — метрики Prometheus.
+    # Каждый апдейт обрабатывается в отдельной задаче, Telegram сразу получает 200.
+    # """
+    app = web.Application()
+
+    _RequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        handle_in_background=True,
+        secret_token=WEBHOOK_SECRET,
+    ).register(app, path=WEBHOOK_PATH)
+    app.router.add_get("/healthz", health_handler)
+    app.router.add_get("/metrics", metrics_handler)
+
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher) -> None:
+    # """
+    # Поднимает сервер вебхука и, если задан WEBHOOK_URL, регистрирует его в Telegram.
+    # Работает, пока задачу не отменят (Ctrl+C / остановка процесса).
+    # """
+    app = create_app(bot, dp)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, WEBAPP_HOST, WEBAPP_PORT)
+    await site.start()
+
+    if WEBHOOK_URL:
+        await bot.set_webhook(
+            url=WEBHOOK_URL + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+        logger.info(f"Вебхук зарегистрирован: {WEBHOOK_URL}{WEBHOOK_PATH}")
+
+    logger.info(f"Бот запущен (webhook) на {WEBAPP_HOST}:{WEBAPP_PORT}{WEBHOOK_PATH}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()